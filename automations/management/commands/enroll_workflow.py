@@ -0,0 +1,70 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from automations.models import Workflow
+from automations.tasks import enroll_contacts, enroll_workflow_contacts, enrollment_chunks
+from contacts.models import Segment
+
+
+class Command(BaseCommand):
+    help = 'Enroll a segment or a list of contacts in a workflow and schedule their first step'
+
+    def add_arguments(self, parser):
+        parser.add_argument('workflow_id', type=int)
+        parser.add_argument('--segment', type=int, help='Segment id')
+        parser.add_argument('--contacts', default='', help='Comma-separated contact ids')
+        parser.add_argument('--contacts-file', help='File with one contact id per line, "-" for stdin')
+        parser.add_argument('--background', action='store_true',
+                            help='Queue the enrollment as a Celery task instead of running it here')
+
+    def _contact_ids(self, options):
+        values = options['contacts'].split(',')
+        if options['contacts_file']:
+            stream = sys.stdin if options['contacts_file'] == '-' else open(options['contacts_file'])
+            try:
+                values += stream.read().split()
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+        try:
+            return [int(value) for value in values if value.strip()]
+        except ValueError as e:
+            raise CommandError(f'Invalid contact id: {e}')
+
+    def handle(self, *args, **options):
+        try:
+            workflow = Workflow.objects.get(id=options['workflow_id'], is_active=True)
+        except Workflow.DoesNotExist:
+            raise CommandError(f'No active workflow {options["workflow_id"]}')
+
+        segment = None
+        if options['segment'] is not None:
+            try:
+                segment = Segment.objects.get(id=options['segment'])
+            except Segment.DoesNotExist:
+                raise CommandError(f'No segment {options["segment"]}')
+        contact_ids = self._contact_ids(options)
+        if segment is None and not contact_ids:
+            raise CommandError('Give --segment, --contacts or --contacts-file')
+
+        if options['background']:
+            enroll_workflow_contacts.delay(
+                workflow.id, segment_id=segment.id if segment else None, contact_ids=contact_ids or None
+            )
+            self.stdout.write(self.style.SUCCESS(f'Queued enrollment in {workflow.name}'))
+            return
+
+        began = time.perf_counter()
+        enrolled = seen = 0
+        for chunk in enrollment_chunks(segment, contact_ids):
+            enrolled += enroll_contacts(workflow, chunk)
+            seen += len(chunk)
+            self.stdout.write(f'{seen} contacts processed, {enrolled} enrolled')
+
+        elapsed = time.perf_counter() - began
+        rate = enrolled / elapsed * 60 if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Enrolled {enrolled} of {seen} contacts in {workflow.name} in {elapsed:.1f}s ({rate:,.0f}/min)'
+        ))
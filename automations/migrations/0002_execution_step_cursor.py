@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-17 07:47
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def set_step_cursors(apps, schema_editor):
+    # Executions enrolled before lazy materialization have every step
+    # created up front; point their cursor past the last one
+    WorkflowExecution = apps.get_model('automations', 'WorkflowExecution')
+    WorkflowStepExecution = apps.get_model('automations', 'WorkflowStepExecution')
+    last_order = WorkflowStepExecution.objects.filter(
+        workflow_execution=OuterRef('pk')
+    ).values('workflow_execution').annotate(last=Max('step__order')).values('last')
+    WorkflowExecution.objects.filter(step_executions__isnull=False).update(step_cursor=Subquery(last_order))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('automations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workflowexecution',
+            name='step_cursor',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_step_cursors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-17 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('automations', '0002_execution_step_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workflowstepexecution',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='workflowstepexecution',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('queued', 'Queued'), ('completed', 'Completed'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='workflowstepexecution',
+            index=models.Index(fields=['status', 'scheduled_for'], name='automations_status_3aee3b_idx'),
+        ),
+    ]
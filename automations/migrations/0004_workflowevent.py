@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-17 07:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contacts', '0006_contact_import'),
+        ('automations', '0003_step_execution_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkflowEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('contact_created', 'Contact Created'), ('deal_stage_changed', 'Deal Stage Changed'), ('manual', 'Manual Trigger'), ('tag_added', 'Tag Added'), ('contact_updated', 'Contact Updated')], max_length=50)),
+                ('key', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('contact', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contacts.contact')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
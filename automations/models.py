@@ -93,6 +93,10 @@ class WorkflowExecution(models.Model):
     contact = models.ForeignKey(Contact, on_delete=models.CASCADE, related_name='workflow_executions')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
+    # Order of the last step materialized as a WorkflowStepExecution; the
+    # next enabled step is created only when that one has run
+    step_cursor = models.PositiveIntegerField(null=True, blank=True)
+    
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
@@ -108,6 +112,7 @@ class WorkflowStepExecution(models.Model):
     """Track individual step execution"""
     STATUS_CHOICES = [
         ('pending', 'Pending'),
+        ('queued', 'Queued'),
         ('completed', 'Completed'),
         ('failed', 'Failed'),
         ('skipped', 'Skipped'),
@@ -122,12 +127,36 @@ class WorkflowStepExecution(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
     scheduled_for = models.DateTimeField()
+    # While queued: when the timer may dispatch the step again if it has not run
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
     executed_at = models.DateTimeField(null=True, blank=True)
     error_message = models.TextField(blank=True)
 
     class Meta:
         ordering = ['scheduled_for']
+        indexes = [
+            # Due steps for the timer (automations/timers.py)
+            models.Index(fields=['status', 'scheduled_for']),
+        ]
 
     def __str__(self):
         return f"{self.step} - {self.status}"
 
+
+
+class WorkflowEvent(models.Model):
+    """
+    Trigger event waiting to be relayed to workflows (transactional outbox,
+    see automations/outbox.py)
+    """
+    event = models.CharField(max_length=50, choices=Workflow.TRIGGER_CHOICES)
+    contact = models.ForeignKey(Contact, on_delete=models.CASCADE, related_name='+')
+    # The tag name for tag_added, the stage id for deal_stage_changed
+    key = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.event} {self.key} - contact {self.contact_id}"
@@ -0,0 +1,81 @@
+"""
+Transactional outbox for workflow trigger events.
+
+Contact and deal saves, contact imports, bulk tagging and bulk contact
+updates record compact WorkflowEvent rows (event, contact, key) in the
+transaction that made the change: an event exists exactly when its change
+committed, and nothing goes to the broker while the request runs. Contact
+and Deal run save() and its post_save handlers in one transaction, and
+tag_contacts and update_contacts wrap their writes and events in one. Events
+no active workflow listens for (per the trigger index) are not recorded.
+
+relay_events() runs every WORKFLOW_OUTBOX_INTERVAL seconds. It claims
+events in id order with SELECT ... FOR UPDATE SKIP LOCKED, enrolls their
+contacts with one set-based enrollment per matching workflow and deletes
+the events, all in one transaction, so relays can run side by side and a
+failed batch is simply retried. While the broker is down events wait in
+the database; first steps that could not be queued are picked up by the
+step timer when their lease expires.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from .models import Workflow, WorkflowEvent
+from .triggers import matching_workflows
+
+
+def emit(event, contact_ids, key=None):
+    """
+    Record event for contacts in the current transaction, if an active
+    workflow listens for it. key is the tag name or stage id the event is
+    about.
+    """
+    contact_ids = list(contact_ids)
+    if not contact_ids or not matching_workflows(event, key):
+        return
+    key = '' if key is None else str(key)
+    WorkflowEvent.objects.bulk_create(
+        [WorkflowEvent(event=event, contact_id=contact_id, key=key) for contact_id in contact_ids],
+        batch_size=settings.WORKFLOW_OUTBOX_BATCH_SIZE
+    )
+
+
+def _index_key(event, key):
+    if not key:
+        return None
+    return int(key) if event == 'deal_stage_changed' else key
+
+
+def relay_batch(enroll, limit):
+    """
+    Relay up to limit events, oldest first; enroll(workflow, contact_ids)
+    enrolls contacts in one workflow. Returns the number of events relayed.
+    """
+    with transaction.atomic():
+        events = list(WorkflowEvent.objects.select_for_update(skip_locked=True).order_by('id').values_list(
+            'id', 'event', 'key', 'contact_id'
+        )[:limit])
+        if not events:
+            return 0
+
+        contacts_by_workflow = {}
+        for _, event, key, contact_id in events:
+            for workflow_id in matching_workflows(event, _index_key(event, key)):
+                contacts_by_workflow.setdefault(workflow_id, set()).add(contact_id)
+
+        for workflow in Workflow.objects.filter(id__in=list(contacts_by_workflow), is_active=True).order_by('id'):
+            enroll(workflow, sorted(contacts_by_workflow[workflow.id]))
+
+        WorkflowEvent.objects.filter(id__in=[event_id for event_id, _, _, _ in events]).delete()
+    return len(events)
+
+
+def relay_events(enroll):
+    """Relay every recorded event in batches of WORKFLOW_OUTBOX_BATCH_SIZE; returns the number relayed"""
+    batch_size = settings.WORKFLOW_OUTBOX_BATCH_SIZE
+    relayed = 0
+    while True:
+        count = relay_batch(enroll, batch_size)
+        relayed += count
+        if count < batch_size:
+            return relayed
@@ -0,0 +1,44 @@
+"""
+Record workflow trigger events in the outbox (automations/outbox.py) as
+contacts, tags and deals change, and keep the trigger index
+(automations/triggers.py) current as workflows change
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from contacts.models import Contact
+from contacts.signals import contacts_created, tags_added
+from deals.models import Deal
+from .models import Workflow
+from .outbox import emit
+from .triggers import invalidate_index
+
+
+@receiver(post_save, sender=Contact)
+def contact_saved(sender, instance, created, **kwargs):
+    emit('contact_created' if created else 'contact_updated', [instance.id])
+
+
+@receiver(contacts_created)
+def contacts_imported(sender, contact_ids, **kwargs):
+    emit('contact_created', contact_ids)
+
+
+@receiver(tags_added)
+def tags_added_to_contacts(sender, added, **kwargs):
+    for tag, contact_ids in added.items():
+        emit('tag_added', contact_ids, tag)
+
+
+@receiver(post_save, sender=Deal)
+def deal_saved(sender, instance, created, **kwargs):
+    loaded_stage_id = getattr(instance, 'loaded_stage_id', None)
+    if not created and loaded_stage_id is not None and instance.stage_id != loaded_stage_id:
+        emit('deal_stage_changed', [instance.contact_id], instance.stage_id)
+    instance.loaded_stage_id = instance.stage_id
+
+
+@receiver(post_save, sender=Workflow)
+@receiver(post_delete, sender=Workflow)
+def workflow_changed(sender, **kwargs):
+    invalidate_index()
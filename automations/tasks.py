@@ -1,172 +1,354 @@
 import json
 from datetime import datetime, timedelta
 from celery import shared_task
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
 from django.utils import timezone
 
 from .models import Workflow, WorkflowExecution, WorkflowStep, WorkflowStepExecution
-from contacts.models import Contact
+from .outbox import emit, relay_events
+from .timers import dispatch_due_steps, lease_expiry
+from contacts.models import Contact, Segment
+from contacts.segments import segment_contacts
+from contacts.tags import tag_contacts
+from contacts.tasks import schedule_membership_update
+from dashboard.metrics import schedule_rollup
+from dashboard.stats import invalidate_stats
 from emails.models import EmailTemplate, EmailLog
-from emails.tasks import send_email_task
+from emails.scheduler import lease_expiry as email_lease_expiry
+from emails.tasks import send_email_batch_task
+from search.tasks import schedule_indexing
+
+
+def queue_steps(step_execution_ids):
+    """
+    Queue execute_workflow_steps for step executions once the current
+    transaction commits, WORKFLOW_TIMER_BATCH_SIZE per task
+    """
+    step_execution_ids = list(step_execution_ids)
+    if not step_execution_ids:
+        return
+    batch_size = settings.WORKFLOW_TIMER_BATCH_SIZE
+
+    def enqueue():
+        for i in range(0, len(step_execution_ids), batch_size):
+            execute_workflow_steps.delay(step_execution_ids[i:i + batch_size])
+    transaction.on_commit(enqueue)
+
+
+def advance_executions(workflow, executions, after_order=None):
+    """
+    Materialize and queue the next enabled step of workflow after the step
+    with order after_order (the first step when None) for each of its
+    executions, moving their cursors. Executions with no step left are
+    completed. Returns the new WorkflowStepExecutions.
+    """
+    steps = workflow.steps.filter(is_enabled=True)
+    if after_order is not None:
+        steps = steps.filter(order__gt=after_order)
+    step = steps.order_by('order').first()
+    now = timezone.now()
+    
+    # Executions enrolled before lazy materialization already have every
+    # step up to the cursor; they finish once none of those is left
+    advancing, finished, legacy = [], [], []
+    for execution in executions:
+        if execution.step_cursor is not None and after_order is not None and after_order < execution.step_cursor:
+            if step is None or step.order <= execution.step_cursor:
+                legacy.append(execution.id)
+                continue
+        if step is None:
+            finished.append(execution.id)
+        else:
+            advancing.append(execution)
+    
+    if legacy:
+        waiting = set(WorkflowStepExecution.objects.filter(
+            workflow_execution_id__in=legacy,
+            status__in=['pending', 'queued']
+        ).values_list('workflow_execution_id', flat=True))
+        finished += [execution_id for execution_id in legacy if execution_id not in waiting]
+    
+    if finished:
+        WorkflowExecution.objects.filter(id__in=finished).update(status='completed', completed_at=now)
+    
+    if not advancing:
+        return []
+    
+    # Delays count from enrollment, as when every step was scheduled up front.
+    # Steps that are already due are queued right away; later ones wait for
+    # the timer (automations/timers.py)
+    lease_expires_at = lease_expiry(now)
+    step_executions = []
+    for execution in advancing:
+        scheduled_for = execution.started_at + timedelta(days=step.delay_days)
+        due = scheduled_for <= now
+        step_executions.append(WorkflowStepExecution(
+            workflow_execution=execution,
+            step=step,
+            status='queued' if due else 'pending',
+            scheduled_for=scheduled_for,
+            lease_expires_at=lease_expires_at if due else None
+        ))
+        execution.step_cursor = step.order
+    WorkflowStepExecution.objects.bulk_create(step_executions)
+    WorkflowExecution.objects.filter(id__in=[execution.id for execution in advancing]).update(step_cursor=step.order)
+    queue_steps(step_execution.id for step_execution in step_executions if step_execution.status == 'queued')
+    return step_executions
 
 
 @shared_task
 def trigger_workflow(workflow_id, contact_id):
     """
     Trigger a workflow for a specific contact
-    Creates workflow execution and schedules all steps
+    Creates workflow execution and schedules its first step; each step
+    schedules the next when it runs
     """
-    try:
-        workflow = Workflow.objects.get(id=workflow_id, is_active=True)
-        contact = Contact.objects.get(id=contact_id)
-        
+    workflow = Workflow.objects.get(id=workflow_id, is_active=True)
+    contact = Contact.objects.get(id=contact_id)
+    
+    with transaction.atomic():
         # Get or create workflow execution
-        execution, created = WorkflowExecution.objects.get_or_create(
+        execution, created = WorkflowExecution.objects.select_for_update().get_or_create(
             workflow=workflow,
             contact=contact,
             defaults={'status': 'pending'}
         )
         
-        if not created and execution.status != 'pending':
+        if not created and (execution.status != 'pending' or execution.step_cursor is not None):
             return f"Workflow already executed for {contact.full_name}"
         
         execution.status = 'in_progress'
-        execution.save()
-        
-        # Get all steps in order
-        steps = workflow.steps.filter(is_enabled=True).order_by('order')
-        
-        now = timezone.now()
-        for step in steps:
-            # Calculate when this step should run
-            scheduled_for = now + timedelta(days=step.delay_days)
-            
-            step_execution = WorkflowStepExecution.objects.create(
-                workflow_execution=execution,
-                step=step,
-                status='pending',
-                scheduled_for=scheduled_for
-            )
-            
-            # Queue the step execution task
-            execute_workflow_step.apply_async(
-                args=[step_execution.id],
-                eta=scheduled_for
-            )
-        
-        return f"Workflow {workflow.name} triggered for {contact.full_name}"
+        execution.save(update_fields=['status'])
+        advance_executions(workflow, [execution])
+    
+    return f"Workflow {workflow.name} triggered for {contact.full_name}"
+
+
+def enroll_contacts(workflow, contact_ids):
+    """
+    Enroll contacts in workflow with set-based writes and schedule their
+    first step. Contacts already enrolled are left alone. Returns the
+    number of executions started.
+    """
+    with transaction.atomic():
+        # The (workflow, contact) unique constraint skips existing executions
+        WorkflowExecution.objects.bulk_create(
+            [
+                WorkflowExecution(workflow=workflow, contact_id=contact_id, status='pending')
+                for contact_id in contact_ids
+            ],
+            ignore_conflicts=True
+        )
         
-    except Workflow.DoesNotExist:
-        raise
-    except Contact.DoesNotExist:
-        raise
-    except Exception as e:
-        raise
+        # Pending without a cursor means not started yet, whether inserted
+        # here or left pending by an earlier attempt
+        executions = list(WorkflowExecution.objects.select_for_update().filter(
+            workflow=workflow,
+            contact_id__in=contact_ids,
+            status='pending',
+            step_cursor__isnull=True
+        ))
+        WorkflowExecution.objects.filter(id__in=[execution.id for execution in executions]).update(status='in_progress')
+        for execution in executions:
+            execution.status = 'in_progress'
+        advance_executions(workflow, executions)
+    
+    return len(executions)
 
 
-@shared_task
-def execute_workflow_step(step_execution_id):
+def enrollment_chunks(segment=None, contact_ids=None):
     """
-    Execute a single workflow step
+    Ids of existing contacts to enroll, from a segment or a list of contact
+    ids, in id-ordered chunks of WORKFLOW_ENROLL_CHUNK_SIZE
     """
+    chunk_size = settings.WORKFLOW_ENROLL_CHUNK_SIZE
+    
+    if segment is not None:
+        segment_ids = segment_contacts(segment).order_by('id').values_list('id', flat=True)
+        cursor = 0
+        while True:
+            chunk = list(segment_ids.filter(id__gt=cursor)[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            cursor = chunk[-1]
+    
+    contact_ids = sorted(set(contact_ids or []))
+    for i in range(0, len(contact_ids), chunk_size):
+        chunk = list(Contact.objects.filter(
+            id__in=contact_ids[i:i + chunk_size]
+        ).order_by('id').values_list('id', flat=True))
+        if chunk:
+            yield chunk
+
+
+@shared_task(acks_late=True)
+def enroll_workflow_contacts(workflow_id, segment_id=None, contact_ids=None):
+    """
+    Enroll a segment, or a list of contact ids, in a workflow in chunks.
+    Enrollment skips contacts already enrolled, so a redelivered task
+    picks up where the interrupted one stopped.
+    """
+    workflow = Workflow.objects.get(id=workflow_id, is_active=True)
+    segment = Segment.objects.get(id=segment_id) if segment_id is not None else None
+    
+    enrolled = 0
+    for chunk in enrollment_chunks(segment, contact_ids):
+        enrolled += enroll_contacts(workflow, chunk)
+    
+    return f"Enrolled {enrolled} contacts in workflow {workflow.name}"
+
+
+def update_contacts(contact_ids, **fields):
+    """
+    Set fields on contacts in one UPDATE and do what their post_save
+    handlers would have: record contact_updated workflow events, queue
+    segment membership, search indexing and the dashboard figures
+    """
+    with transaction.atomic():
+        Contact.objects.filter(id__in=contact_ids).update(updated_at=timezone.now(), **fields)
+        emit('contact_updated', contact_ids)
+    schedule_membership_update(contact_ids)
+    schedule_indexing('contact', contact_ids)
+    invalidate_stats()
+    schedule_rollup(
+        timezone.localdate(created_at)
+        for created_at in Contact.objects.filter(id__in=contact_ids).datetimes('created_at', 'day')
+    )
+
+
+def queue_emails(email_log_ids):
+    """Queue send_email_batch_task for queued email logs once the current transaction commits"""
+    chunk_size = settings.CAMPAIGN_FANOUT_CHUNK_SIZE
+
+    def enqueue():
+        for i in range(0, len(email_log_ids), chunk_size):
+            send_email_batch_task.delay(email_log_ids[i:i + chunk_size])
+    transaction.on_commit(enqueue)
+
+
+def run_step(step, contact_ids):
+    """
+    Apply a workflow step's action to contacts with set-based writes.
+    Returns (status, error_message) for their step executions.
+    """
+    action = step.action
+    
+    if action == 'wait':
+        # Nothing to do, the delay is handled by scheduled_for
+        return 'completed', ''
+    
+    if action == 'send_email':
+        # One EmailLog per contact, sent in batches
+        if not step.email_template_id:
+            return 'failed', 'No email template'
+        lease_expires_at = email_lease_expiry()
+        email_logs = EmailLog.objects.bulk_create([
+            EmailLog(contact_id=contact_id, template_id=step.email_template_id, status='queued',
+                     lease_expires_at=lease_expires_at)
+            for contact_id in contact_ids
+        ])
+        queue_emails([email_log.id for email_log in email_logs])
+        return 'completed', ''
+    
     try:
-        step_execution = WorkflowStepExecution.objects.get(id=step_execution_id)
-        step = step_execution.step
-        contact = step_execution.workflow_execution.contact
-        
-        action = step.action
-        
-        if action == 'send_email':
-            # Send email via template
-            if step.email_template:
-                email_log = EmailLog.objects.create(
-                    contact=contact,
-                    template=step.email_template,
-                    status='pending'
-                )
-                send_email_task.delay(email_log.id)
-                step_execution.status = 'completed'
-        
-        elif action == 'add_tag':
-            # Add tag to contact
-            try:
-                data = json.loads(step.action_data)
-                tag = data.get('tag', '')
-                if tag:
-                    existing_tags = set(t.strip() for t in contact.tags.split(',') if t.strip())
-                    existing_tags.add(tag)
-                    contact.tags = ','.join(existing_tags)
-                    contact.save()
-                step_execution.status = 'completed'
-            except (json.JSONDecodeError, KeyError):
-                step_execution.status = 'failed'
-                step_execution.error_message = 'Invalid action_data'
-        
-        elif action == 'change_status':
-            # Change contact status
-            try:
-                data = json.loads(step.action_data)
-                status = data.get('status', '')
-                if status:
-                    contact.status = status
-                    contact.save()
-                step_execution.status = 'completed'
-            except (json.JSONDecodeError, KeyError):
-                step_execution.status = 'failed'
-                step_execution.error_message = 'Invalid action_data'
-        
-        elif action == 'assign_to':
-            # Assign contact to user
+        data = json.loads(step.action_data)
+        if not isinstance(data, dict):
+            raise ValueError
+    except ValueError:
+        return 'failed', 'Invalid action_data'
+    
+    if action == 'add_tag':
+        tag = data.get('tag', '')
+        if tag:
+            tag_contacts(contact_ids, [tag])
+    
+    elif action == 'change_status':
+        status = data.get('status', '')
+        if status:
+            update_contacts(contact_ids, status=status)
+    
+    elif action == 'assign_to':
+        user_id = data.get('user_id')
+        if user_id:
             try:
-                data = json.loads(step.action_data)
-                user_id = data.get('user_id')
-                if user_id:
-                    from django.contrib.auth.models import User
-                    user = User.objects.get(id=user_id)
-                    contact.assigned_to = user
-                    contact.save()
-                step_execution.status = 'completed'
-            except (json.JSONDecodeError, KeyError, Exception):
-                step_execution.status = 'failed'
-                step_execution.error_message = 'Invalid action_data or user not found'
-        
-        elif action == 'wait':
-            # Just mark as completed (the delay is handled by eta)
-            step_execution.status = 'completed'
-        
-        step_execution.executed_at = timezone.now()
-        step_execution.save()
-        
-        # Check if all steps are completed
-        all_completed = not step_execution.workflow_execution.step_executions.filter(
-            status__in=['pending', 'in_progress']
-        ).exists()
+                user = User.objects.get(id=user_id)
+            except (User.DoesNotExist, ValueError, TypeError):
+                return 'failed', 'Invalid action_data or user not found'
+            update_contacts(contact_ids, assigned_to=user)
+    
+    else:
+        return 'failed', f'Unknown action: {action}'
+    
+    return 'completed', ''
+
+
+@shared_task
+def execute_workflow_steps(step_execution_ids):
+    """
+    Execute a batch of due workflow steps, then schedule the next ones
+    Step executions are grouped by step and each group runs as set-based
+    writes across all of its contacts
+    """
+    with transaction.atomic():
+        # Rows another delivery has already run are no longer pending or queued
+        step_executions = list(WorkflowStepExecution.objects.select_for_update(of=('self',)).select_related(
+            'step__workflow', 'workflow_execution'
+        ).filter(id__in=step_execution_ids, status__in=['pending', 'queued']).order_by('id'))
+        now = timezone.now()
         
-        if all_completed:
-            step_execution.workflow_execution.status = 'completed'
-            step_execution.workflow_execution.completed_at = timezone.now()
-            step_execution.workflow_execution.save()
+        groups = {}
+        skipped = []
+        for step_execution in step_executions:
+            if step_execution.workflow_execution.status == 'in_progress':
+                groups.setdefault(step_execution.step_id, []).append(step_execution)
+            else:
+                skipped.append(step_execution.id)
         
-        return f"Step executed: {step.action}"
+        if skipped:
+            WorkflowStepExecution.objects.filter(id__in=skipped).update(status='skipped', executed_at=now)
         
-    except Exception as e:
-        raise
+        for group in groups.values():
+            step = group[0].step
+            status, error_message = run_step(step, [step_execution.workflow_execution.contact_id for step_execution in group])
+            WorkflowStepExecution.objects.filter(id__in=[step_execution.id for step_execution in group]).update(
+                status=status,
+                error_message=error_message,
+                executed_at=now
+            )
+            
+            # Materialize the next step, or complete the executions
+            advance_executions(step.workflow, [step_execution.workflow_execution for step_execution in group], step.order)
+    
+    executed = len(step_executions) - len(skipped)
+    return f"Executed {executed} of {len(step_execution_ids)} workflow steps"
+
+
+@shared_task
+def execute_workflow_step(step_execution_id):
+    """
+    Execute a single workflow step, then schedule the next one
+    """
+    return execute_workflow_steps([step_execution_id])
 
 
 @shared_task
 def process_pending_workflows():
     """
-    Process pending workflow steps that are due to run
-    Runs every 5 minutes via Celery Beat
+    Dispatch workflow steps that are due to run, each exactly once
+    Runs every WORKFLOW_TIMER_INTERVAL seconds via Celery Beat
     """
-    now = timezone.now()
-    
-    # Find pending step executions that are due
-    pending_steps = WorkflowStepExecution.objects.filter(
-        status='pending',
-        scheduled_for__lte=now
-    )
-    
-    for step in pending_steps:
-        execute_workflow_step.delay(step.id)
-    
-    return f"Processed {pending_steps.count()} pending workflow steps"
+    dispatched = dispatch_due_steps(execute_workflow_steps.delay)
+    return f"Dispatched {dispatched} due workflow steps"
+
+
+@shared_task
+def relay_workflow_events():
+    """
+    Enroll contacts in the workflows their recorded trigger events match
+    Runs every WORKFLOW_OUTBOX_INTERVAL seconds via Celery Beat
+    """
+    relayed = relay_events(enroll_contacts)
+    return f"Relayed {relayed} workflow events"
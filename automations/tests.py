@@ -1,3 +1,358 @@
-from django.test import TestCase
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+import redis
+from django.apps import apps
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from contacts.models import Contact, Segment
+from contacts.tags import tag_contacts
+from deals.models import Deal, Pipeline, Stage
+from emails.models import EmailLog, EmailTemplate
+from . import tasks
+from .models import Workflow, WorkflowEvent, WorkflowExecution, WorkflowStep, WorkflowStepExecution
+from .tasks import enroll_contacts, enroll_workflow_contacts, execute_workflow_steps, trigger_workflow
+from .timers import claim_due_steps, dispatch_due_steps
+from .triggers import matching_workflows
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        Workflow.objects.create(name='Welcome', trigger_event='contact_created')
+        Workflow.objects.create(name='Tagged', trigger_event='tag_added', trigger_data='{"tag": "vip"}')
+
+    def test_contact_save_records_event(self):
+        contact = Contact.objects.create(first_name='Ann', last_name='Lee', email='ann@example.com')
+        self.assertEqual(
+            list(WorkflowEvent.objects.values_list('event', 'contact_id')), [('contact_created', contact.id)]
+        )
+
+    def test_failed_event_write_rolls_back_the_contact(self):
+        with mock.patch('automations.outbox.WorkflowEvent.objects.bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                Contact.objects.create(first_name='Ann', last_name='Lee', email='ann@example.com')
+        self.assertFalse(Contact.objects.exists())
+
+    def test_failed_event_write_rolls_back_the_stage_change(self):
+        contact = Contact.objects.create(first_name='Ann', last_name='Lee', email='ann@example.com')
+        pipeline = Pipeline.objects.create(name='Sales')
+        new = Stage.objects.create(pipeline=pipeline, name='New', order=1)
+        won = Stage.objects.create(pipeline=pipeline, name='Won', order=2)
+        # The trigger index is invalidated on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            Workflow.objects.create(name='Won', trigger_event='deal_stage_changed', trigger_data=f'{{"stage_id": {won.id}}}')
+        deal = Deal.objects.create(title='Deal', value=100, contact=contact, pipeline=pipeline, stage=new)
+
+        deal = Deal.objects.get(id=deal.id)
+        deal.stage = won
+        with mock.patch('automations.outbox.WorkflowEvent.objects.bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                deal.save()
+        self.assertEqual(Deal.objects.get(id=deal.id).stage_id, new.id)
+
+    def test_failed_event_write_rolls_back_the_tags(self):
+        contact = Contact.objects.create(first_name='Ann', last_name='Lee', email='ann@example.com')
+        with mock.patch('automations.outbox.WorkflowEvent.objects.bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                tag_contacts([contact.id], ['vip'])
+        self.assertFalse(contact.tags.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class TriggerIndexTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.any_stage = self.add_workflow('deal_stage_changed', '')
+        self.stage = self.add_workflow('deal_stage_changed', '{"stage_id": "7"}')
+        self.tag = self.add_workflow('tag_added', '{"tag": " VIP "}')
+        self.add_workflow('deal_stage_changed', '{"stage_id": 7}', is_active=False)
+        self.add_workflow('deal_stage_changed', '{"stage_id": "x"}')
+        self.add_workflow('tag_added', '["vip"]')
+
+    def add_workflow(self, event, trigger_data, **kwargs):
+        # The index is invalidated on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            return Workflow.objects.create(name=event, trigger_event=event, trigger_data=trigger_data, **kwargs).id
+
+    def test_matching_workflows(self):
+        self.assertEqual(matching_workflows('deal_stage_changed', 7), [self.any_stage, self.stage])
+        self.assertEqual(matching_workflows('deal_stage_changed', 8), [self.any_stage])
+        self.assertEqual(matching_workflows('tag_added', 'vip'), [self.tag])
+        self.assertEqual(matching_workflows('tag_added', 'sales'), [])
+        self.assertEqual(matching_workflows('contact_created'), [])
+
+    def test_index_is_kept_until_a_workflow_changes(self):
+        matching_workflows('tag_added', 'vip')
+        with self.assertNumQueries(0):
+            matching_workflows('tag_added', 'vip')
+
+        # A write that bypasses signals is not seen
+        Workflow.objects.filter(id=self.tag).update(is_active=False)
+        self.assertEqual(matching_workflows('tag_added', 'vip'), [self.tag])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Workflow.objects.get(id=self.any_stage).delete()
+        self.assertEqual(matching_workflows('tag_added', 'vip'), [])
+        self.assertEqual(matching_workflows('deal_stage_changed', 7), [self.stage])
+
+    def test_change_is_seen_after_commit(self):
+        matching_workflows('tag_added', 'vip')
+        with self.captureOnCommitCallbacks() as callbacks:
+            workflow = Workflow.objects.get(id=self.tag)
+            workflow.trigger_data = '{"tag": "sales"}'
+            workflow.save()
+        self.assertEqual(matching_workflows('tag_added', 'sales'), [])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(matching_workflows('tag_added', 'sales'), [self.tag])
+
+    def test_cache_errors_rebuild_on_every_lookup(self):
+        with mock.patch('automations.triggers.cache.get', side_effect=redis.ConnectionError):
+            with self.assertNumQueries(1):
+                self.assertEqual(matching_workflows('tag_added', 'vip'), [self.tag])
+
+
+class StepCursorTests(TestCase):
+
+    def setUp(self):
+        self.contact = Contact.objects.create(first_name='Ann', last_name='Lee', email='ann@example.com')
+        self.workflow = Workflow.objects.create(name='Nurture', trigger_event='manual')
+        self.first = WorkflowStep.objects.create(workflow=self.workflow, order=1, action='wait')
+        WorkflowStep.objects.create(workflow=self.workflow, order=2, action='wait', is_enabled=False)
+        self.last = WorkflowStep.objects.create(workflow=self.workflow, order=3, action='wait', delay_days=2)
+
+    def steps(self, execution):
+        return list(execution.step_executions.order_by('id').values_list('step__order', 'status'))
+
+    def run_due_steps(self, execution):
+        execute_workflow_steps(list(execution.step_executions.filter(status='queued').values_list('id', flat=True)))
+
+    def test_steps_are_created_one_at_a_time(self):
+        trigger_workflow(self.workflow.id, self.contact.id)
+        execution = WorkflowExecution.objects.get()
+        self.assertEqual((execution.status, execution.step_cursor), ('in_progress', 1))
+        self.assertEqual(self.steps(execution), [(1, 'queued')])
+
+        self.run_due_steps(execution)
+        execution.refresh_from_db()
+        self.assertEqual(execution.step_cursor, 3)
+        self.assertEqual(self.steps(execution), [(1, 'completed'), (3, 'pending')])
+        # Delays count from enrollment
+        self.assertEqual(
+            execution.step_executions.get(step=self.last).scheduled_for, execution.started_at + timedelta(days=2)
+        )
+
+        execution.step_executions.filter(step=self.last).update(status='queued')
+        self.run_due_steps(execution)
+        execution.refresh_from_db()
+        self.assertEqual(execution.status, 'completed')
+        self.assertEqual(self.steps(execution), [(1, 'completed'), (3, 'completed')])
+
+    def test_trigger_is_idempotent(self):
+        trigger_workflow(self.workflow.id, self.contact.id)
+        self.assertEqual(trigger_workflow(self.workflow.id, self.contact.id), 'Workflow already executed for Ann Lee')
+        self.assertEqual(WorkflowStepExecution.objects.count(), 1)
+
+    def test_executions_with_every_step_created_up_front(self):
+        execution = WorkflowExecution.objects.create(workflow=self.workflow, contact=self.contact, status='in_progress')
+        now = timezone.now()
+        for step in [self.first, self.last]:
+            WorkflowStepExecution.objects.create(workflow_execution=execution, step=step, status='queued', scheduled_for=now)
+
+        import_module('automations.migrations.0002_execution_step_cursor').set_step_cursors(apps, None)
+        execution.refresh_from_db()
+        self.assertEqual(execution.step_cursor, 3)
+
+        # The remaining step was created already; nothing new is added
+        execute_workflow_steps([execution.step_executions.get(step=self.first).id])
+        execution.refresh_from_db()
+        self.assertEqual(execution.status, 'in_progress')
+        self.assertEqual(self.steps(execution), [(1, 'completed'), (3, 'queued')])
+
+        self.run_due_steps(execution)
+        execution.refresh_from_db()
+        self.assertEqual(execution.status, 'completed')
+        self.assertEqual(self.steps(execution), [(1, 'completed'), (3, 'completed')])
+
+
+@override_settings(WORKFLOW_STEP_LEASE=60, WORKFLOW_TIMER_BATCH_SIZE=2)
+class TimerTests(TestCase):
+
+    def setUp(self):
+        contact = Contact.objects.create(first_name='Ann', last_name='Lee', email='ann@example.com')
+        workflow = Workflow.objects.create(name='Nurture', trigger_event='manual')
+        self.step = WorkflowStep.objects.create(workflow=workflow, order=1, action='wait')
+        self.execution = WorkflowExecution.objects.create(workflow=workflow, contact=contact, status='in_progress')
+        self.now = timezone.now()
+
+    def add_step(self, minutes, status='pending', lease=None):
+        return WorkflowStepExecution.objects.create(
+            workflow_execution=self.execution, step=self.step, status=status,
+            scheduled_for=self.now + timedelta(minutes=minutes),
+            lease_expires_at=self.now + timedelta(minutes=lease) if lease is not None else None
+        ).id
+
+    def test_claim_due_steps(self):
+        later = self.add_step(-1)
+        earlier = self.add_step(-5)
+        expired = self.add_step(-3, 'queued', lease=-1)
+        self.add_step(-4, 'queued', lease=1)
+        self.add_step(-6, 'completed')
+        self.add_step(5)
+
+        self.assertEqual(claim_due_steps(2, self.now), [earlier, expired])
+        self.assertEqual(claim_due_steps(10, self.now), [later])
+        self.assertEqual(claim_due_steps(10, self.now), [])
+
+        claimed = WorkflowStepExecution.objects.filter(id__in=[earlier, expired, later])
+        self.assertEqual(set(claimed.values_list('status', flat=True)), {'queued'})
+        self.assertEqual(
+            set(claimed.values_list('lease_expires_at', flat=True)), {self.now + timedelta(seconds=60)}
+        )
+
+    def test_claimed_steps_are_claimed_again_once_the_lease_expires(self):
+        step_execution_id = self.add_step(-1)
+        claim_due_steps(10, self.now)
+        self.assertEqual(claim_due_steps(10, self.now + timedelta(seconds=59)), [])
+        self.assertEqual(claim_due_steps(10, self.now + timedelta(seconds=60)), [step_execution_id])
+
+    def test_dispatch_due_steps_in_batches(self):
+        step_execution_ids = [self.add_step(-minutes) for minutes in range(5, 0, -1)]
+        batches = []
+        self.assertEqual(dispatch_due_steps(batches.append), 5)
+        self.assertEqual(batches, [step_execution_ids[:2], step_execution_ids[2:4], step_execution_ids[4:]])
+        self.assertEqual(dispatch_due_steps(batches.append), 0)
+
+
+class StepExecutionTests(TestCase):
+
+    def setUp(self):
+        self.contacts = [
+            Contact.objects.create(first_name=name, last_name='Lee', email=f'{name}@example.com')
+            for name in ['ann', 'bob', 'cat']
+        ]
+        self.workflow = Workflow.objects.create(name='Nurture', trigger_event='manual')
+        self.executions = [
+            WorkflowExecution.objects.create(workflow=self.workflow, contact=contact, status='in_progress', step_cursor=1)
+            for contact in self.contacts
+        ]
+
+    def queue(self, action, **kwargs):
+        step = WorkflowStep.objects.create(workflow=self.workflow, order=1, action=action, **kwargs)
+        now = timezone.now()
+        return [
+            WorkflowStepExecution.objects.create(workflow_execution=execution, step=step, status='queued', scheduled_for=now).id
+            for execution in self.executions
+        ]
+
+    def statuses(self, step_execution_ids):
+        return list(WorkflowStepExecution.objects.filter(id__in=step_execution_ids).order_by('id').values_list(
+            'status', 'error_message'
+        ))
+
+    def test_a_step_runs_once_for_all_of_its_contacts(self):
+        step_execution_ids = self.queue('add_tag', action_data='{"tag": "nurtured"}')
+        with mock.patch('automations.tasks.run_step', wraps=tasks.run_step) as run_step:
+            self.assertEqual(execute_workflow_steps(step_execution_ids), 'Executed 3 of 3 workflow steps')
+        run_step.assert_called_once_with(mock.ANY, [contact.id for contact in self.contacts])
+
+        self.assertEqual(self.statuses(step_execution_ids), [('completed', '')] * 3)
+        self.assertEqual([contact.tag_names for contact in self.contacts], [['nurtured']] * 3)
+        self.assertEqual(set(WorkflowExecution.objects.values_list('status', flat=True)), {'completed'})
+
+    def test_change_status(self):
+        self.queue('change_status', action_data='{"status": "customer"}')
+        execute_workflow_steps(list(WorkflowStepExecution.objects.values_list('id', flat=True)))
+        self.assertEqual(set(Contact.objects.values_list('status', flat=True)), {'customer'})
+
+    def test_send_email_queues_one_log_per_contact(self):
+        template = EmailTemplate.objects.create(name='Welcome', subject='Hi', html_body='<p>Hello</p>')
+        step_execution_ids = self.queue('send_email', email_template=template)
+        execute_workflow_steps(step_execution_ids)
+        self.assertEqual(
+            sorted(EmailLog.objects.values_list('contact_id', 'template_id', 'status')),
+            [(contact.id, template.id, 'queued') for contact in self.contacts]
+        )
+
+    def test_failures_are_recorded_per_step_execution(self):
+        step_execution_ids = self.queue('add_tag', action_data='not json')
+        execute_workflow_steps(step_execution_ids)
+        self.assertEqual(self.statuses(step_execution_ids), [('failed', 'Invalid action_data')] * 3)
+
+    def test_steps_of_stopped_executions_are_skipped(self):
+        step_execution_ids = self.queue('change_status', action_data='{"status": "customer"}')
+        WorkflowExecution.objects.filter(id=self.executions[0].id).update(status='cancelled')
+
+        self.assertEqual(execute_workflow_steps(step_execution_ids), 'Executed 2 of 3 workflow steps')
+        self.assertEqual(self.statuses(step_execution_ids)[0], ('skipped', ''))
+        self.assertEqual(Contact.objects.get(id=self.contacts[0].id).status, 'lead')
+
+    def test_redelivered_steps_run_once(self):
+        step_execution_ids = self.queue('send_email', email_template=EmailTemplate.objects.create(
+            name='Welcome', subject='Hi', html_body='<p>Hello</p>'
+        ))
+        execute_workflow_steps(step_execution_ids)
+        self.assertEqual(execute_workflow_steps(step_execution_ids), 'Executed 0 of 3 workflow steps')
+        self.assertEqual(EmailLog.objects.count(), 3)
+
+
+@override_settings(WORKFLOW_ENROLL_CHUNK_SIZE=2)
+class EnrollmentTests(TestCase):
+
+    def setUp(self):
+        self.contacts = [
+            Contact.objects.create(first_name=name, last_name='Lee', email=f'{name}@example.com', status=status)
+            for name, status in [('ann', 'lead'), ('bob', 'lead'), ('cat', 'lead'), ('dan', 'customer')]
+        ]
+        self.ids = [contact.id for contact in self.contacts]
+        self.workflow = Workflow.objects.create(name='Nurture', trigger_event='manual')
+        WorkflowStep.objects.create(workflow=self.workflow, order=1, action='wait', delay_days=1)
+
+    def enrolled(self):
+        return sorted(WorkflowExecution.objects.filter(workflow=self.workflow).values_list(
+            'contact_id', 'status', 'step_cursor'
+        ))
+
+    def test_enroll_contacts_is_idempotent(self):
+        self.assertEqual(enroll_contacts(self.workflow, self.ids[:2]), 2)
+        self.assertEqual(enroll_contacts(self.workflow, self.ids), 2)
+        self.assertEqual(enroll_contacts(self.workflow, self.ids), 0)
+
+        self.assertEqual(self.enrolled(), [(contact_id, 'in_progress', 1) for contact_id in self.ids])
+        self.assertEqual(WorkflowStepExecution.objects.filter(status='pending').count(), 4)
+
+    def test_unstarted_executions_are_started(self):
+        WorkflowExecution.objects.create(workflow=self.workflow, contact=self.contacts[0], status='pending')
+        WorkflowExecution.objects.create(workflow=self.workflow, contact=self.contacts[1], status='completed')
+
+        self.assertEqual(enroll_contacts(self.workflow, self.ids[:2]), 1)
+        self.assertEqual(self.enrolled(), [(self.ids[0], 'in_progress', 1), (self.ids[1], 'completed', None)])
+
+    def test_enroll_a_segment(self):
+        segment = Segment.objects.create(
+            name='Leads', definition='{"all": [{"field": "status", "op": "eq", "value": "lead"}]}'
+        )
+        self.assertEqual(
+            enroll_workflow_contacts(self.workflow.id, segment_id=segment.id), 'Enrolled 3 contacts in workflow Nurture'
+        )
+        self.assertEqual([row[0] for row in self.enrolled()], self.ids[:3])
+
+    def test_enroll_contact_ids(self):
+        enroll_workflow_contacts(self.workflow.id, contact_ids=[self.ids[3], self.ids[0], self.ids[3], 0])
+        self.assertEqual([row[0] for row in self.enrolled()], [self.ids[0], self.ids[3]])
+
+        # A redelivered task only enrolls the contacts left
+        self.assertEqual(
+            enroll_workflow_contacts(self.workflow.id, contact_ids=self.ids), 'Enrolled 2 contacts in workflow Nurture'
+        )
@@ -0,0 +1,68 @@
+"""
+Durable timer for delayed workflow steps.
+
+A step execution waits in the database as 'pending' until its
+scheduled_for; nothing sits on the broker or in worker memory in the
+meantime. dispatch_due_steps() runs every WORKFLOW_TIMER_INTERVAL seconds
+and claims due steps in batches off the (status, scheduled_for) index with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of dispatchers can run at
+once without handing out the same step twice. A claimed step moves to
+'queued' with a lease; if it has not run when the lease expires (a lost
+message or a dead worker) the next dispatcher claims it again.
+execute_workflow_steps locks the rows and only runs a pending or queued step,
+so a message delivered twice still executes the step once. Each batch is
+one execute_workflow_steps task, which runs steps shared by many contacts
+as set-based writes.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import WorkflowStepExecution
+
+
+def lease_expiry(now=None):
+    """When a step claimed now may be claimed again if it has not run"""
+    return (now or timezone.now()) + timedelta(seconds=settings.WORKFLOW_STEP_LEASE)
+
+
+def claim_due_steps(limit, now=None):
+    """
+    Claim up to limit due step executions (pending, or queued with an
+    expired lease), earliest first; returns their ids. Rows locked by a
+    concurrent claim are skipped rather than waited for.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        step_execution_ids = list(WorkflowStepExecution.objects.select_for_update(skip_locked=True).filter(
+            Q(status='pending') | Q(status='queued', lease_expires_at__lte=now),
+            scheduled_for__lte=now,
+        ).order_by('scheduled_for', 'id').values_list('id', flat=True)[:limit])
+        if step_execution_ids:
+            WorkflowStepExecution.objects.filter(id__in=step_execution_ids).update(
+                status='queued',
+                lease_expires_at=lease_expiry(now)
+            )
+    return step_execution_ids
+
+
+def dispatch_due_steps(enqueue):
+    """
+    Claim every due step execution in batches of WORKFLOW_TIMER_BATCH_SIZE;
+    enqueue(step_execution_ids) puts one batch on the broker. Returns the
+    number dispatched.
+    """
+    now = timezone.now()
+    batch_size = settings.WORKFLOW_TIMER_BATCH_SIZE
+    dispatched = 0
+    while True:
+        step_execution_ids = claim_due_steps(batch_size, now)
+        if step_execution_ids:
+            enqueue(step_execution_ids)
+        dispatched += len(step_execution_ids)
+        if len(step_execution_ids) < batch_size:
+            return dispatched
+
@@ -0,0 +1,101 @@
+"""
+In-process index of workflow triggers.
+
+Active workflows are indexed by (trigger_event, key), where the key comes
+from trigger_data: the stage id for deal_stage_changed ({"stage_id": 1}),
+the normalized tag for tag_added ({"tag": "sales"}), and None for a
+workflow that fires on any stage/tag or for events without a key. A
+trigger_data that cannot be parsed leaves the workflow out of the index.
+
+Each process keeps its own copy and rebuilds it (one query) when the
+version token in the shared cache changes; every Workflow save or delete
+replaces the token (automations/signals.py). With the cache unreachable
+the index is rebuilt on every lookup.
+"""
+import json
+import threading
+import uuid
+
+import redis
+from django.core.cache import cache
+from django.db import transaction
+
+from contacts.models import Tag
+from .models import Workflow
+
+VERSION_KEY = 'automations:triggers:version'
+
+_lock = threading.Lock()
+_index = {'version': None, 'workflows': {}}
+
+
+def trigger_key(event, trigger_data):
+    """
+    Index key for a workflow's trigger_data: a stage id, a tag, or None
+    for any. Raises ValueError for trigger_data that cannot be used.
+    """
+    data = json.loads(trigger_data or '{}')
+    if not isinstance(data, dict):
+        raise ValueError('trigger_data must be a JSON object')
+    if event == 'deal_stage_changed':
+        stage_id = data.get('stage_id')
+        return int(stage_id) if stage_id not in (None, '') else None
+    if event == 'tag_added':
+        return Tag.normalize(data.get('tag') or '') or None
+    return None
+
+
+def build_index():
+    """{(event, key): [workflow ids]} for every active workflow"""
+    workflows = {}
+    for workflow_id, event, trigger_data in Workflow.objects.filter(is_active=True).order_by('id').values_list(
+        'id', 'trigger_event', 'trigger_data'
+    ):
+        try:
+            key = trigger_key(event, trigger_data)
+        except (ValueError, TypeError):
+            continue
+        workflows.setdefault((event, key), []).append(workflow_id)
+    return workflows
+
+
+def _current_version():
+    try:
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(VERSION_KEY, version, None):
+                version = cache.get(VERSION_KEY)
+        return version
+    except redis.RedisError:
+        return None
+
+
+def get_index():
+    version = _current_version()
+    if version is None:
+        return build_index()
+    with _lock:
+        if _index['version'] != version:
+            _index['workflows'] = build_index()
+            _index['version'] = version
+        return _index['workflows']
+
+
+def matching_workflows(event, key=None):
+    """Ids of active workflows for event that match key, including those for any key"""
+    index = get_index()
+    workflow_ids = list(index.get((event, None), []))
+    if key is not None:
+        workflow_ids += index.get((event, key), [])
+    return sorted(workflow_ids)
+
+
+def invalidate_index():
+    """Make every process rebuild its index once the current transaction commits"""
+    def bump():
+        try:
+            cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+        except redis.RedisError:
+            pass
+    transaction.on_commit(bump)
@@ -1,13 +1,14 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.views.generic import View, ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
-from django.db.models import Q
+from django.http import JsonResponse
 
 from .models import Workflow, WorkflowStep, WorkflowExecution, WorkflowStepExecution
-from .tasks import trigger_workflow
+from .tasks import enroll_workflow_contacts, trigger_workflow
 from emails.models import EmailTemplate
-from contacts.models import Contact
+from contacts.models import Contact, Segment
+from search.index import matching_ids
 
 
 class WorkflowListView(LoginRequiredMixin, ListView):
@@ -22,10 +23,7 @@ class WorkflowListView(LoginRequiredMixin, ListView):
         queryset = Workflow.objects.select_related('created_by').prefetch_related('steps')
         
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(description__icontains=search)
-            )
+            queryset = queryset.filter(id__in=matching_ids('workflow', search))
         
         return queryset.order_by('-created_at')
 
@@ -41,9 +39,53 @@ class WorkflowDetailView(LoginRequiredMixin, DetailView):
         workflow = self.get_object()
         context['steps'] = workflow.steps.all().order_by('order')
         context['executions'] = workflow.executions.all()[:10]
+        context['segments'] = Segment.objects.order_by('name')
         return context
 
 
+class WorkflowEnrollView(LoginRequiredMixin, View):
+    """Enroll a segment or a list of contacts in a workflow in the background (via AJAX)"""
+
+    def post(self, request, pk, *args, **kwargs):
+        workflow = Workflow.objects.filter(id=pk, is_active=True).first()
+        if workflow is None:
+            return JsonResponse({
+                'success': False,
+                'message': 'Only active workflows can enroll contacts'
+            })
+        
+        segment_id = request.POST.get('segment_id', '')
+        contact_ids = [
+            int(value)
+            for values in request.POST.getlist('contact_ids')
+            for value in values.split(',')
+            if value.strip().isdigit()
+        ]
+        
+        if segment_id.isdigit():
+            segment = Segment.objects.filter(id=segment_id).first()
+            if segment is None:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Segment not found'
+                })
+            enroll_workflow_contacts.delay(workflow.id, segment_id=segment.id)
+            message = f'Enrolling segment "{segment.name}"'
+        elif contact_ids:
+            enroll_workflow_contacts.delay(workflow.id, contact_ids=contact_ids)
+            message = f'Enrolling {len(set(contact_ids))} contacts'
+        else:
+            return JsonResponse({
+                'success': False,
+                'message': 'Pick a segment or contacts to enroll'
+            })
+        
+        return JsonResponse({
+            'success': True,
+            'message': message
+        })
+
+
 class WorkflowCreateView(LoginRequiredMixin, CreateView):
     """Create a new workflow"""
     model = Workflow
@@ -146,11 +188,7 @@ class WorkflowExecutionListView(LoginRequiredMixin, ListView):
         queryset = WorkflowExecution.objects.select_related('workflow', 'contact')
         
         if search:
-            queryset = queryset.filter(
-                Q(contact__first_name__icontains=search) |
-                Q(contact__last_name__icontains=search) |
-                Q(contact__email__icontains=search)
-            )
+            queryset = queryset.filter(contact_id__in=matching_ids('contact', search))
         
         if status:
             queryset = queryset.filter(status=status)
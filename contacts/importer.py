@@ -0,0 +1,233 @@
+"""
+Background CSV contact import.
+
+The uploaded file is read from disk as a stream and handled in chunks of
+CONTACT_IMPORT_CHUNK_SIZE rows:
+
+- rows are validated and bad ones recorded as ContactImportErrors
+- emails are lowercased, de-duplicated within the chunk and checked
+  against existing contacts with one query on the Lower(email) index
+- companies are resolved through a domain -> id map cached for the whole
+  import: a company_domain (or domain) column matches or creates the
+  company, otherwise the email's domain matches an existing company only
+- new contacts go in with multi-row INSERTs of prepared values
+  (crm_project/bulk_insert.py) and their tags are added in bulk; segment
+  membership and search indexing, which bulk_create skips,
+  are queued as Celery tasks for each chunk, and contacts_created is sent
+  in place of post_save
+
+Counts and progress are saved after every chunk so the import can be polled.
+The uploaded file is deleted once the import finishes, whatever its outcome.
+"""
+import csv
+import io
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from crm_project.bulk_insert import db_datetime, insert_ignoring_conflicts
+from search.index import index_objects
+from search.tasks import schedule_indexing
+from .models import Company, Contact, ContactImport, ContactImportError
+from .signals import contacts_created
+from .tags import normalize_tags, tag_contacts
+from .tasks import schedule_membership_update
+
+# Errors beyond this many per import are counted but not stored
+MAX_STORED_ERRORS = 1000
+
+STATUSES = {value for value, _ in Contact.STATUS_CHOICES}
+MAX_LENGTHS = {'first_name': 255, 'last_name': 255, 'phone': 20}
+# Contact columns taken from a cleaned row, in insert order
+CONTACT_FIELDS = ['email', 'status', 'notes', 'first_name', 'last_name', 'phone']
+
+
+def _clean_domain(value):
+    domain = value.strip().lower()
+    for prefix in ['https://', 'http://', 'www.']:
+        if domain.startswith(prefix):
+            domain = domain[len(prefix):]
+    return domain.split('/', 1)[0]
+
+
+def clean_row(row):
+    """
+    Validate one CSV row. Returns (contact field values, tags, company
+    domain, company name); the name is None when the domain should only
+    match an existing company.
+    """
+    email = (row.get('email') or '').strip().lower()
+    if not email:
+        raise ValidationError('Missing email')
+    validate_email(email)
+
+    status = (row.get('status') or '').strip().lower() or 'lead'
+    if status not in STATUSES:
+        raise ValidationError(f'Unknown status "{status}"')
+
+    values = {'email': email, 'status': status, 'notes': (row.get('notes') or '').strip()}
+    for field, max_length in MAX_LENGTHS.items():
+        value = (row.get(field) or '').strip()
+        if len(value) > max_length:
+            raise ValidationError(f'{field} is longer than {max_length} characters')
+        values[field] = value
+
+    domain = _clean_domain(row.get('company_domain') or row.get('domain') or '')
+    if domain:
+        name = (row.get('company') or '').strip() or domain
+    else:
+        domain = email.rsplit('@', 1)[1]
+        name = None
+    return values, normalize_tags(row.get('tags') or ''), domain, name
+
+
+def resolve_companies(company_ids, wanted):
+    """
+    Add {domain: company id or None} to the company_ids cache for the
+    domains in wanted ({domain: name or None}) that it does not have yet.
+    Named domains without a company get one created.
+    """
+    missing = [domain for domain in wanted if domain not in company_ids]
+    if not missing:
+        return
+
+    found = dict(
+        Company.objects.annotate(domain_lower=Lower('domain'))
+        .filter(domain_lower__in=missing).values_list('domain_lower', 'id')
+    )
+    new_companies = [
+        Company(name=wanted[domain][:255], domain=domain)
+        for domain in missing
+        if domain not in found and wanted[domain]
+    ]
+    if new_companies:
+        Company.objects.bulk_create(new_companies, ignore_conflicts=True)
+        created = list(Company.objects.filter(domain__in=[company.domain for company in new_companies]))
+        index_objects('company', created)
+        found.update((company.domain, company.id) for company in created)
+
+    for domain in missing:
+        company_ids[domain] = found.get(domain)
+
+
+def import_chunk(contact_import, rows, company_ids):
+    """
+    Import one chunk of (row number, row dict). Returns (imported,
+    duplicates, errors) counts.
+    """
+    errors = []
+    candidates = {}
+    duplicates = 0
+
+    for row_number, row in rows:
+        try:
+            values, tags, domain, name = clean_row(row)
+        except ValidationError as e:
+            errors.append(ContactImportError(
+                contact_import=contact_import, row_number=row_number, message='; '.join(e.messages)[:500]
+            ))
+            continue
+        if values['email'] in candidates:
+            duplicates += 1
+            continue
+        candidates[values['email']] = (values, tags, domain, name)
+
+    existing = set(
+        Contact.objects.annotate(email_lower=Lower('email'))
+        .filter(email_lower__in=list(candidates)).values_list('email_lower', flat=True)
+    )
+    duplicates += len(existing)
+    new_rows = [candidate for email, candidate in candidates.items() if email not in existing]
+
+    wanted = {}
+    for _, _, domain, name in new_rows:
+        if name or domain not in wanted:
+            wanted[domain] = name
+    resolve_companies(company_ids, wanted)
+
+    now = db_datetime(timezone.now())
+    contacts = [
+        tuple(values[field] for field in CONTACT_FIELDS)
+        + (company_ids.get(domain), contact_import.created_by_id, now, now)
+        for values, _, domain, _ in new_rows
+    ]
+    with transaction.atomic():
+        insert_ignoring_conflicts(Contact, CONTACT_FIELDS + ['company', 'assigned_to', 'created_at', 'updated_at'], contacts)
+        ids = dict(Contact.objects.filter(
+            email__in=[values['email'] for values, _, _, _ in new_rows]
+        ).values_list('email', 'id'))
+
+        by_tags = {}
+        for values, tags, _, _ in new_rows:
+            if tags and values['email'] in ids:
+                by_tags.setdefault(tuple(tags), []).append(ids[values['email']])
+        for tags, contact_ids in by_tags.items():
+            tag_contacts(contact_ids, tags)
+
+        schedule_indexing('contact', ids.values())
+        schedule_membership_update(ids.values())
+        contacts_created.send(sender=Contact, contact_ids=list(ids.values()))
+
+        stored = contact_import.errors.count()
+        if stored < MAX_STORED_ERRORS:
+            ContactImportError.objects.bulk_create(errors[:MAX_STORED_ERRORS - stored])
+
+    return len(contacts), duplicates, len(errors)
+
+
+def run_import(contact_import):
+    """Parse and import a ContactImport's file, updating its progress as it goes"""
+    chunk_size = settings.CONTACT_IMPORT_CHUNK_SIZE
+    imports = ContactImport.objects.filter(id=contact_import.id)
+    company_ids = {}
+
+    try:
+        imports.update(status='processing', started_at=timezone.now(), file_size=contact_import.file.size)
+        contact_import.file.open('rb')
+        raw = contact_import.file.file
+        reader = csv.DictReader(io.TextIOWrapper(raw, encoding='utf-8-sig', newline=''))
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        if 'email' not in reader.fieldnames:
+            raise ValueError('The CSV needs a header row with an "email" column')
+
+        rows = []
+        for row in reader:
+            rows.append((reader.line_num, row))
+            if len(rows) >= chunk_size:
+                _save_chunk(imports, contact_import, rows, company_ids, raw.tell())
+                rows = []
+        if rows:
+            _save_chunk(imports, contact_import, rows, company_ids, raw.tell())
+    except (ValueError, csv.Error) as e:
+        # Includes undecodable (non UTF-8) files
+        imports.update(status='failed', error_message=str(e), completed_at=timezone.now())
+    except Exception as e:
+        # The file is deleted below, so the import cannot be left processing
+        imports.update(status='failed', error_message=f'Import failed: {e}', completed_at=timezone.now())
+        raise
+    else:
+        imports.update(status='completed', bytes_read=F('file_size'), completed_at=timezone.now())
+    finally:
+        contact_import.file.close()
+        # Nothing reads the upload again; don't leave contact data on disk
+        contact_import.file.delete(save=False)
+        imports.update(file='')
+
+    contact_import.refresh_from_db()
+    return contact_import
+
+
+def _save_chunk(imports, contact_import, rows, company_ids, bytes_read):
+    imported, duplicates, errors = import_chunk(contact_import, rows, company_ids)
+    imports.update(
+        processed_rows=F('processed_rows') + len(rows),
+        imported_count=F('imported_count') + imported,
+        duplicate_count=F('duplicate_count') + duplicates,
+        error_count=F('error_count') + errors,
+        bytes_read=bytes_read,
+    )
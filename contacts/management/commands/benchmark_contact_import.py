@@ -0,0 +1,81 @@
+import csv
+import io
+import time
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from contacts.importer import run_import
+from contacts.models import Company, Contact, ContactImport
+
+
+def legacy_import(rows):
+    """The old per-row get_or_create import, for comparison"""
+    for row in rows:
+        Contact.objects.get_or_create(
+            email=row['email'],
+            defaults={
+                'first_name': row['first_name'],
+                'last_name': row['last_name'],
+                'phone': row['phone'],
+                'status': row['status'],
+            }
+        )
+
+
+class Command(BaseCommand):
+    help = 'Measure rows/sec of the background CSV contact import against per-row get_or_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--legacy-rows', type=int, default=5000)
+        parser.add_argument('--domains', type=int, default=500, help='Distinct company domains')
+
+    def handle(self, *args, **options):
+        total = options['rows']
+        domains = options['domains']
+        rows = []
+        for i in range(total):
+            rows.append({
+                'first_name': 'Import',
+                'last_name': f'Bench{i}',
+                # Every 50th row repeats an earlier email in different case
+                'email': f'IMPORT-BENCH-{i - 1}@D{(i - 1) % domains}.example.com' if i % 50 == 49 else f'import-bench-{i}@d{i % domains}.example.com',
+                'phone': '555-0100',
+                'status': 'lead' if i % 1000 else 'bogus',
+                'tags': 'imported,bench' if i % 3 == 0 else '',
+                'company_domain': f'd{i % domains}.example.com' if i % 2 == 0 else '',
+                'company': f'Company {i % domains}' if i % 2 == 0 else '',
+            })
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        data = output.getvalue().encode('utf-8')
+        self.stdout.write(f'{total:,} rows, {len(data) / 1024 / 1024:.1f} MB, {domains} company domains')
+
+        # Everything created here is rolled back at the end
+        with transaction.atomic():
+            legacy_rows = [dict(row, email=f'legacy-{row["email"].lower()}', status='lead')
+                           for row in rows[:options['legacy_rows']]]
+            start = time.perf_counter()
+            legacy_import(legacy_rows)
+            legacy = time.perf_counter() - start
+
+            contact_import = ContactImport(original_name='benchmark.csv')
+            contact_import.file.save('benchmark.csv', ContentFile(data))
+            # run_import deletes the file when it is done
+            start = time.perf_counter()
+            run_import(contact_import)
+            elapsed = time.perf_counter() - start
+
+            self.stdout.write(f'get_or_create per row: {len(legacy_rows) / legacy:,.0f} rows/s')
+            self.stdout.write(f'Background import:     {total / elapsed:,.0f} rows/s ({elapsed:.1f}s, '
+                              f'search indexing and segment updates follow in Celery tasks)')
+            self.stdout.write(
+                f'{contact_import.status}: {contact_import.imported_count:,} imported, '
+                f'{contact_import.duplicate_count:,} duplicates, {contact_import.error_count:,} errors, '
+                f'{Company.objects.filter(domain__endswith=".example.com").count()} companies'
+            )
+            transaction.set_rollback(True)
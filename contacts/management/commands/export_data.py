@@ -0,0 +1,53 @@
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpRequest, QueryDict
+
+from crm_project.exports import EXPORT_VIEWS, FORMATS, get_export_view
+
+
+class Command(BaseCommand):
+    help = 'Stream contacts, companies, deals or email logs to CSV / JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=list(EXPORT_VIEWS))
+        parser.add_argument('--format', dest='export_format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--output', default='-',
+                            help='File to write, "-" for stdout; a .gz name is gzipped')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--filter', action='append', dest='filters', default=[], metavar='KEY=VALUE',
+                            help='List view filter, e.g. status=lead or search=acme (repeatable)')
+
+    def handle(self, *args, **options):
+        params = QueryDict(mutable=True)
+        for item in options['filters']:
+            key, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f'Filters take KEY=VALUE, got "{item}"')
+            params.appendlist(key, value)
+
+        request = HttpRequest()
+        request.GET = params
+        view = get_export_view(options['export'], request)
+
+        output = options['output']
+        compress = options['gzip'] or output.endswith('.gz')
+        if output == '-':
+            stream = sys.stdout.buffer
+            if compress:
+                stream = gzip.GzipFile(fileobj=stream, mode='wb')
+        else:
+            stream = gzip.open(output, 'wb') if compress else open(output, 'wb')
+
+        written = 0
+        try:
+            for block in view.export_lines(options['export_format']):
+                stream.write(block)
+                written += len(block)
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+
+        if output != '-':
+            self.stdout.write(self.style.SUCCESS(f'Wrote {written} bytes to {output}'))
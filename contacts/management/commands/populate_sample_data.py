@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from contacts.models import Contact, Company
+from contacts.tags import tag_contacts
 from deals.models import Pipeline, Stage, Deal
 from emails.models import EmailTemplate, Campaign
 from automations.models import Workflow, WorkflowStep
@@ -52,11 +53,11 @@ class Command(BaseCommand):
                     'company': data['company'],
                     'status': 'lead',
                     'assigned_to': admin,
-                    'tags': 'important,sales'
                 }
             )
             contacts.append(contact)
             if created:
+                tag_contacts([contact.id], ['important', 'sales'])
                 self.stdout.write(self.style.SUCCESS(f'Created contact: {contact.full_name}'))
 
         # Create email template
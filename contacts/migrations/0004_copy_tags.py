@@ -0,0 +1,83 @@
+# Generated by Django 4.2 on 2026-10-17 07:20
+
+from django.db import migrations
+
+CHUNK_SIZE = 1000
+
+
+def normalize(name):
+    # Same as Tag.normalize; models in migrations have no custom methods
+    return ' '.join(str(name).split()).lower()[:100]
+
+
+def copy_tags_to_table(apps, schema_editor):
+    """Split each contact's comma-separated tags into Tag/ContactTag rows, in id order chunks"""
+    Contact = apps.get_model('contacts', 'Contact')
+    Tag = apps.get_model('contacts', 'Tag')
+    ContactTag = apps.get_model('contacts', 'ContactTag')
+
+    tag_ids = {}
+    cursor = 0
+    while True:
+        rows = list(
+            Contact.objects.filter(id__gt=cursor).exclude(tags='')
+            .order_by('id').values_list('id', 'tags')[:CHUNK_SIZE]
+        )
+        if not rows:
+            break
+        cursor = rows[-1][0]
+
+        pairs = set()
+        for contact_id, tags in rows:
+            for name in tags.split(','):
+                name = normalize(name)
+                if name:
+                    pairs.add((contact_id, name))
+
+        missing = {name for _, name in pairs} - tag_ids.keys()
+        if missing:
+            Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+            tag_ids.update(Tag.objects.filter(name__in=missing).values_list('name', 'id'))
+
+        ContactTag.objects.bulk_create(
+            [ContactTag(contact_id=contact_id, tag_id=tag_ids[name]) for contact_id, name in pairs],
+            ignore_conflicts=True
+        )
+
+
+def copy_tags_to_field(apps, schema_editor):
+    """Reverse: write the tag rows back into the comma-separated field"""
+    Contact = apps.get_model('contacts', 'Contact')
+    ContactTag = apps.get_model('contacts', 'ContactTag')
+
+    cursor = 0
+    while True:
+        contact_ids = list(
+            ContactTag.objects.filter(contact_id__gt=cursor).order_by('contact_id')
+            .values_list('contact_id', flat=True).distinct()[:CHUNK_SIZE]
+        )
+        if not contact_ids:
+            break
+        cursor = contact_ids[-1]
+
+        names = {}
+        for contact_id, name in ContactTag.objects.filter(
+            contact_id__in=contact_ids
+        ).order_by('tag__name').values_list('contact_id', 'tag__name'):
+            names.setdefault(contact_id, []).append(name)
+
+        contacts = list(Contact.objects.filter(id__in=contact_ids))
+        for contact in contacts:
+            contact.tags = ','.join(names.get(contact.id, []))[:500]
+        Contact.objects.bulk_update(contacts, ['tags'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contacts', '0003_tags'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_tags_to_table, copy_tags_to_field),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-17 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contacts', '0004_copy_tags'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='contact',
+            name='tags',
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='contacts', through='contacts.ContactTag', to='contacts.tag'),
+        ),
+    ]
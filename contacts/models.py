@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .segment_filter import validate_segment_filter
+
 
 class Company(models.Model):
     """Company/Organization model"""
@@ -23,6 +26,10 @@ class Company(models.Model):
     class Meta:
         verbose_name_plural = "Companies"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['industry']),
+            models.Index(fields=['size']),
+        ]
 
     def __str__(self):
         return self.name
@@ -43,7 +50,7 @@ class Contact(models.Model):
     phone = models.CharField(max_length=20, blank=True, null=True)
     company = models.ForeignKey(Company, on_delete=models.SET_NULL, null=True, blank=True, related_name='contacts')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='lead')
-    tags = models.CharField(max_length=500, blank=True, help_text="Comma-separated tags")
+    tags = models.ManyToManyField('Tag', through='ContactTag', blank=True, related_name='contacts')
     notes = models.TextField(blank=True)
     assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_contacts')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -51,14 +58,64 @@ class Contact(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status']),
+            models.Index(fields=['created_at']),
+            # case-insensitive email lookups (import de-duplication)
+            models.Index(Lower('email'), name='contacts_contact_email_lower'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    def save(self, *args, **kwargs):
+        # Django sends post_save after save()'s own transaction; run it in
+        # this one so workflow events (automations/outbox.py) commit with the row
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
 
+    @property
+    def tag_names(self):
+        """Tag names, using prefetched tags when available"""
+        return sorted(tag.name for tag in self.tags.all())
+
+
+class Tag(models.Model):
+    """Contact tag. Names are stored normalized (trimmed, lowercase)."""
+    name = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def normalize(name):
+        return ' '.join(str(name).split()).lower()[:100]
+
+
+class ContactTag(models.Model):
+    """A tag on a contact"""
+    contact = models.ForeignKey(Contact, on_delete=models.CASCADE, related_name='contact_tags')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='contact_tags')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('contact', 'tag')
+        indexes = [
+            # contacts with a tag; (contact, tag) is covered by the unique index
+            models.Index(fields=['tag', 'contact']),
+        ]
+
+    def __str__(self):
+        return f"{self.contact} - {self.tag}"
+
 
 class Activity(models.Model):
     """Activity timeline for contacts"""
@@ -83,3 +140,104 @@ class Activity(models.Model):
 
     def __str__(self):
         return f"{self.activity_type} - {self.contact.full_name}"
+
+
+class Segment(models.Model):
+    """
+    Saved audience filter (see contacts/segment_filter.py). A materialized
+    segment keeps its matching contacts in SegmentMembership, maintained
+    incrementally as contacts change, so sending to, previewing and
+    counting it read the membership rows instead of scanning contacts.
+    """
+    name = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    definition = models.TextField(
+        validators=[validate_segment_filter],
+        help_text="JSON filter, e.g. {\"all\": [{\"field\": \"status\", \"op\": \"eq\", \"value\": \"lead\"}]}"
+    )
+    is_materialized = models.BooleanField(default=False)
+    member_count = models.PositiveIntegerField(default=0)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='segments')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def is_ready(self):
+        """Materialized and populated at least once"""
+        return self.is_materialized and self.refreshed_at is not None
+
+
+class SegmentMembership(models.Model):
+    """A contact currently matching a materialized segment"""
+    segment = models.ForeignKey(Segment, on_delete=models.CASCADE, related_name='memberships')
+    contact = models.ForeignKey(Contact, on_delete=models.CASCADE, related_name='segment_memberships')
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('segment', 'contact')
+
+    def __str__(self):
+        return f"{self.segment} - {self.contact}"
+
+
+class ContactImport(models.Model):
+    """
+    A CSV contact import. The upload is stored and parsed in the background
+    (contacts/importer.py); counts and progress are updated as it goes.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    file = models.FileField(upload_to='imports/')
+    original_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    file_size = models.PositiveBigIntegerField(default=0)
+    bytes_read = models.PositiveBigIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    imported_count = models.PositiveIntegerField(default=0)
+    duplicate_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='contact_imports')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Import {self.original_name or self.file.name} ({self.status})"
+
+    @property
+    def progress(self):
+        """Percent of the file parsed so far"""
+        if self.status == 'completed':
+            return 100
+        if not self.file_size:
+            return 0
+        return min(int(self.bytes_read * 100 / self.file_size), 99)
+
+
+class ContactImportError(models.Model):
+    """A CSV row that could not be imported"""
+    contact_import = models.ForeignKey(ContactImport, on_delete=models.CASCADE, related_name='errors')
+    row_number = models.PositiveIntegerField()
+    message = models.CharField(max_length=500)
+
+    class Meta:
+        ordering = ['row_number']
+
+    def __str__(self):
+        return f"Row {self.row_number}: {self.message}"
@@ -0,0 +1,214 @@
+"""
+Segment filter language for campaign audiences.
+
+A filter is a JSON condition tree:
+
+    {"all": [condition, ...]}          every condition matches (AND)
+    {"any": [condition, ...]}          at least one matches (OR)
+    {"not": condition}
+    {"field": "status", "op": "in", "value": ["lead", "prospect"]}
+
+Fields and their operators:
+
+    status                               eq, ne, in
+    tags                                 has, has_any, has_none
+    company.id                           eq, in, is_empty
+    company.name / .domain / .industry / .size
+                                         eq, ne, in, contains, is_empty
+    created_at                           before, after, between, within_days
+    last_opened / last_clicked / last_sent
+                                         before, after, within_days, ever, never
+
+Dates are ISO dates or datetimes; "between" takes [start, end] with end
+inclusive for plain dates. The original flat form
+{"status": "lead", "tags": "interested", "company_id": 3} still works and
+means all of those conditions.
+
+This module only parses and validates; contacts.segments compiles a parsed
+tree into a Contact queryset.
+"""
+import json
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+Condition = namedtuple('Condition', ['field', 'op', 'value'])
+
+TEXT_OPS = {'eq', 'ne', 'in', 'contains', 'is_empty'}
+DATE_OPS = {'before', 'after', 'between', 'within_days'}
+ENGAGEMENT_OPS = {'before', 'after', 'within_days', 'ever', 'never'}
+
+FIELD_OPS = {
+    'status': {'eq', 'ne', 'in'},
+    'tags': {'has', 'has_any', 'has_none'},
+    'company.id': {'eq', 'in', 'is_empty'},
+    'company.name': TEXT_OPS,
+    'company.domain': TEXT_OPS,
+    'company.industry': TEXT_OPS,
+    'company.size': TEXT_OPS,
+    'created_at': DATE_OPS,
+    'last_opened': ENGAGEMENT_OPS,
+    'last_clicked': ENGAGEMENT_OPS,
+    'last_sent': ENGAGEMENT_OPS,
+}
+ENGAGEMENT_FIELDS = {'last_opened', 'last_clicked', 'last_sent'}
+LEGACY_KEYS = {'status', 'tags', 'company_id'}
+
+
+class SegmentError(ValueError):
+    """Raised for a segment filter that cannot be parsed"""
+
+
+def parse_segment(definition):
+    """
+    Parse a filter (JSON string or dict) into a condition tree of
+    ('all', [...]), ('any', [...]), ('not', node) and Condition leaves
+    """
+    if isinstance(definition, str):
+        if not definition.strip():
+            return ('all', [])
+        try:
+            definition = json.loads(definition)
+        except json.JSONDecodeError as e:
+            raise SegmentError(f'Invalid JSON: {e}')
+
+    if not isinstance(definition, dict):
+        raise SegmentError('A segment filter must be a JSON object')
+    if definition and set(definition) <= LEGACY_KEYS:
+        return _parse_legacy(definition)
+    if not definition:
+        return ('all', [])
+    return _parse_node(definition)
+
+
+def _parse_legacy(filters):
+    conditions = []
+    if 'status' in filters:
+        conditions.append(_parse_condition({'field': 'status', 'op': 'eq', 'value': filters['status']}))
+    if 'tags' in filters:
+        conditions.append(_parse_condition({'field': 'tags', 'op': 'has', 'value': filters['tags']}))
+    if 'company_id' in filters:
+        conditions.append(_parse_condition({'field': 'company.id', 'op': 'eq', 'value': filters['company_id']}))
+    return ('all', conditions)
+
+
+def _parse_node(node):
+    if not isinstance(node, dict):
+        raise SegmentError(f'Expected a condition object, got {node!r}')
+
+    for group in ['all', 'any']:
+        if group in node:
+            children = node[group]
+            if not isinstance(children, list):
+                raise SegmentError(f'"{group}" takes a list of conditions')
+            return (group, [_parse_node(child) for child in children])
+    if 'not' in node:
+        return ('not', _parse_node(node['not']))
+    if 'field' in node:
+        return _parse_condition(node)
+    raise SegmentError(f'Unknown condition {node!r}')
+
+
+def _parse_condition(node):
+    field = node.get('field')
+    op = node.get('op', 'eq')
+    value = node.get('value')
+
+    if field not in FIELD_OPS:
+        raise SegmentError(f'Unknown field "{field}"')
+    if op not in FIELD_OPS[field]:
+        raise SegmentError(f'"{field}" does not support "{op}"')
+
+    if field == 'tags':
+        return Condition(field, op, _tag_list(value))
+    if op == 'in':
+        if not isinstance(value, list) or not value:
+            raise SegmentError(f'"{field} in" takes a non-empty list')
+        return Condition(field, op, value)
+    if op == 'is_empty':
+        return Condition(field, op, value is not False)
+    if op in ['ever', 'never']:
+        return Condition(field, op, None)
+    if op == 'within_days':
+        try:
+            days = int(value)
+        except (TypeError, ValueError):
+            raise SegmentError(f'"{field} within_days" takes a number of days')
+        if days <= 0:
+            raise SegmentError(f'"{field} within_days" must be positive')
+        return Condition(field, op, days)
+    if op == 'between':
+        if not isinstance(value, list) or len(value) != 2:
+            raise SegmentError(f'"{field} between" takes [start, end]')
+        return Condition(field, op, (_parse_when(value[0]), _parse_when(value[1], end=True)))
+    if op in ['before', 'after']:
+        return Condition(field, op, _parse_when(value))
+
+    if value is None or isinstance(value, (list, dict)):
+        raise SegmentError(f'"{field} {op}" takes a single value')
+    return Condition(field, op, value)
+
+
+def _tag_list(value):
+    tags = value if isinstance(value, list) else str(value or '').split(',')
+    # Normalized like Tag.normalize so conditions match Tag.name exactly
+    tags = [' '.join(str(tag).split()).lower()[:100] for tag in tags if str(tag).strip()]
+    if not tags:
+        raise SegmentError('Tag conditions need at least one tag')
+    return tags
+
+
+def _parse_when(value, end=False):
+    """Aware datetime for an ISO date/datetime; plain end dates cover the whole day"""
+    text = str(value or '')
+    try:
+        day = parse_date(text)
+        when = None if day is not None else parse_datetime(text)
+    except ValueError:
+        raise SegmentError(f'Invalid date "{value}"')
+    if day is not None:
+        when = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+        if end:
+            when -= timedelta(microseconds=1)
+    elif when is None:
+        raise SegmentError(f'Invalid date "{value}"')
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+def iter_conditions(tree):
+    """Yield every Condition leaf of a parsed tree"""
+    if isinstance(tree, Condition):
+        yield tree
+    elif tree[0] == 'not':
+        yield from iter_conditions(tree[1])
+    else:
+        for child in tree[1]:
+            yield from iter_conditions(child)
+
+
+def is_time_relative(tree):
+    """
+    True if membership can change with the passage of time or with sends
+    alone, so a materialized copy needs periodic refreshing
+    """
+    return any(
+        condition.op == 'within_days' or condition.field == 'last_sent'
+        for condition in iter_conditions(tree)
+    )
+
+
+def uses_engagement(tree):
+    return any(condition.field in ENGAGEMENT_FIELDS for condition in iter_conditions(tree))
+
+
+def validate_segment_filter(value):
+    """Model field validator for segment filter JSON"""
+    try:
+        parse_segment(value)
+    except SegmentError as e:
+        raise ValidationError(str(e))
@@ -0,0 +1,211 @@
+"""
+Compile segment filters into Contact querysets and maintain materialized
+segment membership.
+
+Every condition compiles to an indexed lookup: status and created_at on
+Contact, company fields through the company FK, tags as EXISTS probes on
+the ContactTag (tag, contact) index and engagement as EXISTS probes on the
+EmailLog (contact, <event>_at) indexes.
+
+Materialized segments are rebuilt by set difference (refresh_segment) and
+otherwise kept current incrementally: contact and company saves and first
+opens/clicks re-check just the affected contacts
+(update_contact_memberships), and a contact delete takes one off the
+member_count of its segments (contacts.signals). Segments whose filter
+depends on the clock are refreshed periodically.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from emails.models import EmailLog
+from .models import Contact, ContactTag, Segment, SegmentMembership
+from .segment_filter import Condition, is_time_relative, parse_segment, uses_engagement
+
+ENGAGEMENT_COLUMNS = {
+    'last_opened': 'opened_at',
+    'last_clicked': 'clicked_at',
+    'last_sent': 'sent_at',
+}
+
+
+def _tag_q(tag):
+    return Q(Exists(ContactTag.objects.filter(contact=OuterRef('pk'), tag__name=tag)))
+
+
+def _text_q(lookup, op, value):
+    if op == 'eq':
+        return Q(**{lookup: value})
+    if op == 'ne':
+        return ~Q(**{lookup: value})
+    if op == 'in':
+        return Q(**{f'{lookup}__in': value})
+    if op == 'contains':
+        return Q(**{f'{lookup}__icontains': value})
+    # is_empty
+    empty = Q(**{f'{lookup}__isnull': True})
+    if not lookup.endswith('_id'):
+        empty |= Q(**{lookup: ''})
+    return empty if value else ~empty
+
+
+def _date_q(lookup, op, value, now):
+    if op == 'within_days':
+        return Q(**{f'{lookup}__gte': now - timedelta(days=value)})
+    if op == 'after':
+        return Q(**{f'{lookup}__gte': value})
+    if op == 'before':
+        return Q(**{f'{lookup}__lt': value})
+    start, end = value
+    return Q(**{f'{lookup}__gte': start, f'{lookup}__lte': end})
+
+
+def _engagement_q(field, op, value, now):
+    column = ENGAGEMENT_COLUMNS[field]
+    logs = EmailLog.objects.filter(contact=OuterRef('pk'))
+    ever = Exists(logs.filter(**{f'{column}__isnull': False}))
+
+    if op == 'ever':
+        return Q(ever)
+    if op == 'never':
+        return ~Q(ever)
+    if op == 'within_days':
+        return Q(Exists(logs.filter(**{f'{column}__gte': now - timedelta(days=value)})))
+    if op == 'after':
+        return Q(Exists(logs.filter(**{f'{column}__gte': value})))
+    # before: engaged at some point, but not since value
+    return Q(ever) & ~Q(Exists(logs.filter(**{f'{column}__gte': value})))
+
+
+def _condition_q(condition, now):
+    field, op, value = condition
+
+    if field == 'status':
+        return _text_q('status', op, value)
+    if field == 'tags':
+        if op == 'has':
+            q = Q()
+            for tag in value:
+                q &= _tag_q(tag)
+            return q
+        any_q = Q()
+        for tag in value:
+            any_q |= _tag_q(tag)
+        return any_q if op == 'has_any' else ~any_q
+    if field == 'company.id':
+        return _text_q('company_id', op, value)
+    if field.startswith('company.'):
+        return _text_q(f"company__{field.split('.', 1)[1]}", op, value)
+    if field == 'created_at':
+        return _date_q('created_at', op, value, now)
+    return _engagement_q(field, op, value, now)
+
+
+def _tree_q(tree, now):
+    if isinstance(tree, Condition):
+        return _condition_q(tree, now)
+    kind, children = tree
+    if kind == 'not':
+        return ~_tree_q(children, now)
+
+    q = Q()
+    for child in children:
+        child_q = _tree_q(child, now)
+        q = (q & child_q) if kind == 'all' else (q | child_q)
+    if kind == 'any' and not children:
+        # An empty OR matches nothing
+        return Q(pk__in=[])
+    return q
+
+
+def compile_segment(definition, now=None):
+    """Contact queryset for a segment filter (JSON string, dict or parsed tree)"""
+    tree = definition if isinstance(definition, (tuple, Condition)) else parse_segment(definition)
+    return Contact.objects.filter(_tree_q(tree, now or timezone.now()))
+
+
+def segment_contacts(segment):
+    """Contacts in a segment: membership rows once materialized, else the compiled filter"""
+    if segment.is_ready:
+        return Contact.objects.filter(segment_memberships__segment=segment)
+    return compile_segment(segment.definition)
+
+
+def refresh_segment(segment):
+    """
+    Rebuild a materialized segment's membership: delete members that no
+    longer match, insert matching contacts that are not members yet
+    """
+    matching = compile_segment(segment.definition)
+    members = SegmentMembership.objects.filter(segment=segment)
+    chunk_size = settings.SEGMENT_CHUNK_SIZE
+
+    members.exclude(contact_id__in=matching.values('id')).delete()
+
+    new_ids = matching.exclude(
+        id__in=members.values('contact_id')
+    ).order_by('id').values_list('id', flat=True)
+    cursor = 0
+    while True:
+        chunk = list(new_ids.filter(id__gt=cursor)[:chunk_size])
+        if not chunk:
+            break
+        SegmentMembership.objects.bulk_create(
+            [SegmentMembership(segment=segment, contact_id=contact_id) for contact_id in chunk],
+            ignore_conflicts=True
+        )
+        cursor = chunk[-1]
+
+    member_count = members.count()
+    Segment.objects.filter(id=segment.id).update(member_count=member_count, refreshed_at=timezone.now())
+    return member_count
+
+
+def update_contact_memberships(contact_ids, engagement_only=False):
+    """
+    Re-check contact_ids against every materialized segment and add or
+    remove their membership rows. With engagement_only, segments whose
+    filter has no engagement condition are skipped.
+    """
+    segments = Segment.objects.filter(is_materialized=True, refreshed_at__isnull=False)
+    chunk_size = settings.SEGMENT_CHUNK_SIZE
+    contact_ids = list(contact_ids)
+
+    for segment in segments:
+        tree = parse_segment(segment.definition)
+        if engagement_only and not uses_engagement(tree):
+            continue
+
+        delta = 0
+        for i in range(0, len(contact_ids), chunk_size):
+            chunk = contact_ids[i:i + chunk_size]
+            matching = set(compile_segment(tree).filter(id__in=chunk).values_list('id', flat=True))
+            current = set(SegmentMembership.objects.filter(
+                segment=segment, contact_id__in=chunk
+            ).values_list('contact_id', flat=True))
+
+            removed = current - matching
+            if removed:
+                SegmentMembership.objects.filter(segment=segment, contact_id__in=removed).delete()
+            added = matching - current
+            if added:
+                SegmentMembership.objects.bulk_create(
+                    [SegmentMembership(segment=segment, contact_id=contact_id) for contact_id in added],
+                    ignore_conflicts=True
+                )
+            delta += len(added) - len(removed)
+
+        if delta:
+            Segment.objects.filter(id=segment.id).update(member_count=F('member_count') + delta)
+
+
+def refresh_time_relative_segments():
+    """Refresh materialized segments whose membership moves with the clock"""
+    refreshed = 0
+    for segment in Segment.objects.filter(is_materialized=True):
+        if segment.refreshed_at is None or is_time_relative(parse_segment(segment.definition)):
+            refresh_segment(segment)
+            refreshed += 1
+    return refreshed
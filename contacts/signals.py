@@ -0,0 +1,37 @@
+"""
+Keep materialized segment membership current as contacts and companies
+change, and announce newly added tags (tags_added)
+"""
+from django.db.models import F
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from .models import Company, Contact, Segment
+from .tasks import schedule_membership_update
+
+# Sent by contacts.tags.tag_contacts with added={tag name: [contact ids]}
+# for tags newly added to contacts
+tags_added = Signal()
+
+# Sent with contact_ids for contacts created in bulk (bulk_create skips
+# post_save), e.g. by the CSV importer
+contacts_created = Signal()
+
+
+@receiver(post_save, sender=Contact)
+def contact_saved(sender, instance, **kwargs):
+    schedule_membership_update([instance.id])
+
+
+@receiver(pre_delete, sender=Contact)
+def contact_deleted(sender, instance, **kwargs):
+    # Its membership rows are cascade-deleted with it; keep the counts in step
+    Segment.objects.filter(memberships__contact=instance, member_count__gt=0).update(
+        member_count=F('member_count') - 1
+    )
+
+
+@receiver(post_save, sender=Company)
+def company_saved(sender, instance, created, **kwargs):
+    if not created:
+        schedule_membership_update(instance.contacts.values_list('id', flat=True))
@@ -0,0 +1,105 @@
+"""
+Bulk tag and untag operations on the normalized Tag / ContactTag tables.
+
+Tag names are normalized (see Tag.normalize), so lookups are exact matches
+on the unique Tag.name index and ContactTag (tag, contact) index. Changes
+are written in chunks of set-based inserts and deletes, affected contacts
+are re-checked against materialized segments, and newly added tags send
+the tags_added signal (which fires tag_added workflows).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from crm_project.bulk_insert import db_datetime, insert_ignoring_conflicts
+
+from .models import ContactTag, Tag
+from .signals import tags_added
+from .tasks import schedule_membership_update
+
+
+def normalize_tags(names):
+    """Normalized, de-duplicated tag names from a list or comma-separated string"""
+    if isinstance(names, str):
+        names = names.split(',')
+    tags = []
+    for name in names:
+        name = Tag.normalize(name)
+        if name and name not in tags:
+            tags.append(name)
+    return tags
+
+
+def get_tag_ids(names, create=False):
+    """{name: tag id} for normalized names, creating missing tags if asked"""
+    names = normalize_tags(names)
+    if create and names:
+        Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    return dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+def tag_contacts(contact_ids, names):
+    """
+    Add tags to contacts. Returns {tag name: [contact ids]} for the tags
+    that were newly added (contacts that already had a tag are left alone).
+    """
+    tag_ids = get_tag_ids(names, create=True)
+    contact_ids = list(contact_ids)
+    names_by_id = {tag_id: name for name, tag_id in tag_ids.items()}
+    chunk_size = settings.SEGMENT_CHUNK_SIZE
+    added = {}
+
+    # The tags_added workflow events commit with the rows
+    with transaction.atomic():
+        for i in range(0, len(contact_ids), chunk_size):
+            chunk = contact_ids[i:i + chunk_size]
+            existing = set(ContactTag.objects.filter(
+                contact_id__in=chunk, tag_id__in=tag_ids.values()
+            ).values_list('contact_id', 'tag_id'))
+            now = db_datetime(timezone.now())
+            new_rows = [
+                (contact_id, tag_id, now)
+                for tag_id in tag_ids.values()
+                for contact_id in chunk
+                if (contact_id, tag_id) not in existing
+            ]
+            insert_ignoring_conflicts(ContactTag, ['contact', 'tag', 'created_at'], new_rows)
+            for contact_id, tag_id, _ in new_rows:
+                added.setdefault(names_by_id[tag_id], []).append(contact_id)
+
+        if added:
+            schedule_membership_update({contact_id for ids in added.values() for contact_id in ids})
+            tags_added.send(sender=Tag, added=added)
+    return added
+
+
+def untag_contacts(contact_ids, names):
+    """Remove tags from contacts. Returns the number of tags removed."""
+    tag_ids = list(get_tag_ids(names).values())
+    contact_ids = list(contact_ids)
+    if not tag_ids:
+        return 0
+
+    chunk_size = settings.SEGMENT_CHUNK_SIZE
+    removed = 0
+    changed = set()
+    for i in range(0, len(contact_ids), chunk_size):
+        chunk = contact_ids[i:i + chunk_size]
+        rows = ContactTag.objects.filter(contact_id__in=chunk, tag_id__in=tag_ids)
+        changed.update(rows.values_list('contact_id', flat=True))
+        removed += rows.delete()[0]
+
+    schedule_membership_update(changed)
+    return removed
+
+
+def set_contact_tags(contact, names):
+    """Make a contact's tags exactly names"""
+    names = normalize_tags(names)
+    current = set(contact.tags.values_list('name', flat=True))
+    to_add = [name for name in names if name not in current]
+    to_remove = current - set(names)
+    if to_add:
+        tag_contacts([contact.id], to_add)
+    if to_remove:
+        untag_contacts([contact.id], to_remove)
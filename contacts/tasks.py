@@ -0,0 +1,61 @@
+from celery import shared_task
+from django.db import transaction
+
+from .models import ContactImport, Segment
+from .segments import refresh_segment, refresh_time_relative_segments, update_contact_memberships
+
+
+def schedule_membership_update(contact_ids, engagement_only=False):
+    """
+    Queue an update of contact_ids' segment memberships once the current
+    transaction commits. Does nothing while no segment is materialized.
+    """
+    contact_ids = list(contact_ids)
+    if not contact_ids or not Segment.objects.filter(is_materialized=True).exists():
+        return
+    transaction.on_commit(
+        lambda: update_segment_memberships_task.delay(contact_ids, engagement_only)
+    )
+
+
+@shared_task
+def update_segment_memberships_task(contact_ids, engagement_only=False):
+    """
+    Re-check changed contacts against materialized segments
+    """
+    update_contact_memberships(contact_ids, engagement_only)
+    return f"Updated segment memberships for {len(contact_ids)} contacts"
+
+
+@shared_task
+def refresh_segment_task(segment_id):
+    """
+    Rebuild one materialized segment's membership
+    """
+    segment = Segment.objects.get(id=segment_id)
+    member_count = refresh_segment(segment)
+    return f"Segment {segment.name} has {member_count} members"
+
+
+@shared_task
+def refresh_time_relative_segments_task():
+    """
+    Refresh materialized segments with date-relative conditions
+    Runs every 15 minutes via Celery Beat
+    """
+    refreshed = refresh_time_relative_segments()
+    return f"Refreshed {refreshed} segments"
+
+
+@shared_task
+def import_contacts_task(import_id):
+    """
+    Import an uploaded contacts CSV in the background
+    """
+    from .importer import run_import
+    
+    contact_import = run_import(ContactImport.objects.get(id=import_id))
+    return (
+        f"Import {contact_import.id} {contact_import.status}: {contact_import.imported_count} imported, "
+        f"{contact_import.duplicate_count} duplicates, {contact_import.error_count} errors"
+    )
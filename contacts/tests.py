@@ -1,3 +1,246 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from emails.models import EmailLog
+from .importer import run_import
+from .models import Company, Contact, ContactImport, ContactTag, Segment, SegmentMembership, Tag
+from .segment_filter import SegmentError, parse_segment
+from .segments import compile_segment, refresh_segment, update_contact_memberships
+from .signals import tags_added
+from .tags import set_contact_tags, tag_contacts, untag_contacts
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContactImportTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.addClassCleanup(shutil.rmtree, MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+        Contact.objects.create(first_name='Old', last_name='Contact', email='old@acme.com')
+
+    def import_csv(self, data):
+        contact_import = ContactImport(original_name='contacts.csv', created_by=self.user)
+        contact_import.file.save('contacts.csv', ContentFile(data))
+        self.path = contact_import.file.path
+        return contact_import
+
+    def test_import(self):
+        contact_import = run_import(self.import_csv(
+            b'Email,First_Name,Last_Name,Status,Tags,Company_Domain,Company\n'
+            b'Ann@Acme.com,Ann,Lee,customer,"VIP, sales",acme.com,Acme\n'
+            b'OLD@acme.com,Old,Again,,,,\n'
+            b'not-an-email,Bad,Row,,,,\n'
+        ))
+        self.assertEqual(contact_import.status, 'completed')
+        self.assertEqual(
+            (contact_import.imported_count, contact_import.duplicate_count, contact_import.error_count), (1, 1, 1)
+        )
+        ann = Contact.objects.get(email='ann@acme.com')
+        self.assertEqual((ann.first_name, ann.status, ann.assigned_to), ('Ann', 'customer', self.user))
+        self.assertEqual(ann.company, Company.objects.get(domain='acme.com'))
+        self.assertEqual(ann.tag_names, ['sales', 'vip'])
+        self.assertIsNotNone(ann.created_at)
+        self.assertEqual(contact_import.errors.get().row_number, 4)
+
+    def test_file_is_deleted(self):
+        contact_import = run_import(self.import_csv(b'email\nann@acme.com\n'))
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(contact_import.file.name, '')
+
+    def test_missing_email_column_fails(self):
+        contact_import = run_import(self.import_csv(b'name\nAnn\n'))
+        self.assertEqual(contact_import.status, 'failed')
+        self.assertIn('email', contact_import.error_message)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_unexpected_error_fails_the_import(self):
+        contact_import = self.import_csv(b'email\nann@acme.com\n')
+        with mock.patch('contacts.importer.import_chunk', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                run_import(contact_import)
+        contact_import.refresh_from_db()
+        self.assertEqual(contact_import.status, 'failed')
+        self.assertEqual(contact_import.error_message, 'Import failed: disk full')
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TagTests(TestCase):
+
+    def setUp(self):
+        self.ann = Contact.objects.create(first_name='Ann', last_name='Lee', email='ann@acme.com')
+        self.bob = Contact.objects.create(first_name='Bob', last_name='Ray', email='bob@acme.com')
+        self.sent = []
+        tags_added.connect(self.record, sender=Tag)
+        self.addCleanup(tags_added.disconnect, self.record, sender=Tag)
+
+    def record(self, sender, added, **kwargs):
+        self.sent.append(added)
+
+    def test_tag_contacts(self):
+        added = tag_contacts([self.ann.id, self.bob.id], ' VIP ,sales,vip')
+        self.assertEqual(added, {'vip': [self.ann.id, self.bob.id], 'sales': [self.ann.id, self.bob.id]})
+        self.assertEqual(self.ann.tag_names, ['sales', 'vip'])
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(self.sent, [added])
+
+    def test_existing_tags_are_not_added_again(self):
+        tag_contacts([self.ann.id], ['vip'])
+        added = tag_contacts([self.ann.id, self.bob.id], ['vip'])
+        self.assertEqual(added, {'vip': [self.bob.id]})
+        self.assertEqual(ContactTag.objects.count(), 2)
+        self.assertEqual(self.sent[-1], {'vip': [self.bob.id]})
+
+    def test_no_signal_without_new_tags(self):
+        tag_contacts([self.ann.id], ['vip'])
+        self.assertEqual(tag_contacts([self.ann.id], ['VIP']), {})
+        self.assertEqual(tag_contacts([self.ann.id], ['  ']), {})
+        self.assertEqual(len(self.sent), 1)
+
+    def test_untag_contacts(self):
+        tag_contacts([self.ann.id, self.bob.id], ['vip', 'sales'])
+        self.assertEqual(untag_contacts([self.ann.id, self.bob.id], ['VIP', 'unknown']), 2)
+        self.assertEqual(self.ann.tag_names, ['sales'])
+        self.assertEqual(untag_contacts([self.ann.id], ['unknown']), 0)
+
+    def test_set_contact_tags(self):
+        tag_contacts([self.ann.id], ['vip', 'sales'])
+        set_contact_tags(self.ann, 'sales, Partner')
+        self.assertEqual(self.ann.tag_names, ['partner', 'sales'])
+        self.assertEqual(self.sent[-1], {'partner': [self.ann.id]})
+
+
+class SegmentFilterTests(TestCase):
+
+    def setUp(self):
+        acme = Company.objects.create(name='Acme Corp', domain='acme.com')
+        self.ann = Contact.objects.create(first_name='Ann', last_name='Lee', email='ann@acme.com', status='lead', company=acme)
+        self.bob = Contact.objects.create(first_name='Bob', last_name='Ray', email='bob@acme.com', status='customer', company=acme)
+        self.cat = Contact.objects.create(first_name='Cat', last_name='Fox', email='cat@example.com', status='lead')
+        tag_contacts([self.ann.id, self.bob.id], ['vip'])
+        tag_contacts([self.ann.id], ['sales'])
+
+    def matching(self, definition):
+        return set(compile_segment(definition).values_list('first_name', flat=True))
+
+    def test_groups(self):
+        lead = {'field': 'status', 'op': 'eq', 'value': 'lead'}
+        vip = {'field': 'tags', 'op': 'has', 'value': ['vip']}
+        self.assertEqual(self.matching({'all': [lead, vip]}), {'Ann'})
+        self.assertEqual(self.matching({'any': [lead, vip]}), {'Ann', 'Bob', 'Cat'})
+        self.assertEqual(self.matching({'not': lead}), {'Bob'})
+        self.assertEqual(self.matching({'all': [lead, {'not': vip}]}), {'Cat'})
+        self.assertEqual(self.matching({'all': []}), {'Ann', 'Bob', 'Cat'})
+        self.assertEqual(self.matching({'any': []}), set())
+
+    def test_tags(self):
+        self.assertEqual(self.matching({'field': 'tags', 'op': 'has', 'value': ['vip', 'sales']}), {'Ann'})
+        self.assertEqual(self.matching({'field': 'tags', 'op': 'has_any', 'value': 'Sales, missing'}), {'Ann'})
+        self.assertEqual(self.matching({'field': 'tags', 'op': 'has_none', 'value': ['vip']}), {'Cat'})
+
+    def test_company_fields(self):
+        self.assertEqual(self.matching({'field': 'company.name', 'op': 'contains', 'value': 'acme'}), {'Ann', 'Bob'})
+        self.assertEqual(self.matching({'field': 'company.industry', 'op': 'is_empty'}), {'Ann', 'Bob', 'Cat'})
+        self.assertEqual(self.matching({'field': 'company.id', 'op': 'is_empty'}), {'Cat'})
+        self.assertEqual(self.matching({'field': 'company.id', 'op': 'is_empty', 'value': False}), {'Ann', 'Bob'})
+
+    def test_created_within_days(self):
+        Contact.objects.filter(id=self.bob.id).update(created_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(self.matching({'field': 'created_at', 'op': 'within_days', 'value': 7}), {'Ann', 'Cat'})
+
+    def test_engagement(self):
+        now = timezone.now()
+        EmailLog.objects.create(contact=self.ann, status='sent', sent_at=now, opened_at=now - timedelta(days=2))
+        EmailLog.objects.create(contact=self.bob, status='sent', sent_at=now, opened_at=now - timedelta(days=60))
+        EmailLog.objects.create(contact=self.cat, status='sent', sent_at=now)
+
+        self.assertEqual(self.matching({'field': 'last_opened', 'op': 'ever'}), {'Ann', 'Bob'})
+        self.assertEqual(self.matching({'field': 'last_opened', 'op': 'never'}), {'Cat'})
+        self.assertEqual(self.matching({'field': 'last_opened', 'op': 'within_days', 'value': 30}), {'Ann'})
+        before = (now - timedelta(days=30)).date().isoformat()
+        self.assertEqual(self.matching({'field': 'last_opened', 'op': 'before', 'value': before}), {'Bob'})
+        self.assertEqual(self.matching({'field': 'last_clicked', 'op': 'ever'}), set())
+
+    def test_legacy_flat_form(self):
+        self.assertEqual(self.matching('{"status": "lead", "tags": "vip"}'), {'Ann'})
+        self.assertEqual(self.matching(''), {'Ann', 'Bob', 'Cat'})
+
+    def test_invalid_filters(self):
+        for definition in [
+            '{"all": ',
+            '[]',
+            {'field': 'phone', 'op': 'eq', 'value': '1'},
+            {'field': 'status', 'op': 'contains', 'value': 'le'},
+            {'field': 'status', 'op': 'in', 'value': []},
+            {'field': 'created_at', 'op': 'within_days', 'value': 0},
+            {'field': 'created_at', 'op': 'after', 'value': 'yesterday'},
+            {'any': {'field': 'status', 'value': 'lead'}},
+        ]:
+            with self.subTest(definition=definition):
+                with self.assertRaises(SegmentError):
+                    parse_segment(definition)
+
+
+class SegmentMembershipTests(TestCase):
+
+    def setUp(self):
+        self.ann = Contact.objects.create(first_name='Ann', last_name='Lee', email='ann@acme.com', status='lead')
+        self.bob = Contact.objects.create(first_name='Bob', last_name='Ray', email='bob@acme.com', status='customer')
+        self.segment = Segment.objects.create(
+            name='Leads', is_materialized=True,
+            definition='{"all": [{"field": "status", "op": "eq", "value": "lead"}]}'
+        )
+
+    def members(self):
+        self.segment.refresh_from_db()
+        return set(
+            SegmentMembership.objects.filter(segment=self.segment).values_list('contact__first_name', flat=True)
+        ), self.segment.member_count
+
+    def test_refresh(self):
+        self.assertEqual(refresh_segment(self.segment), 1)
+        self.assertEqual(self.members(), ({'Ann'}, 1))
+
+        Contact.objects.filter(id=self.ann.id).update(status='customer')
+        Contact.objects.filter(id=self.bob.id).update(status='lead')
+        refresh_segment(self.segment)
+        self.assertEqual(self.members(), ({'Bob'}, 1))
+
+    def test_incremental_update(self):
+        refresh_segment(self.segment)
+        Contact.objects.filter(id=self.ann.id).update(status='customer')
+        Contact.objects.filter(id=self.bob.id).update(status='lead')
+        cat = Contact.objects.create(first_name='Cat', last_name='Fox', email='cat@example.com', status='lead')
+
+        update_contact_memberships([self.ann.id, self.bob.id, cat.id])
+        self.assertEqual(self.members(), ({'Bob', 'Cat'}, 2))
+
+    def test_unrefreshed_segments_are_skipped(self):
+        update_contact_memberships([self.ann.id])
+        self.assertEqual(self.members(), (set(), 0))
+
+    def test_engagement_only_skips_other_segments(self):
+        refresh_segment(self.segment)
+        Contact.objects.filter(id=self.bob.id).update(status='lead')
+        update_contact_memberships([self.bob.id], engagement_only=True)
+        self.assertEqual(self.members(), ({'Ann'}, 1))
+
+    def test_delete_decrements_member_count(self):
+        refresh_segment(self.segment)
+        self.ann.delete()
+        self.bob.delete()
+        self.assertEqual(self.members(), (set(), 0))
@@ -6,19 +6,33 @@ app_name = 'contacts'
 urlpatterns = [
     # Contacts
     path('', views.ContactListView.as_view(), name='contact_list'),
+    path('export/', views.ContactExportView.as_view(), name='contact_export'),
     path('create/', views.ContactCreateView.as_view(), name='contact_create'),
     path('<int:pk>/', views.ContactDetailView.as_view(), name='contact_detail'),
     path('<int:pk>/edit/', views.ContactUpdateView.as_view(), name='contact_update'),
     path('<int:pk>/delete/', views.ContactDeleteView.as_view(), name='contact_delete'),
     path('<int:contact_id>/activity/create/', views.ActivityCreateView.as_view(), name='activity_create'),
+    path('bulk-tag/', views.ContactBulkTagView.as_view(), name='contact_bulk_tag'),
     
     # Companies
     path('companies/', views.CompanyListView.as_view(), name='company_list'),
+    path('companies/export/', views.CompanyExportView.as_view(), name='company_export'),
     path('companies/create/', views.CompanyCreateView.as_view(), name='company_create'),
     path('companies/<int:pk>/', views.CompanyDetailView.as_view(), name='company_detail'),
     path('companies/<int:pk>/edit/', views.CompanyUpdateView.as_view(), name='company_update'),
     path('companies/<int:pk>/delete/', views.CompanyDeleteView.as_view(), name='company_delete'),
     
+    # Segments
+    path('segments/', views.SegmentListView.as_view(), name='segment_list'),
+    path('segments/create/', views.SegmentCreateView.as_view(), name='segment_create'),
+    path('segments/preview/', views.SegmentPreviewView.as_view(), name='segment_preview'),
+    path('segments/<int:pk>/', views.SegmentDetailView.as_view(), name='segment_detail'),
+    path('segments/<int:pk>/edit/', views.SegmentUpdateView.as_view(), name='segment_update'),
+    path('segments/<int:pk>/delete/', views.SegmentDeleteView.as_view(), name='segment_delete'),
+    path('segments/<int:pk>/refresh/', views.SegmentRefreshView.as_view(), name='segment_refresh'),
+    
     # Import
     path('import/', views.ContactImportView.as_view(), name='contact_import'),
+    path('import/<int:pk>/', views.ContactImportDetailView.as_view(), name='contact_import_detail'),
+    path('import/<int:pk>/status/', views.ContactImportStatusView.as_view(), name='contact_import_status'),
 ]
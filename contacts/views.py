@@ -1,14 +1,22 @@
-from django.shortcuts import render, redirect
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from collections import defaultdict
+
+from django import forms
+from django.shortcuts import redirect
+from django.views.generic import View, ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.http import JsonResponse
-from django.db.models import Q
-import csv
-from io import TextIOWrapper
-
-from .models import Contact, Company, Activity
+from django.db import transaction
+from django.db.models import ProtectedError
+
+from .models import Contact, Company, Activity, Segment, Tag, ContactTag, ContactImport
+from .segment_filter import SegmentError
+from .segments import compile_segment, segment_contacts
+from .tags import normalize_tags, set_contact_tags, tag_contacts, untag_contacts
+from .tasks import import_contacts_task, refresh_segment_task
 from deals.models import Deal
+from search.index import matching_ids
+from crm_project.exports import ExportMixin
 
 
 class ContactListView(LoginRequiredMixin, ListView):
@@ -19,26 +27,22 @@ class ContactListView(LoginRequiredMixin, ListView):
     paginate_by = 20
 
     def get_queryset(self):
-        queryset = Contact.objects.select_related('company', 'assigned_to')
+        queryset = Contact.objects.select_related('company', 'assigned_to').prefetch_related('tags')
         
         # Search
         search = self.request.GET.get('search', '')
         if search:
-            queryset = queryset.filter(
-                Q(first_name__icontains=search) |
-                Q(last_name__icontains=search) |
-                Q(email__icontains=search)
-            )
+            queryset = queryset.filter(id__in=matching_ids('contact', search))
         
         # Filter by status
         status = self.request.GET.get('status', '')
         if status:
             queryset = queryset.filter(status=status)
         
-        # Filter by tags
-        tags = self.request.GET.get('tags', '')
-        if tags:
-            queryset = queryset.filter(tags__icontains=tags)
+        # Filter by tag (exact match on the normalized name)
+        tag = Tag.normalize(self.request.GET.get('tags', ''))
+        if tag:
+            queryset = queryset.filter(contact_tags__tag__name=tag)
         
         return queryset.order_by('-created_at')
 
@@ -48,6 +52,32 @@ class ContactListView(LoginRequiredMixin, ListView):
         return context
 
 
+class ContactExportView(ExportMixin, ContactListView):
+    """Stream the filtered contact list as CSV or JSON Lines"""
+    export_name = 'contacts'
+    export_columns = [
+        ('id', 'id'),
+        ('first_name', 'first_name'),
+        ('last_name', 'last_name'),
+        ('email', 'email'),
+        ('phone', 'phone'),
+        ('status', 'status'),
+        ('company', 'company__name'),
+        ('assigned_to', 'assigned_to__username'),
+        ('created_at', 'created_at'),
+    ]
+    export_extra_headers = ['tags']
+
+    def export_chunk(self, rows):
+        # One query per chunk for the tags of its contacts
+        tags = defaultdict(list)
+        for contact_id, name in ContactTag.objects.filter(
+            contact_id__in=[row[0] for row in rows]
+        ).order_by('tag__name').values_list('contact_id', 'tag__name'):
+            tags[contact_id].append(name)
+        return [row + (','.join(tags[row[0]]),) for row in rows]
+
+
 class ContactDetailView(LoginRequiredMixin, DetailView):
     """Contact detail view with activities and deals"""
     model = Contact
@@ -63,11 +93,28 @@ class ContactDetailView(LoginRequiredMixin, DetailView):
         return context
 
 
-class ContactCreateView(LoginRequiredMixin, CreateView):
+class ContactFormMixin:
+    """Edit a contact's tags as one comma-separated field"""
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        form.fields['tags'] = forms.CharField(required=False, help_text='Comma-separated tags')
+        if self.object:
+            form.fields['tags'].initial = ', '.join(self.object.tag_names)
+        return form
+
+    def form_valid(self, form):
+        with transaction.atomic():
+            response = super().form_valid(form)
+            set_contact_tags(self.object, form.cleaned_data['tags'])
+        return response
+
+
+class ContactCreateView(LoginRequiredMixin, ContactFormMixin, CreateView):
     """Create a new contact"""
     model = Contact
     template_name = 'contacts/contact_form.html'
-    fields = ['first_name', 'last_name', 'email', 'phone', 'company', 'status', 'tags', 'notes']
+    fields = ['first_name', 'last_name', 'email', 'phone', 'company', 'status', 'notes']
     success_url = reverse_lazy('contacts:contact_list')
 
     def form_valid(self, form):
@@ -75,14 +122,42 @@ class ContactCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class ContactUpdateView(LoginRequiredMixin, UpdateView):
+class ContactUpdateView(LoginRequiredMixin, ContactFormMixin, UpdateView):
     """Update contact details"""
     model = Contact
     template_name = 'contacts/contact_form.html'
-    fields = ['first_name', 'last_name', 'email', 'phone', 'company', 'status', 'tags', 'notes', 'assigned_to']
+    fields = ['first_name', 'last_name', 'email', 'phone', 'company', 'status', 'notes', 'assigned_to']
     success_url = reverse_lazy('contacts:contact_list')
 
 
+class ContactBulkTagView(LoginRequiredMixin, View):
+    """Add or remove tags on selected contacts (via AJAX)"""
+
+    def post(self, request, *args, **kwargs):
+        tags = normalize_tags(request.POST.get('tags', ''))
+        contact_ids = list(Contact.objects.filter(
+            id__in=[value for value in request.POST.getlist('contact_ids') if value.isdigit()]
+        ).values_list('id', flat=True))
+        
+        if not contact_ids or not tags:
+            return JsonResponse({
+                'success': False,
+                'message': 'Select contacts and enter at least one tag'
+            })
+        
+        if request.POST.get('action') == 'remove':
+            removed = untag_contacts(contact_ids, tags)
+            message = f'Removed {removed} tags'
+        else:
+            added = tag_contacts(contact_ids, tags)
+            message = f'Added {sum(len(ids) for ids in added.values())} tags'
+        
+        return JsonResponse({
+            'success': True,
+            'message': message
+        })
+
+
 class ContactDeleteView(LoginRequiredMixin, DeleteView):
     """Delete a contact"""
     model = Contact
@@ -127,14 +202,25 @@ class CompanyListView(LoginRequiredMixin, ListView):
         
         search = self.request.GET.get('search', '')
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(domain__icontains=search)
-            )
+            queryset = queryset.filter(id__in=matching_ids('company', search))
         
         return queryset.order_by('-created_at')
 
 
+class CompanyExportView(ExportMixin, CompanyListView):
+    """Stream the filtered company list as CSV or JSON Lines"""
+    export_name = 'companies'
+    export_columns = [
+        ('id', 'id'),
+        ('name', 'name'),
+        ('domain', 'domain'),
+        ('industry', 'industry'),
+        ('size', 'size'),
+        ('contact_count', 'contact_count'),
+        ('created_at', 'created_at'),
+    ]
+
+
 class CompanyDetailView(LoginRequiredMixin, DetailView):
     """Company detail with associated contacts"""
     model = Company
@@ -172,46 +258,191 @@ class CompanyDeleteView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('contacts:company_list')
 
 
-class ContactImportView(LoginRequiredMixin, CreateView):
-    """Import contacts from CSV"""
-    model = Contact
+class SegmentListView(LoginRequiredMixin, ListView):
+    """List saved segments"""
+    model = Segment
+    template_name = 'contacts/segment_list.html'
+    context_object_name = 'segments'
+    paginate_by = 20
+
+    def get_queryset(self):
+        return Segment.objects.select_related('created_by')
+
+
+class SegmentDetailView(LoginRequiredMixin, DetailView):
+    """Segment detail with audience size and a sample of members"""
+    model = Segment
+    template_name = 'contacts/segment_detail.html'
+    context_object_name = 'segment'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        segment = self.object
+        contacts = segment_contacts(segment)
+        context['member_count'] = segment.member_count if segment.is_ready else contacts.count()
+        context['members'] = contacts.select_related('company')[:50]
+        context['campaigns'] = segment.campaigns.all()
+        return context
+
+
+class SegmentFormMixin:
+    """Materialize or drop a segment's membership after it is saved"""
+
+    def form_valid(self, form):
+        if 'definition' in form.changed_data:
+            # The members were built from the old definition; saving this
+            # with the definition makes reads use the live filter until the
+            # refresh has rebuilt them
+            form.instance.refreshed_at = None
+        response = super().form_valid(form)
+        segment = self.object
+        if segment.is_materialized:
+            refresh_segment_task.delay(segment.id)
+        else:
+            segment.memberships.all().delete()
+            Segment.objects.filter(id=segment.id).update(member_count=0, refreshed_at=None)
+        return response
+
+    def get_success_url(self):
+        return reverse_lazy('contacts:segment_detail', kwargs={'pk': self.object.id})
+
+
+class SegmentCreateView(LoginRequiredMixin, SegmentFormMixin, CreateView):
+    """Create a new segment"""
+    model = Segment
+    template_name = 'contacts/segment_form.html'
+    fields = ['name', 'description', 'definition', 'is_materialized']
+
+    def form_valid(self, form):
+        form.instance.created_by = self.request.user
+        return super().form_valid(form)
+
+
+class SegmentUpdateView(LoginRequiredMixin, SegmentFormMixin, UpdateView):
+    """Update a segment"""
+    model = Segment
+    template_name = 'contacts/segment_form.html'
+    fields = ['name', 'description', 'definition', 'is_materialized']
+
+
+class SegmentDeleteView(LoginRequiredMixin, DeleteView):
+    """Delete a segment"""
+    model = Segment
+    template_name = 'contacts/segment_confirm_delete.html'
+    success_url = reverse_lazy('contacts:segment_list')
+
+    def form_valid(self, form):
+        try:
+            return super().form_valid(form)
+        except ProtectedError:
+            return self.render_to_response(self.get_context_data(
+                error='This segment is the audience of a campaign and cannot be deleted.'
+            ))
+
+
+class SegmentRefreshView(LoginRequiredMixin, UpdateView):
+    """Rebuild a materialized segment's membership"""
+    model = Segment
+    fields = ['is_materialized']
+
+    def post(self, request, *args, **kwargs):
+        segment = self.get_object()
+        
+        if not segment.is_materialized:
+            return JsonResponse({
+                'success': False,
+                'message': 'Segment is not materialized'
+            })
+        
+        refresh_segment_task.delay(segment.id)
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Segment refresh queued'
+        })
+
+
+class SegmentPreviewView(LoginRequiredMixin, View):
+    """Count and sample the contacts matching a segment filter"""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            contacts = compile_segment(request.GET.get('definition', ''))
+        except SegmentError as e:
+            return JsonResponse({'success': False, 'message': str(e)})
+        
+        sample = contacts.order_by('id')[:10]
+        return JsonResponse({
+            'success': True,
+            'count': contacts.count(),
+            'contacts': [
+                {'id': contact.id, 'name': contact.full_name, 'email': contact.email}
+                for contact in sample
+            ],
+        })
+
+
+class ContactImportView(LoginRequiredMixin, ListView):
+    """Upload a contacts CSV to import in the background"""
+    model = ContactImport
     template_name = 'contacts/contact_import.html'
+    context_object_name = 'imports'
+
+    def get_queryset(self):
+        return ContactImport.objects.filter(created_by=self.request.user)[:10]
 
     def post(self, request, *args, **kwargs):
         if 'csv_file' not in request.FILES:
             return redirect('contacts:contact_list')
         
         csv_file = request.FILES['csv_file']
-        csv_content = TextIOWrapper(csv_file.file, encoding='utf-8')
-        reader = csv.DictReader(csv_content)
-        
-        imported_count = 0
-        errors = []
-        
-        for row in reader:
-            try:
-                contact, created = Contact.objects.get_or_create(
-                    email=row.get('email', ''),
-                    defaults={
-                        'first_name': row.get('first_name', ''),
-                        'last_name': row.get('last_name', ''),
-                        'phone': row.get('phone', ''),
-                        'status': row.get('status', 'lead'),
-                        'tags': row.get('tags', ''),
-                        'assigned_to': request.user,
-                    }
-                )
-                if created:
-                    imported_count += 1
-            except Exception as e:
-                errors.append(f"Row {reader.line_num}: {str(e)}")
-        
-        context = {
-            'imported_count': imported_count,
-            'errors': errors,
-        }
+        contact_import = ContactImport.objects.create(
+            file=csv_file,
+            original_name=csv_file.name[:255],
+            file_size=csv_file.size,
+            created_by=request.user,
+        )
+        transaction.on_commit(lambda: import_contacts_task.delay(contact_import.id))
         
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return JsonResponse(context)
+            return JsonResponse({
+                'success': True,
+                'import_id': contact_import.id,
+                'status_url': reverse('contacts:contact_import_status', kwargs={'pk': contact_import.id}),
+            })
         
-        return render(request, 'contacts/contact_import.html', context)
+        return redirect('contacts:contact_import_detail', pk=contact_import.id)
+
+
+class ContactImportDetailView(LoginRequiredMixin, DetailView):
+    """Progress and errors of one import"""
+    template_name = 'contacts/contact_import_detail.html'
+    context_object_name = 'contact_import'
+
+    def get_queryset(self):
+        return ContactImport.objects.filter(created_by=self.request.user)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['errors'] = self.object.errors.all()[:100]
+        return context
+
+
+class ContactImportStatusView(ContactImportDetailView):
+    """Import progress for polling (JSON)"""
+
+    def get(self, request, *args, **kwargs):
+        contact_import = self.get_object()
+        return JsonResponse({
+            'status': contact_import.status,
+            'progress': contact_import.progress,
+            'processed_rows': contact_import.processed_rows,
+            'imported_count': contact_import.imported_count,
+            'duplicate_count': contact_import.duplicate_count,
+            'error_count': contact_import.error_count,
+            'error_message': contact_import.error_message,
+            'errors': [
+                {'row': error.row_number, 'message': error.message}
+                for error in contact_import.errors.all()[:100]
+            ],
+        })
@@ -0,0 +1,50 @@
+"""
+Conflict-ignoring multi-row INSERTs for bulk loads.
+
+QuerySet.bulk_create runs every value of every row through its field and
+the SQL compiler, which costs more than the database work on a large
+import. insert_ignoring_conflicts() takes rows that already hold
+database-ready values and writes each batch of them with one plain
+INSERT, as many rows per statement as the backend's parameter limit
+allows. Rows that would break a unique constraint are skipped, like
+bulk_create(ignore_conflicts=True). No signals are sent and no ids are
+returned.
+"""
+from django.db import connection
+from django.db.models.constants import OnConflict
+
+MAX_ROWS_PER_INSERT = 1000
+
+
+def insert_ignoring_conflicts(model, field_names, rows):
+    """
+    Insert rows, tuples of database-ready values (see db_datetime) in the
+    order of field_names, into model's table. Returns the number of rows
+    sent to the database.
+    """
+    if not rows:
+        return 0
+
+    ops = connection.ops
+    fields = [model._meta.get_field(name) for name in field_names]
+    columns = ', '.join(ops.quote_name(field.column) for field in fields)
+    row_sql = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    rows_per_insert = min(
+        MAX_ROWS_PER_INSERT, (connection.features.max_query_params or MAX_ROWS_PER_INSERT * len(fields)) // len(fields)
+    )
+    prefix = f'{ops.insert_statement(on_conflict=OnConflict.IGNORE)} {ops.quote_name(model._meta.db_table)} ({columns}) VALUES '
+    suffix = ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None)
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), rows_per_insert):
+            batch = rows[i:i + rows_per_insert]
+            cursor.execute(
+                f"{prefix}{', '.join([row_sql] * len(batch))} {suffix}",
+                [value for row in batch for value in row]
+            )
+    return len(rows)
+
+
+def db_datetime(value):
+    """A datetime as the database driver takes it, to repeat across many rows"""
+    return connection.ops.adapt_datetimefield_value(value)
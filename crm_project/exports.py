@@ -0,0 +1,136 @@
+"""
+Streaming CSV / JSON Lines exports of list views.
+
+An export view subclasses a list view and keeps its get_queryset(), so an
+export holds exactly the rows the list shows for the same query string.
+Rows are read as tuples with values_list().iterator(chunk_size=...) (a
+server-side cursor on PostgreSQL) and written out one chunk at a time, so
+memory stays flat however many rows match. Output is plain UTF-8 lines;
+responses are gzipped on the fly when the client accepts it.
+"""
+import csv
+import re
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+from django.utils.text import compress_sequence
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Export name -> view, for the export_data command
+EXPORT_VIEWS = {
+    'contacts': 'contacts.views.ContactExportView',
+    'companies': 'contacts.views.CompanyExportView',
+    'deals': 'deals.views.DealExportView',
+    'email_logs': 'emails.views.EmailLogExportView',
+}
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+class LineBuffer:
+    """File-like sink for csv.writer that hands each line back"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def iter_chunks(queryset, lookups, chunk_size=None):
+    """Yield lists of value tuples for lookups, chunk_size rows at a time"""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    rows = queryset.prefetch_related(None).values_list(*lookups).iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_lines(headers, chunks):
+    """Encoded CSV: the header line, then one block of lines per chunk"""
+    writer = csv.writer(LineBuffer())
+    yield writer.writerow(headers).encode()
+    for chunk in chunks:
+        yield ''.join(writer.writerow([_csv_cell(value) for value in row]) for row in chunk).encode()
+
+
+def jsonl_lines(headers, chunks):
+    """Encoded JSON Lines: one object per row, one block per chunk"""
+    encoder = DjangoJSONEncoder()
+    for chunk in chunks:
+        yield ''.join(encoder.encode(dict(zip(headers, row))) + '\n' for row in chunk).encode()
+
+
+class ExportMixin:
+    """
+    Turn a list view into a streaming export of its queryset.
+
+    export_columns is a list of (header, lookup) pairs read with
+    values_list(); export_extra_headers name columns that export_chunk()
+    appends to each chunk of rows (for values that need a second query,
+    like a contact's tags).
+    """
+    export_name = None
+    export_columns = []
+    export_extra_headers = []
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in FORMATS:
+            return HttpResponseBadRequest(f'Unknown export format "{export_format}"')
+
+        content = self.export_lines(export_format)
+        gzipped = bool(ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+        if gzipped:
+            content = compress_sequence(content)
+
+        response = StreamingHttpResponse(content, content_type=FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{self.export_filename(export_format)}"'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        return response
+
+    def export_filename(self, export_format):
+        return f'{self.export_name}-{timezone.now():%Y%m%d-%H%M%S}.{export_format}'
+
+    def export_headers(self):
+        return [header for header, _ in self.export_columns] + list(self.export_extra_headers)
+
+    def export_chunk(self, rows):
+        """Hook to add export_extra_headers values to a chunk of rows"""
+        return rows
+
+    def export_lines(self, export_format):
+        """Encoded lines of the export, produced lazily"""
+        lookups = [lookup for _, lookup in self.export_columns]
+        chunks = (self.export_chunk(rows) for rows in iter_chunks(self.get_queryset(), lookups))
+        if export_format == 'jsonl':
+            return jsonl_lines(self.export_headers(), chunks)
+        return csv_lines(self.export_headers(), chunks)
+
+
+def get_export_view(name, request):
+    """Export view instance for name, set up for request (filters in request.GET)"""
+    view = import_string(EXPORT_VIEWS[name])()
+    view.setup(request)
+    return view
@@ -68,6 +68,7 @@ INSTALLED_APPS = [
     'emails',
     'automations',
     'dashboard',
+    'search',
 ]
 
 MIDDLEWARE = [
@@ -212,13 +213,113 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'apikey'
 EMAIL_HOST_PASSWORD = os.getenv('SENDGRID_API_KEY', '')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@crm.example.com')
+# Pooled backend connection per worker (emails/smtp_pool.py)
+EMAIL_SMTP_MAX_IDLE = int(os.getenv('EMAIL_SMTP_MAX_IDLE', 30))  # seconds before reconnecting
+EMAIL_SMTP_MAX_MESSAGES = int(os.getenv('EMAIL_SMTP_MAX_MESSAGES', 500))  # per connection
 
 # SendGrid API Key
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY', '')
+# Override to point at a local fake server (manage.py run_fake_sendgrid)
+SENDGRID_API_HOST = os.getenv('SENDGRID_API_HOST', 'https://api.sendgrid.com')
+# Recipients (personalizations) per mail/send request; SendGrid allows 1000
+SENDGRID_BATCH_SIZE = int(os.getenv('SENDGRID_BATCH_SIZE', 1000))
+SENDGRID_TIMEOUT = int(os.getenv('SENDGRID_TIMEOUT', 30))
+# Seconds to wait before resending after a 429/5xx without a Retry-After header
+SENDGRID_RETRY_AFTER = int(os.getenv('SENDGRID_RETRY_AFTER', 60))
+# 'batch': one blocking request per SENDGRID_BATCH_SIZE recipients
+# 'async': many concurrent requests from an asyncio loop (emails/async_sender.py)
+EMAIL_SENDER_MODE = os.getenv('EMAIL_SENDER_MODE', 'batch')
+EMAIL_ASYNC_CONCURRENCY = int(os.getenv('EMAIL_ASYNC_CONCURRENCY', 200))  # requests in flight per worker
+EMAIL_ASYNC_REQUEST_SIZE = int(os.getenv('EMAIL_ASYNC_REQUEST_SIZE', 1))  # recipients per request
+
+# Campaign fan-out: contacts per EmailLog bulk insert / batch send task
+CAMPAIGN_FANOUT_CHUNK_SIZE = int(os.getenv('CAMPAIGN_FANOUT_CHUNK_SIZE', 1000))
+# Seconds without fan-out progress before process_scheduled_campaigns restarts it
+CAMPAIGN_FANOUT_STALE_AFTER = int(os.getenv('CAMPAIGN_FANOUT_STALE_AFTER', 600))
+
+# Segments: contacts per membership insert / incremental re-check
+SEGMENT_CHUNK_SIZE = int(os.getenv('SEGMENT_CHUNK_SIZE', 1000))
+
+# CSV contact import: rows per validate / de-duplicate / bulk insert chunk
+CONTACT_IMPORT_CHUNK_SIZE = int(os.getenv('CONTACT_IMPORT_CHUNK_SIZE', 5000))
+
+# Exports: rows fetched per cursor round trip and written per response chunk
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+
+# Global search: objects per bulk index write when re-indexing
+SEARCH_CHUNK_SIZE = int(os.getenv('SEARCH_CHUNK_SIZE', 1000))
+
+# Redis (Celery broker, tracking write buffers)
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+# Cache (dashboard statistics, deal totals, workflow trigger index version).
+# Per-process memory by default; set CACHE_URL to a Redis URL to share it
+# between web and worker processes, which multi-process deployments need for
+# invalidations to reach every process
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'crm',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Dashboard: seconds the computed statistics are cached between invalidations
+DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', 60))
+
+# Deal list: seconds the per-filter value totals are cached between deal changes
+DEAL_TOTALS_CACHE_TTL = int(os.getenv('DEAL_TOTALS_CACHE_TTL', 300))
+
+# Workflow trigger outbox (automations/outbox.py): seconds between relay
+# runs, events relayed per transaction
+WORKFLOW_OUTBOX_INTERVAL = int(os.getenv('WORKFLOW_OUTBOX_INTERVAL', 5))
+WORKFLOW_OUTBOX_BATCH_SIZE = int(os.getenv('WORKFLOW_OUTBOX_BATCH_SIZE', 1000))
+
+# Bulk workflow enrollment: contacts enrolled per transaction
+WORKFLOW_ENROLL_CHUNK_SIZE = int(os.getenv('WORKFLOW_ENROLL_CHUNK_SIZE', 1000))
+
+# Workflow step timer (automations/timers.py): seconds between dispatcher
+# runs, steps claimed per batch, seconds before an unexecuted claimed step
+# is dispatched again
+WORKFLOW_TIMER_INTERVAL = int(os.getenv('WORKFLOW_TIMER_INTERVAL', 5))
+WORKFLOW_TIMER_BATCH_SIZE = int(os.getenv('WORKFLOW_TIMER_BATCH_SIZE', 500))
+WORKFLOW_STEP_LEASE = int(os.getenv('WORKFLOW_STEP_LEASE', 300))
+
+# Kanban board: cards loaded per column at a time
+KANBAN_PAGE_SIZE = int(os.getenv('KANBAN_PAGE_SIZE', 20))
+KANBAN_MAX_PAGE_SIZE = 100
+
+# Daily metric rollups: seconds a save waits so a burst shares one rebuild
+METRICS_ROLLUP_DELAY = int(os.getenv('METRICS_ROLLUP_DELAY', 30))
+
+# Campaign send rate control (emails/scheduler.py)
+EMAIL_SEND_RATE = float(os.getenv('EMAIL_SEND_RATE', 100))  # messages/sec, all campaigns
+EMAIL_DEFAULT_DOMAIN_SEND_RATE = float(os.getenv('EMAIL_DEFAULT_DOMAIN_SEND_RATE', 50))
+EMAIL_DOMAIN_SEND_RATES = {
+    'gmail.com': 20,
+    'googlemail.com': 20,
+    'outlook.com': 10,
+    'hotmail.com': 10,
+    'live.com': 10,
+    'yahoo.com': 10,
+}
+EMAIL_DISPATCH_INTERVAL = 5  # seconds between dispatcher runs
+EMAIL_DISPATCH_LOOKAHEAD = 4  # pending logs inspected per available token
+EMAIL_DISPATCH_QUEUE = 'celery'
+EMAIL_DISPATCH_MAX_QUEUE_DEPTH = int(os.getenv('EMAIL_DISPATCH_MAX_QUEUE_DEPTH', 50))
+EMAIL_SEND_LEASE = int(os.getenv('EMAIL_SEND_LEASE', 600))  # seconds before an unfinished batch is requeued
 
 # Celery Configuration
-CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
@@ -235,12 +336,32 @@ from celery.schedules import crontab
 CELERY_BEAT_SCHEDULE = {
     'process-pending-workflows': {
         'task': 'automations.tasks.process_pending_workflows',
-        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+        'schedule': float(WORKFLOW_TIMER_INTERVAL),
+    },
+    'relay-workflow-events': {
+        'task': 'automations.tasks.relay_workflow_events',
+        'schedule': float(WORKFLOW_OUTBOX_INTERVAL),
     },
     'process-scheduled-campaigns': {
         'task': 'emails.tasks.process_scheduled_campaigns',
         'schedule': crontab(minute='*/1'),  # Every minute
     },
+    'dispatch-campaign-sends': {
+        'task': 'emails.tasks.dispatch_campaign_sends_task',
+        'schedule': float(EMAIL_DISPATCH_INTERVAL),
+    },
+    'flush-tracking-buffers': {
+        'task': 'emails.tasks.flush_tracking_buffers',
+        'schedule': 15.0,  # Every 15 seconds
+    },
+    'refresh-time-relative-segments': {
+        'task': 'contacts.tasks.refresh_time_relative_segments_task',
+        'schedule': crontab(minute='*/15'),  # Every 15 minutes
+    },
+    'rollup-daily-metrics': {
+        'task': 'dashboard.tasks.rollup_metrics_task',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+    },
 }
 
 # Logging
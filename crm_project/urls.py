@@ -29,6 +29,7 @@ urlpatterns = [
     path('deals/', include('deals.urls')),
     path('emails/', include('emails.urls')),
     path('automations/', include('automations.urls')),
+    path('search/', include('search.urls')),
     path('api/', include('rest_framework.urls')),
     path('track/', include('emails.tracking_urls')),
 ]
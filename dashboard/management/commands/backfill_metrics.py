@@ -0,0 +1,43 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from dashboard.metrics import first_day, rollup_days
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily metric rollups from the raw contact, deal, email and campaign rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day (YYYY-MM-DD); default the earliest day with data')
+        parser.add_argument('--end', help='Last day (YYYY-MM-DD); default today')
+        parser.add_argument('--days-per-chunk', type=int, default=31,
+                            help='Days rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else first_day()
+            end = date.fromisoformat(options['end']) if options['end'] else timezone.localdate()
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+        if start is None:
+            self.stdout.write('Nothing to backfill')
+            return
+        if start > end:
+            raise CommandError('--start is after --end')
+
+        began = time.perf_counter()
+        step = max(options['days_per_chunk'], 1)
+        written = 0
+        first = start
+        while first <= end:
+            last = min(first + timedelta(days=step - 1), end)
+            written += rollup_days(first, last)
+            self.stdout.write(f'{first} to {last}: {written} rows so far')
+            first = last + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {written} metric rows for {start} to {end} in {time.perf_counter() - began:.1f}s'
+        ))
@@ -0,0 +1,164 @@
+"""
+Daily metric rollups.
+
+DailyMetric holds one row per (day, metric, dimension) with a count and,
+for deals, a value, so any date range is answered by summing a few rows
+instead of scanning EmailLog / Contact / Deal / Campaign.
+
+A day is rebuilt from the raw rows with one grouped aggregate per metric
+(rollup_days), so rebuilding is idempotent and safe to repeat. Contact,
+deal and campaign saves queue a rebuild of the days they touch
+(dashboard/signals.py, debounced through the cache), and rollup_metrics_task
+rebuilds yesterday and today every few minutes to pick up writes that
+bypass signals: email sends and tracking, bulk imports. Older history is
+rebuilt with the backfill_metrics command.
+"""
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import CharField, Count, F, Min, Q, Sum, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from contacts.models import Contact
+from deals.models import Deal
+from emails.models import Campaign, EmailLog
+from .models import DailyMetric
+
+# The day a row counts towards is the date of date_field; dimension splits
+# the count, value is summed and filter narrows the rows
+MetricSource = namedtuple('MetricSource', ['model', 'date_field', 'dimension', 'value', 'filter'])
+
+METRICS = {
+    'contacts_created': MetricSource(Contact, 'created_at', 'status', None, None),
+    'deals_opened': MetricSource(Deal, 'created_at', 'currency', 'value', None),
+    'deals_won': MetricSource(Deal, 'closed_at', 'currency', 'value', Q(status='won')),
+    'deals_lost': MetricSource(Deal, 'closed_at', 'currency', 'value', Q(status='lost')),
+    'emails_sent': MetricSource(EmailLog, 'sent_at', None, None, Q(status__in=['sent', 'delivered'])),
+    'emails_opened': MetricSource(EmailLog, 'opened_at', None, None, None),
+    'emails_clicked': MetricSource(EmailLog, 'clicked_at', None, None, None),
+    'campaigns_created': MetricSource(Campaign, 'created_at', None, None, None),
+}
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _dimension(field):
+    return F(field) if field else Value('', output_field=CharField())
+
+
+def compute_rollup(first, last):
+    """DailyMetric instances for days first..last from the raw rows, one query per metric"""
+    start, end = _day_start(first), _day_start(last + timedelta(days=1))
+    rows = []
+    for metric, source in METRICS.items():
+        queryset = source.model.objects.filter(**{
+            f'{source.date_field}__gte': start,
+            f'{source.date_field}__lt': end,
+        })
+        if source.filter is not None:
+            queryset = queryset.filter(source.filter)
+
+        grouped = queryset.annotate(
+            rollup_day=TruncDate(source.date_field),
+            rollup_dimension=_dimension(source.dimension),
+        ).values('rollup_day', 'rollup_dimension').annotate(
+            rollup_count=Count('pk'),
+            rollup_value=Sum(source.value) if source.value else Value(0),
+        ).order_by()
+
+        for row in grouped:
+            rows.append(DailyMetric(
+                day=row['rollup_day'],
+                metric=metric,
+                dimension=row['rollup_dimension'] or '',
+                count=row['rollup_count'],
+                value=row['rollup_value'] or 0,
+            ))
+    return rows
+
+
+def rollup_days(first, last):
+    """
+    Rebuild the DailyMetric rows for days first..last. Returns the number
+    of rows written.
+    """
+    started = timezone.now()
+    rows = compute_rollup(first, last)
+    with transaction.atomic():
+        DailyMetric.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['day', 'metric', 'dimension'],
+            update_fields=['count', 'value', 'updated_at'],
+        )
+        # Rows not rewritten above have no source rows left
+        DailyMetric.objects.filter(day__range=(first, last), updated_at__lt=started).delete()
+
+    from .stats import invalidate_stats
+    invalidate_stats()
+    return len(rows)
+
+
+def first_day():
+    """Earliest day any metric has source rows for, or None"""
+    days = []
+    for source in METRICS.values():
+        earliest = source.model.objects.aggregate(earliest=Min(source.date_field))['earliest']
+        if earliest is not None:
+            days.append(timezone.localdate(earliest))
+    return min(days) if days else None
+
+
+def metric_totals(first, last):
+    """{metric: {'count': n, 'value': v}} summed over days first..last, one query"""
+    totals = {metric: {'count': 0, 'value': 0} for metric in METRICS}
+    for row in DailyMetric.objects.filter(day__range=(first, last)).values('metric').annotate(
+        total_count=Sum('count'),
+        total_value=Sum('value'),
+    ).order_by():
+        totals[row['metric']] = {'count': row['total_count'], 'value': row['total_value']}
+    return totals
+
+
+def metric_breakdown(metric, first, last):
+    """{dimension: {'count': n, 'value': v}} for one metric over days first..last"""
+    return {
+        row['dimension']: {'count': row['total_count'], 'value': row['total_value']}
+        for row in DailyMetric.objects.filter(metric=metric, day__range=(first, last)).values(
+            'dimension'
+        ).annotate(
+            total_count=Sum('count'),
+            total_value=Sum('value'),
+        ).order_by('dimension')
+    }
+
+
+def schedule_rollup(days):
+    """
+    Queue a rebuild of days once the current transaction commits. Saves
+    landing within METRICS_ROLLUP_DELAY seconds of each other share one
+    rebuild per day.
+    """
+    days = sorted({day for day in days if day is not None})
+    if not days:
+        return
+    transaction.on_commit(lambda: _enqueue_rollups(days))
+
+
+def _enqueue_rollups(days):
+    from .tasks import rollup_metrics_task
+    delay = settings.METRICS_ROLLUP_DELAY
+    for day in days:
+        try:
+            queued = cache.add(f'dashboard:rollup:{day.isoformat()}', 1, delay)
+        except redis.RedisError:
+            queued = True
+        if queued:
+            rollup_metrics_task.apply_async((day.isoformat(), day.isoformat()), countdown=delay)
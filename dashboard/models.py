@@ -16,3 +16,22 @@ class Dashboard(models.Model):
     def __str__(self):
         return f"Dashboard for {self.user.username}"
 
+
+class DailyMetric(models.Model):
+    """
+    One day's count (and value, for deals) of a metric, maintained by
+    dashboard/metrics.py
+    """
+    day = models.DateField()
+    metric = models.CharField(max_length=50)
+    dimension = models.CharField(max_length=50, blank=True)  # contact status, deal currency
+    count = models.PositiveIntegerField(default=0)
+    value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['day', 'metric', 'dimension']
+        unique_together = ('day', 'metric', 'dimension')
+
+    def __str__(self):
+        return f"{self.day} {self.metric} {self.dimension}: {self.count}"
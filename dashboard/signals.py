@@ -0,0 +1,36 @@
+"""
+Drop the cached dashboard figures and queue daily metric rollups when the
+objects they count change
+"""
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from contacts.models import Company, Contact
+from deals.models import Deal
+from emails.models import Campaign
+from .metrics import schedule_rollup
+from .stats import invalidate_stats
+
+
+def _day(value):
+    return timezone.localdate(value) if value else None
+
+
+def stats_changed(sender, **kwargs):
+    invalidate_stats()
+
+
+def metrics_changed(sender, instance, **kwargs):
+    days = [_day(instance.created_at)]
+    if sender is Deal:
+        days += [_day(instance.closed_at), _day(getattr(instance, 'previous_closed_at', None))]
+    schedule_rollup(days)
+
+
+for model in [Contact, Company, Deal, Campaign]:
+    post_save.connect(stats_changed, sender=model, dispatch_uid=f'dashboard_stats_save_{model.__name__}')
+    post_delete.connect(stats_changed, sender=model, dispatch_uid=f'dashboard_stats_delete_{model.__name__}')
+
+for model in [Contact, Deal, Campaign]:
+    post_save.connect(metrics_changed, sender=model, dispatch_uid=f'dashboard_metrics_save_{model.__name__}')
+    post_delete.connect(metrics_changed, sender=model, dispatch_uid=f'dashboard_metrics_delete_{model.__name__}')
@@ -0,0 +1,103 @@
+"""
+Dashboard statistics.
+
+Current totals are read once per table with conditional aggregates
+(COUNT/SUM ... FILTER) instead of a query per number, and month-to-date
+figures are summed from the daily metric rollups (dashboard/metrics.py).
+The result is kept in the shared cache for DASHBOARD_CACHE_TTL seconds and
+dropped when a contact, company, deal or campaign is saved or deleted, or a
+rollup is rebuilt (dashboard/signals.py). Writes that bypass signals, like
+bulk imports, send tracking and queryset updates, are picked up when the
+TTL runs out.
+"""
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from contacts.models import Contact
+from deals.models import Deal
+from emails.models import Campaign
+from .metrics import metric_totals
+
+
+def month_start(now=None):
+    now = now or timezone.now()
+    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def stats_cache_key(now=None):
+    # Keyed by month so "this month" figures roll over with the month
+    return f'dashboard:stats:{month_start(now):%Y-%m}'
+
+
+def compute_stats(now=None):
+    """Dashboard figures as a dict, four queries regardless of data size"""
+    today = timezone.localdate(now)
+    month = metric_totals(today.replace(day=1), today)
+
+    statuses = [status for status, _ in Contact.STATUS_CHOICES]
+    contacts = Contact.objects.aggregate(
+        total_contacts=Count('id'),
+        total_companies=Count('company', distinct=True),
+        **{f'status_{status}': Count('id', filter=Q(status=status)) for status in statuses}
+    )
+    deals = Deal.objects.aggregate(
+        active_deals=Count('id', filter=Q(status='open')),
+        total_deal_value=Coalesce(
+            Sum('value', filter=Q(status='open')),
+            Value(0),
+            output_field=DecimalField(max_digits=14, decimal_places=2)
+        ),
+    )
+    campaign_stats = []
+    for campaign in Campaign.objects.filter(status__in=['sent', 'sending']).values(
+        'name', 'sent_count', 'opened_count', 'clicked_count'
+    )[:5]:
+        sent = campaign['sent_count']
+        campaign['open_rate'] = campaign['opened_count'] / sent * 100 if sent else 0
+        campaign['click_rate'] = campaign['clicked_count'] / sent * 100 if sent else 0
+        campaign_stats.append(campaign)
+
+    return {
+        'total_contacts': contacts['total_contacts'],
+        'total_companies': contacts['total_companies'],
+        'new_contacts_month': month['contacts_created']['count'],
+        'contact_statuses': [
+            {'status': status, 'count': contacts[f'status_{status}']} for status in statuses
+        ],
+        'active_deals': deals['active_deals'],
+        'total_deal_value': deals['total_deal_value'],
+        'emails_sent_month': month['emails_sent']['count'],
+        'campaigns_this_month': month['campaigns_created']['count'],
+        'campaign_stats': campaign_stats,
+    }
+
+
+def get_stats():
+    """Cached dashboard figures; computed directly if the cache is unreachable"""
+    key = stats_cache_key()
+    try:
+        stats = cache.get(key)
+    except redis.RedisError:
+        return compute_stats()
+    if stats is None:
+        stats = compute_stats()
+        try:
+            cache.set(key, stats, settings.DASHBOARD_CACHE_TTL)
+        except redis.RedisError:
+            pass
+    return stats
+
+
+def invalidate_stats():
+    """Drop the cached figures once the current transaction commits"""
+    def delete():
+        try:
+            cache.delete(stats_cache_key())
+        except redis.RedisError:
+            pass
+    transaction.on_commit(delete)
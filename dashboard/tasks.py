@@ -0,0 +1,20 @@
+from datetime import date, timedelta
+
+from celery import shared_task
+from django.utils import timezone
+
+from .metrics import rollup_days
+
+
+@shared_task
+def rollup_metrics_task(first=None, last=None):
+    """
+    Rebuild daily metric rows for first..last (ISO dates), by default
+    yesterday and today
+    Runs every 5 minutes via Celery Beat
+    """
+    today = timezone.localdate()
+    first = date.fromisoformat(first) if first else today - timedelta(days=1)
+    last = date.fromisoformat(last) if last else today
+    written = rollup_days(first, last)
+    return f"Rolled up {written} metric rows for {first} to {last}"
@@ -1,3 +1,141 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from contacts.models import Company, Contact
+from crm_project.celery import app
+from deals.models import Deal, Pipeline, Stage
+from .metrics import metric_breakdown, metric_totals, rollup_days
+from .models import DailyMetric
+from .stats import get_stats
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def run_tasks_eagerly(test):
+    app.conf.task_always_eager = True
+    test.addCleanup(setattr, app.conf, 'task_always_eager', False)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DashboardStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        company = Company.objects.create(name='Acme')
+        pipeline = Pipeline.objects.create(name='Sales')
+        stage = Stage.objects.create(pipeline=pipeline, name='New', order=1)
+        for i in range(30):
+            contact = Contact.objects.create(
+                first_name=f'First{i}',
+                last_name='Last',
+                email=f'contact{i}@example.com',
+                company=company if i % 2 else None,
+                status='customer' if i % 3 == 0 else 'lead',
+            )
+            Deal.objects.create(
+                title=f'Deal {i}',
+                value=Decimal('100.50'),
+                contact=contact,
+                pipeline=pipeline,
+                stage=stage,
+                status='open' if i < 20 else 'won',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_stats_use_aggregates(self):
+        today = timezone.localdate()
+        rollup_days(today, today)
+        stats = get_stats()
+        self.assertEqual(stats['total_contacts'], 30)
+        self.assertEqual(stats['total_companies'], 1)
+        self.assertEqual(stats['new_contacts_month'], 30)
+        self.assertEqual(stats['active_deals'], 20)
+        self.assertEqual(stats['total_deal_value'], Decimal('2010.00'))
+        statuses = {row['status']: row['count'] for row in stats['contact_statuses']}
+        self.assertEqual(statuses['customer'], 10)
+        self.assertEqual(statuses['lead'], 20)
+
+    def test_dashboard_query_count(self):
+        # Session, user, four stats queries, recent contacts and deals
+        with self.assertNumQueries(8):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+        # Cached: only the session, user and recent lists
+        with self.assertNumQueries(4):
+            self.client.get(reverse('dashboard'))
+
+    def test_query_count_does_not_grow_with_data(self):
+        contact = Contact.objects.first()
+        pipeline = Pipeline.objects.first()
+        Deal.objects.bulk_create([
+            Deal(title=f'Bulk {i}', value=10, contact=contact, pipeline=pipeline)
+            for i in range(200)
+        ])
+        cache.clear()
+        with self.assertNumQueries(8):
+            self.client.get(reverse('dashboard'))
+
+    def test_save_invalidates_cache(self):
+        run_tasks_eagerly(self)
+        self.assertEqual(get_stats()['total_contacts'], 30)
+        with self.captureOnCommitCallbacks(execute=True):
+            Contact.objects.create(first_name='New', last_name='Contact', email='new@example.com')
+        self.assertEqual(get_stats()['total_contacts'], 31)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DailyMetricTests(TestCase):
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        pipeline = Pipeline.objects.create(name='Sales')
+        self.contact = Contact.objects.create(first_name='A', last_name='B', email='a@example.com')
+        self.deals = [
+            Deal.objects.create(title=f'Deal {i}', value=Decimal('50'), currency=currency,
+                                contact=self.contact, pipeline=pipeline)
+            for i, currency in enumerate(['USD', 'USD', 'EUR'])
+        ]
+
+    def test_rollup_counts_and_values(self):
+        self.deals[0].status = 'won'
+        self.deals[0].save()
+        rollup_days(self.today, self.today)
+
+        totals = metric_totals(self.today, self.today)
+        self.assertEqual(totals['contacts_created']['count'], 1)
+        self.assertEqual(totals['deals_opened']['count'], 3)
+        self.assertEqual(totals['deals_won']['value'], Decimal('50'))
+        opened = metric_breakdown('deals_opened', self.today, self.today)
+        self.assertEqual(opened['USD']['count'], 2)
+        self.assertEqual(opened['EUR']['value'], Decimal('50'))
+
+    def test_rollup_is_idempotent_and_drops_stale_rows(self):
+        self.deals[0].status = 'won'
+        self.deals[0].save()
+        rollup_days(self.today, self.today)
+        rollup_days(self.today, self.today)
+        self.assertEqual(DailyMetric.objects.filter(metric='deals_won').count(), 1)
+
+        # Reopening clears closed_at, so the won row goes on the next rebuild
+        self.deals[0].status = 'open'
+        self.deals[0].save()
+        self.assertIsNone(self.deals[0].closed_at)
+        rollup_days(self.today, self.today)
+        self.assertFalse(DailyMetric.objects.filter(metric='deals_won').exists())
+
+    def test_save_queues_rollup(self):
+        run_tasks_eagerly(self)
+        with self.captureOnCommitCallbacks(execute=True):
+            Contact.objects.create(first_name='C', last_name='D', email='c@example.com')
+        totals = metric_totals(self.today, self.today)
+        self.assertEqual(totals['contacts_created']['count'], 2)
@@ -0,0 +1,103 @@
+"""
+Kanban board columns.
+
+A board is built from three queries however many deals the pipeline holds:
+the stages, one grouped COUNT/SUM for each stage's count and value per
+currency, and one windowed query (ROW_NUMBER() partitioned by stage) for
+the first KANBAN_PAGE_SIZE cards of every stage. Further cards are loaded
+per column with keyset pagination on the (stage, id) index: newest first,
+the cursor is the id of the last card shown.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, F, Sum, Window
+from django.db.models.functions import RowNumber
+from django.urls import reverse
+
+from .models import Deal
+
+CARD_FIELDS = ['id', 'stage_id', 'title', 'value', 'currency', 'status', 'created_at',
+               'contact__first_name', 'contact__last_name']
+
+
+def page_size(limit=None):
+    """A requested page size clamped to 1..KANBAN_MAX_PAGE_SIZE, default KANBAN_PAGE_SIZE"""
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return settings.KANBAN_PAGE_SIZE
+    return max(1, min(limit, settings.KANBAN_MAX_PAGE_SIZE))
+
+
+def _card(row):
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'contact_name': f"{row['contact__first_name']} {row['contact__last_name']}",
+        'value': str(row['value']),
+        'currency': row['currency'],
+        'status': row['status'],
+        'created_at': row['created_at'].isoformat(),
+        'url': reverse('deals:deal_detail', args=[row['id']]),
+    }
+
+
+def stage_summaries(stage_ids):
+    """{stage id: {'count': n, 'totals': [{'currency', 'value'}]}} in one grouped query"""
+    summaries = {stage_id: {'count': 0, 'totals': []} for stage_id in stage_ids}
+    for row in Deal.objects.filter(stage_id__in=stage_ids).order_by().values('stage_id', 'currency').annotate(
+        deal_count=Count('id'),
+        deal_value=Sum('value'),
+    ).order_by('stage_id', 'currency'):
+        summary = summaries[row['stage_id']]
+        summary['count'] += row['deal_count']
+        summary['totals'].append({'currency': row['currency'], 'value': str(row['deal_value'] or Decimal(0))})
+    return summaries
+
+
+def first_cards(stage_ids, limit):
+    """{stage id: [card, ...]}: the newest limit deals of every stage, one windowed query"""
+    cards = {stage_id: [] for stage_id in stage_ids}
+    rows = Deal.objects.filter(stage_id__in=stage_ids).annotate(
+        position=Window(RowNumber(), partition_by=[F('stage_id')], order_by=F('id').desc())
+    ).filter(position__lte=limit).values(*CARD_FIELDS).order_by('stage_id', '-id')
+    for row in rows:
+        cards[row['stage_id']].append(_card(row))
+    return cards
+
+
+def next_cards(stage_id, after, limit):
+    """The next limit cards of a stage after the card with id after (newest first)"""
+    queryset = Deal.objects.filter(stage_id=stage_id)
+    if after:
+        queryset = queryset.filter(id__lt=after)
+    rows = list(queryset.values(*CARD_FIELDS).order_by('-id')[:limit + 1])
+    return [_card(row) for row in rows[:limit]], len(rows) > limit
+
+
+def board_columns(pipeline, limit=None):
+    """
+    The board's columns in stage order: each with its stage, count, value
+    totals, first cards and the cursor for loading more (None when all are
+    shown)
+    """
+    limit = page_size(limit)
+    stages = list(pipeline.stages.order_by('order', 'id'))
+    stage_ids = [stage.id for stage in stages]
+    summaries = stage_summaries(stage_ids)
+    cards = first_cards(stage_ids, limit)
+
+    columns = []
+    for stage in stages:
+        stage_cards = cards[stage.id]
+        summary = summaries[stage.id]
+        has_more = summary['count'] > len(stage_cards)
+        columns.append({
+            'stage': stage,
+            'count': summary['count'],
+            'totals': summary['totals'],
+            'cards': stage_cards,
+            'next_cursor': stage_cards[-1]['id'] if has_more and stage_cards else None,
+        })
+    return columns
@@ -0,0 +1,89 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.http import HttpRequest, QueryDict
+from django.test.utils import CaptureQueriesContext
+
+from contacts.models import Contact
+from deals.models import Deal, Pipeline, Stage
+from deals.totals import compute_totals, get_totals
+from deals.views import DealListView
+
+CURRENCIES = ['USD', 'EUR', 'GBP']
+STATUSES = ['open', 'open', 'won', 'lost']
+
+
+def list_queryset(params):
+    """The deal list's filtered queryset for query parameters"""
+    request = HttpRequest()
+    request.GET = QueryDict(mutable=True)
+    request.GET.update(params)
+    view = DealListView()
+    view.setup(request)
+    return view.get_queryset()
+
+
+class Command(BaseCommand):
+    help = 'Time the deal list totals: Python sum over every deal against grouped SUM and the cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deals', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def _best(self, func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def handle(self, *args, **options):
+        total = options['deals']
+        repeat = options['repeat']
+
+        # Everything created here is rolled back at the end
+        with transaction.atomic():
+            pipeline = Pipeline.objects.create(name='Benchmark pipeline')
+            stages = [Stage.objects.create(pipeline=pipeline, name=f'Stage {i}', order=i) for i in range(5)]
+            contacts = Contact.objects.bulk_create([
+                Contact(first_name='Deal', last_name=f'Bench{i}', email=f'deal-bench-{i}@example.com')
+                for i in range(1000)
+            ])
+            for offset in range(0, total, 5000):
+                Deal.objects.bulk_create([
+                    Deal(
+                        title=f'Bench deal {i}',
+                        value=Decimal(1000 + i % 997),
+                        currency=CURRENCIES[i % len(CURRENCIES)],
+                        status=STATUSES[i % len(STATUSES)],
+                        contact=contacts[i % len(contacts)],
+                        pipeline=pipeline,
+                        stage=stages[i % len(stages)],
+                    )
+                    for i in range(offset, min(offset + 5000, total))
+                ])
+            self.stdout.write(f'{total:,} deals in {len(CURRENCIES)} currencies')
+
+            for label, params in [('all deals', {}), ('status=open', {'status': 'open'}),
+                                  (f'pipeline={pipeline.id}', {'pipeline': str(pipeline.id)})]:
+                queryset = list_queryset(params)
+                legacy, legacy_total = self._best(lambda: sum(d.value for d in queryset.all()), repeat)
+                with CaptureQueriesContext(connection) as queries:
+                    grouped, totals = self._best(lambda: compute_totals(queryset.all()), repeat)
+                assert sum(t['value'] for t in totals) == legacy_total
+
+                get_totals(queryset.all(), params)
+                cached, _ = self._best(lambda: get_totals(queryset.all(), params), repeat)
+
+                self.stdout.write(f'{label}:')
+                self.stdout.write(f'  sum() over the queryset: {legacy * 1000:,.1f} ms')
+                self.stdout.write(f'  grouped SUM:             {grouped * 1000:,.1f} ms '
+                                  f'({len(queries) // repeat} query, {len(totals)} currencies)')
+                self.stdout.write(self.style.SUCCESS(
+                    f'  cached:                  {cached * 1000:,.2f} ms ({legacy / grouped:,.0f}x / {legacy / cached:,.0f}x faster)'
+                ))
+            transaction.set_rollback(True)
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-17 07:38
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def stamp_closed_deals(apps, schema_editor):
+    # Best available guess for deals closed before closed_at existed
+    Deal = apps.get_model('deals', 'Deal')
+    Deal.objects.filter(status__in=['won', 'lost']).update(closed_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deal',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(stamp_closed_deals, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['created_at'], name='deals_deal_created_9d9de4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['closed_at'], name='deals_deal_closed__d7ba0e_idx'),
+        ),
+    ]
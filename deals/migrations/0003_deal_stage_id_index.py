@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-17 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0002_deal_closed_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['stage', 'id'], name='deals_deal_stage_i_945dd5_idx'),
+        ),
+    ]
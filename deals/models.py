@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 from contacts.models import Contact, Company
 
 
@@ -50,11 +51,39 @@ class Deal(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
     assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_deals')
     close_date = models.DateField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True)  # when marked won or lost
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Daily metric rollups (dashboard/metrics.py)
+            models.Index(fields=['created_at']),
+            models.Index(fields=['closed_at']),
+            # Kanban columns, newest first (deals/kanban.py)
+            models.Index(fields=['stage', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.value} {self.currency}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        deal = super().from_db(db, field_names, values)
+        # Stage as loaded, so a save can tell a stage change (automations/signals.py)
+        deal.loaded_stage_id = deal.__dict__.get('stage_id')
+        return deal
+
+    def save(self, *args, **kwargs):
+        # Stamp the day a deal is won or lost; reopening clears it, and the
+        # previous stamp is kept for the metrics rollup of that day
+        if self.status == 'open':
+            self.previous_closed_at = self.closed_at
+            self.closed_at = None
+        elif self.closed_at is None:
+            self.closed_at = timezone.now()
+        # post_save records the stage change workflow event
+        # (automations/outbox.py); it must commit with the row
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
@@ -0,0 +1,14 @@
+"""
+Make cached deal list totals stale when deals change
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Deal
+from .totals import invalidate_totals
+
+
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+def deal_changed(sender, **kwargs):
+    invalidate_totals()
@@ -1,3 +1,145 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import redis
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from contacts.models import Contact
+from crm_project.celery import app
+from .kanban import board_columns, next_cards, page_size
+from .models import Deal, Pipeline, Stage
+from .totals import compute_totals, get_totals
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def run_tasks_eagerly(test):
+    app.conf.task_always_eager = True
+    test.addCleanup(setattr, app.conf, 'task_always_eager', False)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DealTotalsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        run_tasks_eagerly(self)
+        self.contact = Contact.objects.create(first_name='Ann', last_name='Lee', email='ann@acme.com')
+        self.pipeline = Pipeline.objects.create(name='Sales')
+        self.add_deal(100, 'USD', 'open')
+        self.add_deal(50, 'USD', 'won')
+        self.add_deal(500, 'EUR', 'open')
+
+    def add_deal(self, value, currency, status):
+        # The totals version is replaced on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            return Deal.objects.create(
+                title='Deal', value=value, currency=currency, status=status,
+                contact=self.contact, pipeline=self.pipeline
+            )
+
+    def summary(self, totals):
+        return [
+            (totals['currency'], totals['count'], totals['value'],
+             {status['status']: (status['count'], status['value']) for status in totals['statuses']})
+            for totals in totals
+        ]
+
+    def test_compute_totals(self):
+        self.assertEqual(self.summary(compute_totals(Deal.objects.all())), [
+            ('EUR', 1, Decimal(500), {'open': (1, Decimal(500)), 'won': (0, 0), 'lost': (0, 0)}),
+            ('USD', 2, Decimal(150), {'open': (1, Decimal(100)), 'won': (1, Decimal(50)), 'lost': (0, 0)}),
+        ])
+        self.assertEqual(compute_totals(Deal.objects.filter(status='lost')), [])
+
+    def test_totals_are_cached_per_filter_set(self):
+        get_totals(Deal.objects.all(), {'status': ''})
+        get_totals(Deal.objects.filter(status='open'), {'status': 'open'})
+        # A write that bypasses signals leaves the cached figures alone
+        Deal.objects.update(value=1)
+
+        with self.assertNumQueries(0):
+            totals = get_totals(Deal.objects.all(), {'status': ''})
+        self.assertEqual(totals[0]['value'], Decimal(500))
+        self.assertEqual(get_totals(Deal.objects.filter(status='open'), {'status': 'open'})[0]['count'], 1)
+
+    def test_save_and_delete_make_every_filter_set_stale(self):
+        get_totals(Deal.objects.all(), {'status': ''})
+        get_totals(Deal.objects.filter(status='won'), {'status': 'won'})
+
+        deal = self.add_deal(1000, 'USD', 'won')
+        self.assertEqual(get_totals(Deal.objects.all(), {'status': ''})[0]['value'], Decimal(1150))
+        self.assertEqual(get_totals(Deal.objects.filter(status='won'), {'status': 'won'})[0]['count'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            deal.delete()
+        self.assertEqual(get_totals(Deal.objects.all(), {'status': ''})[0]['value'], Decimal(500))
+
+    def test_version_is_only_replaced_on_commit(self):
+        get_totals(Deal.objects.all(), {})
+        with self.captureOnCommitCallbacks() as callbacks:
+            Deal.objects.create(title='Deal', value=10, contact=self.contact, pipeline=self.pipeline)
+        self.assertEqual(get_totals(Deal.objects.all(), {})[1]['count'], 2)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_totals(Deal.objects.all(), {})[1]['count'], 3)
+
+    def test_cache_errors_fall_back_to_computing(self):
+        with mock.patch('deals.totals.cache.get', side_effect=redis.ConnectionError):
+            totals = get_totals(Deal.objects.all(), {})
+        self.assertEqual(totals[0]['currency'], 'EUR')
+
+
+@override_settings(CACHES=LOCMEM_CACHE, KANBAN_PAGE_SIZE=2)
+class KanbanTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        run_tasks_eagerly(self)
+        contact = Contact.objects.create(first_name='Ann', last_name='Lee', email='ann@acme.com')
+        self.pipeline = Pipeline.objects.create(name='Sales')
+        self.new = Stage.objects.create(pipeline=self.pipeline, name='New', order=1)
+        self.won = Stage.objects.create(pipeline=self.pipeline, name='Won', order=2)
+        self.empty = Stage.objects.create(pipeline=self.pipeline, name='Lost', order=3)
+        self.new_ids = [
+            Deal.objects.create(title=f'New {i}', value=10, contact=contact, pipeline=self.pipeline, stage=self.new).id
+            for i in range(5)
+        ]
+        Deal.objects.create(title='Won', value=99, currency='EUR', contact=contact, pipeline=self.pipeline, stage=self.won)
+        Deal.objects.create(title='No stage', value=1, contact=contact, pipeline=self.pipeline)
+
+    def test_board_columns(self):
+        with self.assertNumQueries(3):
+            columns = board_columns(self.pipeline)
+
+        self.assertEqual([column['stage'] for column in columns], [self.new, self.won, self.empty])
+        new, won, empty = columns
+        self.assertEqual([card['id'] for card in new['cards']], self.new_ids[:2:-1])
+        self.assertEqual((new['count'], new['next_cursor']), (5, self.new_ids[3]))
+        self.assertEqual([(total['currency'], Decimal(total['value'])) for total in new['totals']], [('USD', 50)])
+        self.assertEqual((won['count'], len(won['cards']), won['next_cursor']), (1, 1, None))
+        self.assertEqual((empty['count'], empty['cards'], empty['next_cursor']), (0, [], None))
+
+    def test_next_cards_pages_by_id(self):
+        cards, has_more = next_cards(self.new.id, self.new_ids[3], 2)
+        self.assertEqual(([card['id'] for card in cards], has_more), ([self.new_ids[2], self.new_ids[1]], True))
+        cards, has_more = next_cards(self.new.id, self.new_ids[1], 2)
+        self.assertEqual(([card['id'] for card in cards], has_more), ([self.new_ids[0]], False))
+
+    def test_page_size(self):
+        self.assertEqual(page_size(None), 2)
+        self.assertEqual(page_size('abc'), 2)
+        self.assertEqual(page_size('0'), 1)
+        self.assertEqual(page_size('1000'), 100)
+
+    def test_cards_view(self):
+        self.client.force_login(User.objects.create_user('owner'))
+        url = reverse('deals:deal_kanban_cards', args=[self.new.id])
+
+        data = self.client.get(url, {'after': self.new_ids[1]}).json()
+        self.assertEqual(([card['id'] for card in data['cards']], data['next_cursor']), ([self.new_ids[0]], None))
+        self.assertFalse(self.client.get(url, {'after': 'x'}).json()['success'])
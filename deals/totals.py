@@ -0,0 +1,98 @@
+"""
+Deal list totals.
+
+The deal list shows the value of the matching deals per currency, split by
+status. The figures come from one grouped COUNT/SUM over the filtered
+queryset instead of loading every deal, and are cached per filter set.
+Cache keys include a version token that every deal save or delete replaces
+(deals/signals.py), so all cached filter sets go stale together; writes that
+bypass signals age out after DEAL_TOTALS_CACHE_TTL seconds.
+"""
+import hashlib
+import json
+import uuid
+from decimal import Decimal
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Deal
+
+VERSION_KEY = 'deals:totals:version'
+
+
+def compute_totals(queryset):
+    """
+    Totals for a deal queryset, one query: a list of
+    {'currency', 'count', 'value', 'statuses': [{'status', 'label', 'count', 'value'}]}
+    ordered by value, largest first
+    """
+    labels = dict(Deal.STATUS_CHOICES)
+    currencies = {}
+    for row in queryset.order_by().values('currency', 'status').annotate(
+        deal_count=Count('id'),
+        deal_value=Sum('value'),
+    ):
+        totals = currencies.setdefault(row['currency'], {
+            'currency': row['currency'],
+            'count': 0,
+            'value': Decimal(0),
+            'statuses': {status: {'status': status, 'label': label, 'count': 0, 'value': Decimal(0)}
+                         for status, label in Deal.STATUS_CHOICES},
+        })
+        value = row['deal_value'] or Decimal(0)
+        totals['count'] += row['deal_count']
+        totals['value'] += value
+        status = totals['statuses'].setdefault(row['status'], {
+            'status': row['status'], 'label': labels.get(row['status'], row['status']), 'count': 0, 'value': Decimal(0),
+        })
+        status['count'] += row['deal_count']
+        status['value'] += value
+
+    result = []
+    for totals in sorted(currencies.values(), key=lambda totals: totals['value'], reverse=True):
+        totals['statuses'] = list(totals['statuses'].values())
+        result.append(totals)
+    return result
+
+
+def _cache_key(filters):
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY)
+    digest = hashlib.md5(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    return f'deals:totals:{version}:{digest}'
+
+
+def get_totals(queryset, filters):
+    """
+    Cached compute_totals for queryset, keyed by the filters (a dict of
+    the list's query parameters) that produced it
+    """
+    try:
+        key = _cache_key(filters)
+        totals = cache.get(key)
+    except redis.RedisError:
+        return compute_totals(queryset)
+    if totals is None:
+        totals = compute_totals(queryset)
+        try:
+            cache.set(key, totals, settings.DEAL_TOTALS_CACHE_TTL)
+        except redis.RedisError:
+            pass
+    return totals
+
+
+def invalidate_totals():
+    """Make every cached filter set stale once the current transaction commits"""
+    def bump():
+        try:
+            cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+        except redis.RedisError:
+            pass
+    transaction.on_commit(bump)
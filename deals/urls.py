@@ -11,7 +11,11 @@ urlpatterns = [
     
     # Deals
     path('', views.DealListView.as_view(), name='deal_list'),
+    path('export/', views.DealExportView.as_view(), name='deal_export'),
     path('kanban/', views.DealKanbanView.as_view(), name='deal_kanban'),
+    path('kanban/<int:pipeline_id>/', views.DealKanbanView.as_view(), name='deal_kanban_pipeline'),
+    path('kanban/<int:pipeline_id>/columns/', views.DealKanbanColumnsView.as_view(), name='deal_kanban_columns'),
+    path('kanban/stages/<int:stage_id>/cards/', views.DealKanbanCardsView.as_view(), name='deal_kanban_cards'),
     path('create/', views.DealCreateView.as_view(), name='deal_create'),
     path('<int:pk>/', views.DealDetailView.as_view(), name='deal_detail'),
     path('<int:pk>/edit/', views.DealUpdateView.as_view(), name='deal_update'),
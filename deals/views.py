@@ -1,13 +1,15 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
+from django.views.generic import View, ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.http import JsonResponse
-from django.db.models import Q
 
 from .models import Pipeline, Stage, Deal
+from .kanban import board_columns, next_cards, page_size
+from .totals import get_totals
 from contacts.models import Contact
-from automations.tasks import trigger_workflow
+from search.index import matching_ids
+from crm_project.exports import ExportMixin
 
 
 class PipelineListView(LoginRequiredMixin, ListView):
@@ -51,6 +53,7 @@ class DealListView(LoginRequiredMixin, ListView):
     template_name = 'deals/deal_list.html'
     context_object_name = 'deals'
     paginate_by = 20
+    filter_params = ['search', 'status', 'pipeline']
 
     def get_queryset(self):
         queryset = Deal.objects.select_related('contact', 'company', 'pipeline', 'stage', 'assigned_to')
@@ -58,11 +61,7 @@ class DealListView(LoginRequiredMixin, ListView):
         # Search
         search = self.request.GET.get('search', '')
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) |
-                Q(contact__first_name__icontains=search) |
-                Q(contact__last_name__icontains=search)
-            )
+            queryset = queryset.filter(id__in=matching_ids('deal', search))
         
         # Filter by status
         status = self.request.GET.get('status', '')
@@ -80,10 +79,32 @@ class DealListView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         context['statuses'] = Deal.STATUS_CHOICES
         context['pipelines'] = Pipeline.objects.all()
-        context['total_value'] = sum(d.value for d in self.get_queryset())
+        
+        # Value per currency and status for the whole filtered list, not just this page
+        filters = {param: self.request.GET.get(param, '') for param in self.filter_params}
+        context['totals'] = get_totals(self.get_queryset(), filters)
         return context
 
 
+class DealExportView(ExportMixin, DealListView):
+    """Stream the filtered deal list as CSV or JSON Lines"""
+    export_name = 'deals'
+    export_columns = [
+        ('id', 'id'),
+        ('title', 'title'),
+        ('value', 'value'),
+        ('currency', 'currency'),
+        ('status', 'status'),
+        ('pipeline', 'pipeline__name'),
+        ('stage', 'stage__name'),
+        ('contact_email', 'contact__email'),
+        ('company', 'company__name'),
+        ('assigned_to', 'assigned_to__username'),
+        ('close_date', 'close_date'),
+        ('created_at', 'created_at'),
+    ]
+
+
 class DealKanbanView(LoginRequiredMixin, TemplateView):
     """Kanban board view for deals"""
     template_name = 'deals/deal_kanban.html'
@@ -98,13 +119,59 @@ class DealKanbanView(LoginRequiredMixin, TemplateView):
             pipeline = Pipeline.objects.first()
         
         context['pipeline'] = pipeline
-        context['stages'] = pipeline.stages.prefetch_related(
-            'deal_set'
-        ).order_by('order') if pipeline else []
+        context['pipelines'] = Pipeline.objects.order_by('name')
+        # First cards of each column; more load per column on scroll
+        context['columns'] = board_columns(pipeline) if pipeline else []
         
         return context
 
 
+class DealKanbanColumnsView(LoginRequiredMixin, View):
+    """Kanban columns of a pipeline as JSON: counts, totals and first cards"""
+
+    def get(self, request, pipeline_id):
+        pipeline = get_object_or_404(Pipeline, id=pipeline_id)
+        columns = board_columns(pipeline, request.GET.get('limit'))
+        
+        return JsonResponse({
+            'success': True,
+            'pipeline': pipeline.id,
+            'columns': [
+                {
+                    'stage': column['stage'].id,
+                    'name': column['stage'].name,
+                    'count': column['count'],
+                    'totals': column['totals'],
+                    'cards': column['cards'],
+                    'next_cursor': column['next_cursor'],
+                }
+                for column in columns
+            ]
+        })
+
+
+class DealKanbanCardsView(LoginRequiredMixin, View):
+    """Next page of one Kanban column's cards (?after=<last card id>)"""
+
+    def get(self, request, stage_id):
+        stage = get_object_or_404(Stage, id=stage_id)
+        try:
+            after = int(request.GET.get('after') or 0)
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'message': 'Invalid cursor'
+            })
+        
+        cards, has_more = next_cards(stage.id, after, page_size(request.GET.get('limit')))
+        return JsonResponse({
+            'success': True,
+            'stage': stage.id,
+            'cards': cards,
+            'next_cursor': cards[-1]['id'] if has_more else None,
+        })
+
+
 class DealDetailView(LoginRequiredMixin, DetailView):
     """Deal detail view"""
     model = Deal
@@ -159,17 +226,9 @@ class DealMoveView(LoginRequiredMixin, UpdateView):
             try:
                 new_stage = Stage.objects.get(id=new_stage_id)
                 deal.stage = new_stage
+                # A stage change records a deal_stage_changed workflow event
                 deal.save()
                 
-                # Trigger workflow if deal stage changed
-                from automations.models import Workflow
-                workflows = Workflow.objects.filter(
-                    trigger_event='deal_stage_changed',
-                    is_active=True
-                )
-                for workflow in workflows:
-                    trigger_workflow.delay(workflow.id, deal.contact.id)
-                
                 return JsonResponse({
                     'success': True,
                     'message': 'Deal moved successfully'
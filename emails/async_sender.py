@@ -0,0 +1,83 @@
+"""
+Asyncio delivery through the SendGrid v3 mail/send API.
+
+A Celery worker process otherwise waits on one HTTP round trip at a time.
+In async mode (EMAIL_SENDER_MODE = 'async') a send batch task hands its
+rendered emails to send_batches(), which runs an event loop with one pooled
+aiohttp session and keeps up to EMAIL_ASYNC_CONCURRENCY requests in flight.
+Each request carries EMAIL_ASYNC_REQUEST_SIZE recipients. Results are
+recorded on the logs in place; the caller writes them back in bulk.
+
+All database work happens before and after the event loop, never inside it.
+"""
+import asyncio
+import json
+
+import aiohttp
+from django.conf import settings
+
+from .sendgrid_batch import build_payload, record_request_failure, record_response
+
+
+class AsyncSendGridClient:
+    """Pooled aiohttp session for the SendGrid mail/send endpoint"""
+
+    def __init__(self, api_key, host, concurrency):
+        self.url = f"{host.rstrip('/')}/v3/mail/send"
+        self.headers = {
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json',
+        }
+        self.concurrency = concurrency
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=settings.SENDGRID_TIMEOUT),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def send(self, payload):
+        """POST one payload; returns (status, headers, body)"""
+        async with self.session.post(self.url, data=json.dumps(payload)) as response:
+            body = await response.read()
+            return response.status, response.headers, body
+
+
+async def _send_batch(client, limit, template, email_logs, merge_tags):
+    # Same retry rule as sendgrid_batch.send_batch: rejected recipients are
+    # failed and the rest of the request is sent once more
+    async with limit:
+        pending = list(email_logs)
+        for attempt in range(2):
+            if not pending:
+                return
+            try:
+                status, headers, body = await client.send(build_payload(template, pending, merge_tags))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                record_request_failure(pending, e)
+                return
+            pending = record_response(pending, status, headers, body, retry=not attempt)
+
+
+async def _send_all(batches, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+    async with AsyncSendGridClient(settings.SENDGRID_API_KEY, settings.SENDGRID_API_HOST, concurrency) as client:
+        await asyncio.gather(*[
+            _send_batch(client, limit, template, email_logs, merge_tags)
+            for template, email_logs, merge_tags in batches
+        ])
+
+
+def send_batches(batches, concurrency=None):
+    """
+    Send [(template, email_logs, merge_tags)] concurrently and record the
+    outcome on each log in place. Nothing is saved here.
+    """
+    if batches:
+        asyncio.run(_send_all(batches, concurrency or settings.EMAIL_ASYNC_CONCURRENCY))
@@ -0,0 +1,44 @@
+"""
+Atomic campaign counters and completion detection.
+
+Counters are only ever changed with F() increments, so concurrent workers
+never overwrite each other. Callers aggregate per batch and flush once.
+A campaign is complete when fan-out has recorded its recipient_count and
+every recipient has been counted as sent or failed; that check is a single
+conditional UPDATE, with no COUNT over EmailLog.
+"""
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Campaign
+
+
+def increment_campaign_counters(campaign_id, sent=0, failed=0, opened=0, clicked=0):
+    """Add to a campaign's counters in one UPDATE"""
+    changes = {
+        field: F(field) + amount
+        for field, amount in [
+            ('sent_count', sent),
+            ('failed_count', failed),
+            ('opened_count', opened),
+            ('clicked_count', clicked),
+        ]
+        if amount
+    }
+    if changes:
+        Campaign.objects.filter(id=campaign_id).update(**changes)
+    if sent or failed:
+        complete_campaign_if_done(campaign_id)
+
+
+def complete_campaign_if_done(campaign_id):
+    """
+    Move a sending campaign to 'sent' once all its recipients are accounted
+    for. Returns True if this call completed the campaign.
+    """
+    return bool(Campaign.objects.filter(
+        id=campaign_id,
+        status='sending',
+        recipient_count__isnull=False,
+        recipient_count__lte=F('sent_count') + F('failed_count'),
+    ).update(status='sent', completed_at=timezone.now()))
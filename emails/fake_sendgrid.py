@@ -0,0 +1,92 @@
+"""
+Local stand-in for the SendGrid v3 mail/send endpoint.
+
+Accepts the same JSON payloads, answers 202 with an X-Message-Id header and
+keeps simple counters, so batch delivery can be exercised and benchmarked
+offline by pointing SENDGRID_API_HOST at it. An optional per-request latency
+stands in for the round trip to the real API, and an optional error reply
+(e.g. a 429 with Retry-After) stands in for rate limiting or an outage.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeSendGridHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+
+        if self.path != '/v3/mail/send':
+            self._reply(404, {'errors': [{'message': 'Not found'}]})
+            return
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.error:
+            status, headers = self.server.error
+            self._reply(status, {'errors': [{'field': None, 'message': 'Unavailable'}]}, headers)
+            return
+
+        try:
+            payload = json.loads(body)
+            personalizations = payload['personalizations']
+        except (ValueError, KeyError):
+            self._reply(400, {'errors': [{'field': None, 'message': 'Bad request'}]})
+            return
+
+        errors = [
+            {'field': f'personalizations.{i}.to', 'message': 'Invalid email address'}
+            for i, p in enumerate(personalizations)
+            if not all('@' in to.get('email', '') for to in p.get('to', []))
+        ]
+        if errors:
+            self._reply(400, {'errors': errors})
+            return
+
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.recipients += len(personalizations)
+        self._reply(202, None, {'X-Message-Id': uuid.uuid4().hex})
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSendGridServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # room for hundreds of concurrent connections
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0, error=None):
+        super().__init__(address, FakeSendGridHandler)
+        self.latency = latency  # seconds added to every response, like a remote API
+        self.error = error  # (status, headers) to answer every request with instead
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.recipients = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """Serve from a background thread"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,104 @@
+"""
+Local stand-in SMTP server for offline testing and benchmarks.
+
+Speaks just enough ESMTP for smtplib / Django's SMTP backend (EHLO, AUTH
+PLAIN, MAIL, RCPT, DATA, RSET, NOOP, QUIT) and counts what it accepts. A
+per-connection delay stands in for the TLS handshake and login of a real
+relay, and the server can drop a connection after a number of messages to
+exercise reconnects.
+"""
+import socketserver
+import threading
+import time
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        if self.server.connect_latency:
+            time.sleep(self.server.connect_latency)
+
+        self._reply('220 fake-smtp ESMTP ready')
+        in_data = False
+        recipients = 0
+        messages = 0
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            if in_data:
+                if line == b'.\r\n':
+                    in_data = False
+                    messages += 1
+                    with self.server.lock:
+                        self.server.messages += 1
+                        self.server.recipients += recipients
+                    self._reply('250 OK queued')
+                    drop_after = self.server.drop_after
+                    if drop_after and messages >= drop_after:
+                        return
+                continue
+
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self._reply('250-fake-smtp\r\n250-AUTH PLAIN\r\n250-8BITMIME\r\n250 SMTPUTF8')
+            elif verb == 'HELO':
+                self._reply('250 fake-smtp')
+            elif verb == 'AUTH':
+                self._reply('235 Authentication successful')
+            elif verb == 'MAIL':
+                recipients = 0
+                self._reply('250 OK')
+            elif verb == 'RCPT':
+                if '@' not in command:
+                    self._reply('550 Invalid recipient')
+                else:
+                    recipients += 1
+                    self._reply('250 OK')
+            elif verb == 'DATA':
+                in_data = True
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+            elif verb in ['RSET', 'NOOP']:
+                self._reply('250 OK')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+    def _reply(self, text):
+        self.wfile.write(f'{text}\r\n'.encode())
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256
+
+    def __init__(self, address=('127.0.0.1', 0), connect_latency=0, drop_after=0):
+        super().__init__(address, FakeSMTPHandler)
+        self.connect_latency = connect_latency  # seconds, like TLS + AUTH
+        self.drop_after = drop_after  # close each connection after this many messages
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.recipients = 0
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """Serve from a background thread"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from contacts.models import Contact
+from emails.async_sender import send_batches
+from emails.fake_sendgrid import FakeSendGridServer
+from emails.models import EmailLog, EmailTemplate
+from emails import sendgrid_batch
+from emails.tasks import get_merge_tags
+
+
+class Command(BaseCommand):
+    help = 'Measure sustained msg/s of blocking vs asyncio one-recipient sends against a local fake server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=settings.EMAIL_ASYNC_CONCURRENCY)
+        parser.add_argument('--latency-ms', type=int, default=50, help='simulated provider round trip')
+        parser.add_argument('--blocking-messages', type=int, default=100)
+
+    def handle(self, *args, **options):
+        server = FakeSendGridServer(latency=options['latency_ms'] / 1000)
+        server.start()
+        settings.SENDGRID_API_KEY = settings.SENDGRID_API_KEY or 'benchmark'
+        settings.SENDGRID_API_HOST = server.url
+
+        template = EmailTemplate(
+            subject='Hello {{first_name}}',
+            html_body='<html><body><p>Hi {{first_name}} from {{company_name}}</p></body></html>',
+        )
+
+        def make_batches(count):
+            # Unsaved instances: this measures the provider path, not the database
+            batches = []
+            for i in range(1, count + 1):
+                email_log = EmailLog(id=i, contact=Contact(
+                    first_name=f'User{i}', last_name='Bench', email=f'user{i}@example.com'
+                ))
+                batches.append((template, [email_log], {i: get_merge_tags(email_log.contact)}))
+            return batches
+
+        blocking_batches = make_batches(options['blocking_messages'])
+        start = time.perf_counter()
+        for batch in blocking_batches:
+            sendgrid_batch.send_batch(*batch)
+        blocking = time.perf_counter() - start
+
+        async_batches = make_batches(options['messages'])
+        start = time.perf_counter()
+        send_batches(async_batches, options['concurrency'])
+        concurrent = time.perf_counter() - start
+
+        sent = sum(1 for _, logs, _ in async_batches for log in logs if log.status == 'sent')
+        count = len(async_batches)
+        self.stdout.write(f"Provider latency: {options['latency_ms']} ms per request")
+        self.stdout.write(f'Blocking, one at a time: {len(blocking_batches) / blocking:,.0f} msg/s')
+        self.stdout.write(f"asyncio, {options['concurrency']} in flight: {count / concurrent:,.0f} msg/s ({concurrent:.2f}s)")
+        self.stdout.write(self.style.SUCCESS(f'{sent}/{count} messages accepted in async mode'))
+        server.shutdown()
@@ -0,0 +1,48 @@
+import zlib
+
+from django.core.management.base import BaseCommand
+
+from contacts.models import Company, Contact
+from emails.models import EmailTemplate
+from emails.rendering import compile_template
+from emails.tasks import get_merge_tags
+
+
+class Command(BaseCommand):
+    help = 'Compare bytes stored per campaign for full rendered HTML against a shared compressed body'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=10000)
+        parser.add_argument('--body-kb', type=int, default=100)
+
+    def handle(self, *args, **options):
+        paragraph = (
+            '<p>Hi {{first_name}}, this is a note for {{company_name}} about our '
+            'spring catalogue. Read more at <a href="https://example.com/spring">our site</a>.</p>\n'
+        )
+        repeats = max(1, options['body_kb'] * 1024 // len(paragraph))
+        template = EmailTemplate(
+            subject='News for {{full_name}}',
+            html_body=f'<html><body>{paragraph * repeats}</body></html>',
+        )
+        compiled = compile_template(template)
+        recipients = options['recipients']
+
+        full_bytes = 0
+        values_bytes = 0
+        for i in range(recipients):
+            contact = Contact(first_name=f'Ada{i}', last_name='Lovelace', email=f'ada{i}@example.com',
+                              company=Company(name=f'Analytical Engines {i % 50}'))
+            merge_tags = get_merge_tags(contact)
+            _, html = compiled.render(merge_tags, i)
+            full_bytes += len(html.encode('utf-8'))
+            values_bytes += len(compiled.html_values(merge_tags).encode('utf-8'))
+
+        body_bytes = len(zlib.compress(compiled.html.dumps().encode('utf-8'), 9))
+        shared_bytes = body_bytes + values_bytes
+
+        self.stdout.write(f'Recipients: {recipients:,}, body: {len(template.html_body) / 1024:.0f} KB')
+        self.stdout.write(f'Full HTML per log:       {full_bytes / 1024 / 1024:,.1f} MB')
+        self.stdout.write(f'Shared body + values:    {shared_bytes / 1024 / 1024:,.2f} MB '
+                          f'(body {body_bytes / 1024:,.1f} KB)')
+        self.stdout.write(self.style.SUCCESS(f'Reduction: {full_bytes / shared_bytes:,.0f}x'))
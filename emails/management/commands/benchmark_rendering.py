@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from contacts.models import Company, Contact
+from emails.models import EmailTemplate
+from emails.rendering import compile_template
+from emails.tasks import get_merge_tags
+
+
+def legacy_render(template, merge_tags, email_log_id):
+    """The chained str.replace rendering previously done in send_email_task"""
+    rendered_subject = template.subject
+    rendered_html = template.html_body
+    for key, value in merge_tags.items():
+        rendered_subject = rendered_subject.replace(f'{{{{{key}}}}}', str(value))
+        rendered_html = rendered_html.replace(f'{{{{{key}}}}}', str(value))
+    tracking_pixel = f'<img src="/track/open/{email_log_id}/" width="1" height="1" style="display:none;">'
+    rendered_html = rendered_html.replace('</body>', f'{tracking_pixel}</body>')
+    return rendered_subject, rendered_html
+
+
+class Command(BaseCommand):
+    help = 'Measure renders/sec of the compiled merge-tag renderer against chained str.replace'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renders', type=int, default=5000)
+        parser.add_argument('--body-kb', type=int, default=100)
+
+    def handle(self, *args, **options):
+        paragraph = (
+            '<p>Hi {{first_name}}, this is a note for {{company_name}} about our '
+            'spring catalogue. Reply to {{email}} or call {{phone}}.</p>\n'
+        )
+        repeats = max(1, options['body_kb'] * 1024 // len(paragraph))
+        template = EmailTemplate(
+            subject='News for {{full_name}}',
+            html_body=f'<html><body>{paragraph * repeats}</body></html>',
+        )
+        contact = Contact(first_name='Ada', last_name='Lovelace', email='ada@example.com',
+                          phone='555-0100', company=Company(name='Analytical Engines'))
+        merge_tags = get_merge_tags(contact)
+        renders = options['renders']
+
+        self.stdout.write(f'Body: {len(template.html_body) / 1024:.0f} KB, {repeats * 4} merge tags')
+
+        start = time.perf_counter()
+        for i in range(renders):
+            legacy_render(template, merge_tags, i)
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        compiled = compile_template(template)
+        for i in range(renders):
+            compiled.render(merge_tags, i)
+        fast = time.perf_counter() - start
+
+        self.stdout.write(f'str.replace: {renders / legacy:,.0f} renders/s')
+        self.stdout.write(f'compiled:    {renders / fast:,.0f} renders/s')
+        self.stdout.write(self.style.SUCCESS(f'Speed-up: {legacy / fast:.1f}x'))
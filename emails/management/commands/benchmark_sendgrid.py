@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sendgrid import SendGridAPIClient
+from sendgrid.helpers.mail import Mail
+
+from contacts.models import Contact
+from emails.fake_sendgrid import FakeSendGridServer
+from emails.models import EmailLog, EmailTemplate
+from emails import sendgrid_batch
+from emails.tasks import get_merge_tags
+
+
+class Command(BaseCommand):
+    help = 'Compare per-message and batched SendGrid delivery against a local fake server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--batch-size', type=int, default=settings.SENDGRID_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        server = FakeSendGridServer()
+        server.start()
+        settings.SENDGRID_API_KEY = settings.SENDGRID_API_KEY or 'benchmark'
+        settings.SENDGRID_API_HOST = server.url
+
+        template = EmailTemplate(
+            subject='Hello {{first_name}}',
+            html_body='<html><body><p>Hi {{first_name}} from {{company_name}}</p></body></html>',
+        )
+        # Unsaved instances: this measures the provider path, not the database
+        email_logs = [
+            EmailLog(id=i, contact=Contact(first_name=f'User{i}', last_name='Bench', email=f'user{i}@example.com'))
+            for i in range(1, options['messages'] + 1)
+        ]
+        merge_tags = {log.id: get_merge_tags(log.contact) for log in email_logs}
+
+        start = time.perf_counter()
+        for email_log in email_logs:
+            message = Mail(
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to_emails=email_log.contact.email,
+                subject=template.subject,
+                html_content=template.html_body,
+            )
+            SendGridAPIClient(settings.SENDGRID_API_KEY, host=server.url).send(message)
+        per_message = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch_size = options['batch_size']
+        for i in range(0, len(email_logs), batch_size):
+            sendgrid_batch.send_batch(template, email_logs[i:i + batch_size], merge_tags)
+        batched = time.perf_counter() - start
+
+        sent = sum(1 for log in email_logs if log.status == 'sent')
+        count = len(email_logs)
+        self.stdout.write(f'Per-message client: {count / per_message:,.0f} msg/s ({per_message:.2f}s)')
+        self.stdout.write(f'Batched ({batch_size}/request): {count / batched:,.0f} msg/s ({batched:.2f}s)')
+        self.stdout.write(self.style.SUCCESS(f'{sent}/{count} recipients accepted in batched mode'))
+        server.shutdown()
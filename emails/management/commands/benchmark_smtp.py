@@ -0,0 +1,60 @@
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, send_mail
+from django.core.management.base import BaseCommand
+
+from emails import smtp_pool
+from emails.fake_smtp import FakeSMTPServer
+
+
+class Command(BaseCommand):
+    help = 'Compare send_mail() per message against the pooled SMTP connection on a local stand-in server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--connect-latency-ms', type=int, default=20, help='simulated TLS + AUTH cost')
+        parser.add_argument('--drop-after', type=int, default=200, help='server drops connections after N messages')
+
+    def handle(self, *args, **options):
+        server = FakeSMTPServer(
+            connect_latency=options['connect_latency_ms'] / 1000,
+            drop_after=options['drop_after'],
+        )
+        server.start()
+        settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+        settings.EMAIL_HOST = server.host
+        settings.EMAIL_PORT = server.port
+        settings.EMAIL_USE_TLS = False
+        settings.EMAIL_HOST_USER = 'apikey'
+        settings.EMAIL_HOST_PASSWORD = 'benchmark'
+
+        count = options['messages']
+        html = '<html><body><p>Hi there</p></body></html>'
+
+        start = time.perf_counter()
+        for i in range(count):
+            send_mail('Hello', '', settings.DEFAULT_FROM_EMAIL, [f'user{i}@example.com'],
+                      html_message=html, fail_silently=False)
+        per_message = time.perf_counter() - start
+        connections = server.connections
+
+        messages = []
+        for i in range(count):
+            message = EmailMultiAlternatives('Hello', '', settings.DEFAULT_FROM_EMAIL, [f'user{i}@example.com'])
+            message.attach_alternative(html, 'text/html')
+            messages.append(message)
+
+        start = time.perf_counter()
+        errors = smtp_pool.send_messages(messages)
+        pooled = time.perf_counter() - start
+        smtp_pool.get_pooled_connection().close()
+
+        failed = sum(1 for error in errors if error is not None)
+        self.stdout.write(f"Connection setup: {options['connect_latency_ms']} ms, "
+                          f"server drops after {options['drop_after']} messages")
+        self.stdout.write(f'send_mail per message: {count / per_message:,.0f} msg/s ({connections} connections)')
+        self.stdout.write(f'Pooled connection:     {count / pooled:,.0f} msg/s '
+                          f'({server.connections - connections} connections)')
+        self.stdout.write(self.style.SUCCESS(f'{count - failed}/{count} messages sent on the pool'))
+        server.shutdown()
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from contacts.models import Contact
+from emails.models import EmailLog, EmailTemplate
+from emails.tracking_buffer import flush_open_buffer
+from emails.tracking_views import track_email_open
+
+
+class Command(BaseCommand):
+    help = 'Measure requests/sec on the open-tracking pixel endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--logs', type=int, default=100, help='Distinct email logs to spread opens over')
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        total = options['requests']
+
+        # Everything created here is rolled back at the end
+        with transaction.atomic():
+            template = EmailTemplate.objects.create(name='Benchmark', subject='-', html_body='-')
+            contacts = Contact.objects.bulk_create([
+                Contact(first_name='Bench', last_name=str(i), email=f'tracking-bench-{i}@example.com')
+                for i in range(options['logs'])
+            ])
+            log_ids = [
+                log.id for log in EmailLog.objects.bulk_create([
+                    EmailLog(contact=contact, template=template, status='sent') for contact in contacts
+                ])
+            ]
+            if not log_ids[0]:
+                log_ids = list(EmailLog.objects.filter(template=template).values_list('id', flat=True))
+
+            start = time.perf_counter()
+            for i in range(total):
+                log_id = log_ids[i % len(log_ids)]
+                track_email_open(factory.get(f'/track/open/{log_id}/'), log_id)
+            elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            try:
+                flushed = flush_open_buffer()
+            except Exception as e:
+                flushed = f'n/a ({e.__class__.__name__})'
+            flush_elapsed = time.perf_counter() - start
+
+            recorded = sum(EmailLog.objects.filter(id__in=log_ids).values_list('open_count', flat=True))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'Pixel endpoint: {total / elapsed:,.0f} requests/s ({elapsed:.2f}s for {total})')
+        self.stdout.write(f'Flush: {flushed} logs in {flush_elapsed * 1000:.1f} ms')
+        self.stdout.write(self.style.SUCCESS(f'{recorded}/{total} opens recorded'))
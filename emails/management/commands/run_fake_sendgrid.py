@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from emails.fake_sendgrid import FakeSendGridServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local fake SendGrid mail/send API for offline testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8025)
+        parser.add_argument('--latency-ms', type=int, default=0)
+
+    def handle(self, *args, **options):
+        server = FakeSendGridServer((options['host'], options['port']), latency=options['latency_ms'] / 1000)
+        self.stdout.write(self.style.SUCCESS(
+            f'Fake SendGrid listening on {server.url} (set SENDGRID_API_HOST to this)'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write(f'Accepted {server.recipients} recipients in {server.requests} requests')
+            server.server_close()
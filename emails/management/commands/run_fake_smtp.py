@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from emails.fake_smtp import FakeSMTPServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in SMTP server for offline testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--connect-latency-ms', type=int, default=0)
+        parser.add_argument('--drop-after', type=int, default=0, help='close connections after N messages')
+
+    def handle(self, *args, **options):
+        server = FakeSMTPServer(
+            (options['host'], options['port']),
+            connect_latency=options['connect_latency_ms'] / 1000,
+            drop_after=options['drop_after'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Fake SMTP listening on {server.host}:{server.port} '
+            '(set EMAIL_BACKEND to the SMTP backend and EMAIL_HOST / EMAIL_PORT to this)'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write(f'Accepted {server.messages} messages over {server.connections} connections')
+            server.server_close()
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='fanout_cursor',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0002_campaign_fanout_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='recipient_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 4.2 on 2026-10-17 07:05
+
+import hashlib
+import json
+
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+import django.db.models.deletion
+
+CHUNK_SIZE = 1000
+
+
+def copy_clicked_links(apps, schema_editor):
+    """Convert EmailLog.clicked_links JSON into EmailClick rows, in chunks"""
+    EmailLog = apps.get_model('emails', 'EmailLog')
+    EmailLink = apps.get_model('emails', 'EmailLink')
+    EmailClick = apps.get_model('emails', 'EmailClick')
+
+    links = {}
+    last_id = 0
+    while True:
+        logs = list(
+            EmailLog.objects.filter(id__gt=last_id)
+            .exclude(clicked_links='')
+            .order_by('id')
+            .values_list('id', 'campaign_id', 'clicked_links', 'clicked_at')[:CHUNK_SIZE]
+        )
+        if not logs:
+            break
+        last_id = logs[-1][0]
+
+        clicks = []
+        for log_id, campaign_id, clicked_links, clicked_at in logs:
+            try:
+                entries = json.loads(clicked_links)
+            except json.JSONDecodeError:
+                continue
+            for entry in entries:
+                url = entry.get('url', '')
+                url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()
+                if url_hash not in links:
+                    links[url_hash] = EmailLink.objects.get_or_create(
+                        url_hash=url_hash, defaults={'url': url}
+                    )[0].id
+                clicks.append(EmailClick(
+                    email_log_id=log_id,
+                    campaign_id=campaign_id,
+                    link_id=links[url_hash],
+                    clicked_at=parse_datetime(entry.get('clicked_at') or '') or clicked_at,
+                ))
+        EmailClick.objects.bulk_create(clicks, batch_size=CHUNK_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0003_campaign_recipient_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.TextField()),
+                ('url_hash', models.CharField(max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EmailClick',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clicked_at', models.DateTimeField()),
+                ('campaign', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='clicks', to='emails.campaign')),
+                ('email_log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='clicks', to='emails.emaillog')),
+                ('link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='clicks', to='emails.emaillink')),
+            ],
+            options={
+                'ordering': ['-clicked_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='emailclick',
+            index=models.Index(fields=['campaign', 'link'], name='emails_emai_campaig_1d1b4c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailclick',
+            index=models.Index(fields=['link', 'clicked_at'], name='emails_emai_link_id_2850cd_idx'),
+        ),
+        migrations.RunPython(copy_clicked_links, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='emaillog',
+            name='clicked_links',
+        ),
+    ]
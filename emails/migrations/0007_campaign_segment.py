@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-17 07:17
+
+import contacts.segment_filter
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contacts', '0002_segments'),
+        ('emails', '0006_email_body_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='segment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='campaigns', to='contacts.segment'),
+        ),
+        migrations.AlterField(
+            model_name='campaign',
+            name='segment_filter',
+            field=models.CharField(blank=True, help_text='JSON filter: {"status": "lead", "tags": "interested"}', max_length=1000, validators=[contacts.segment_filter.validate_segment_filter]),
+        ),
+        migrations.AddIndex(
+            model_name='emaillog',
+            index=models.Index(fields=['contact', 'opened_at'], name='emails_emai_contact_a08bbc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emaillog',
+            index=models.Index(fields=['contact', 'clicked_at'], name='emails_emai_contact_c3cd48_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emaillog',
+            index=models.Index(fields=['contact', 'sent_at'], name='emails_emai_contact_a88b1c_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-17 07:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0007_campaign_segment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emaillog',
+            index=models.Index(fields=['sent_at'], name='emails_emai_sent_at_09db08_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emaillog',
+            index=models.Index(fields=['opened_at'], name='emails_emai_opened__8bbb7a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emaillog',
+            index=models.Index(fields=['clicked_at'], name='emails_emai_clicked_ff0f9f_idx'),
+        ),
+    ]
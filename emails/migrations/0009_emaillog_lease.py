@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-17 08:04
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def expire_queued_logs(apps, schema_editor):
+    # Logs queued before leases existed may be stranded; let the next
+    # dispatcher run put them back on the broker
+    EmailLog = apps.get_model('emails', 'EmailLog')
+    EmailLog.objects.filter(status='queued').update(lease_expires_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0008_emaillog_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emaillog',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='emaillog',
+            index=models.Index(fields=['status', 'lease_expires_at'], name='emails_emai_status_ce3a56_idx'),
+        ),
+        migrations.RunPython(expire_queued_logs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0009_emaillog_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='error_message',
+            field=models.TextField(blank=True),
+        ),
+    ]
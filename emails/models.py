@@ -1,6 +1,13 @@
+import hashlib
+import json
+import zlib
+
 from django.db import models
 from django.contrib.auth.models import User
-from contacts.models import Contact
+from contacts.models import Contact, Segment
+from contacts.segment_filter import validate_segment_filter
+
+from .rendering import EMAIL_LOG_ID, CompiledText
 
 
 class EmailTemplate(models.Model):
@@ -34,10 +41,13 @@ class Campaign(models.Model):
     description = models.TextField(blank=True)
     template = models.ForeignKey(EmailTemplate, on_delete=models.PROTECT)
     
-    # Segment filter (JSON stored as CharField for simplicity)
+    # Audience: a saved segment, or an inline filter in the same language
+    # (contacts/segment_filter.py). With neither, every contact.
+    segment = models.ForeignKey(Segment, on_delete=models.PROTECT, null=True, blank=True, related_name='campaigns')
     segment_filter = models.CharField(
         max_length=1000,
         blank=True,
+        validators=[validate_segment_filter],
         help_text="JSON filter: {\"status\": \"lead\", \"tags\": \"interested\"}"
     )
     
@@ -51,6 +61,14 @@ class Campaign(models.Model):
     clicked_count = models.PositiveIntegerField(default=0)
     failed_count = models.PositiveIntegerField(default=0)
     
+    # Fan-out progress: id of the last contact queued for sending
+    fanout_cursor = models.PositiveBigIntegerField(default=0)
+    # Set once fan-out finishes; the campaign is complete when
+    # sent_count + failed_count reaches it
+    recipient_count = models.PositiveIntegerField(null=True, blank=True)
+    # Why the last fan-out failed; the campaign went back to draft
+    error_message = models.TextField(blank=True)
+    
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='campaigns')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -78,6 +96,7 @@ class EmailLog(models.Model):
     """Email send/open/click log"""
     STATUS_CHOICES = [
         ('pending', 'Pending'),
+        ('queued', 'Queued'),
         ('sent', 'Sent'),
         ('delivered', 'Delivered'),
         ('failed', 'Failed'),
@@ -89,6 +108,9 @@ class EmailLog(models.Model):
     template = models.ForeignKey(EmailTemplate, on_delete=models.SET_NULL, null=True, blank=True)
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # While queued: when the send dispatcher puts the log on the broker again
+    # if its batch has not finished (emails/scheduler.py)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
     
     # Sent tracking
     sent_at = models.DateTimeField(null=True, blank=True)
@@ -101,14 +123,17 @@ class EmailLog(models.Model):
     # Click tracking
     clicked_at = models.DateTimeField(null=True, blank=True)
     click_count = models.PositiveIntegerField(default=0)
-    clicked_links = models.TextField(blank=True)  # JSON of clicked links
     
     # Error handling
     error_message = models.TextField(blank=True)
     
-    # Merge tags rendering
+    # Merge tags rendering. The HTML is stored as a shared skeleton (body)
+    # plus this recipient's merge tag values; rendered_html is only set on
+    # logs written before that split.
     rendered_subject = models.CharField(max_length=500, blank=True)
     rendered_html = models.TextField(blank=True)
+    body = models.ForeignKey('EmailBody', on_delete=models.PROTECT, null=True, blank=True, related_name='logs')
+    body_values = models.TextField(blank=True)  # JSON of merge tag values used by body
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -116,7 +141,87 @@ class EmailLog(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ('contact', 'campaign', 'template')
+        indexes = [
+            models.Index(fields=['campaign', 'status', 'id']),
+            # Queued logs with an expired lease (emails/scheduler.py)
+            models.Index(fields=['status', 'lease_expires_at']),
+            # Engagement conditions in segment filters
+            models.Index(fields=['contact', 'opened_at']),
+            models.Index(fields=['contact', 'clicked_at']),
+            models.Index(fields=['contact', 'sent_at']),
+            # Daily metric rollups (dashboard/metrics.py)
+            models.Index(fields=['sent_at']),
+            models.Index(fields=['opened_at']),
+            models.Index(fields=['clicked_at']),
+        ]
 
     def __str__(self):
         return f"{self.contact.email} - {self.status}"
 
+    def get_rendered_html(self):
+        """Full HTML as sent, rebuilt from the shared body when needed"""
+        if self.body_id is None:
+            return self.rendered_html
+        values = json.loads(self.body_values or '{}')
+        values[EMAIL_LOG_ID] = str(self.id)
+        return self.body.load().render(values)
+
+
+class EmailBody(models.Model):
+    """
+    Content-addressed, compressed HTML skeleton (literal chunks and merge
+    tag slots) shared by every EmailLog rendered from the same template version
+    """
+    digest = models.CharField(max_length=64, unique=True)  # sha256 of the skeleton
+    data = models.BinaryField()  # zlib-compressed CompiledText.dumps()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.digest
+
+    def load(self):
+        return CompiledText.loads(zlib.decompress(self.data).decode('utf-8'))
+
+    @classmethod
+    def store(cls, compiled):
+        """Return the EmailBody for a CompiledText, creating it once"""
+        skeleton = compiled.dumps()
+        digest = hashlib.sha256(skeleton.encode('utf-8')).hexdigest()
+        body, _ = cls.objects.get_or_create(
+            digest=digest,
+            defaults={'data': zlib.compress(skeleton.encode('utf-8'), 9)}
+        )
+        return body
+
+
+class EmailLink(models.Model):
+    """Distinct URL seen in click tracking"""
+    url = models.TextField()
+    url_hash = models.CharField(max_length=64, unique=True)  # sha256 of url
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.url
+
+    @staticmethod
+    def hash_url(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+class EmailClick(models.Model):
+    """Append-only click event; one row per tracked click"""
+    email_log = models.ForeignKey(EmailLog, on_delete=models.CASCADE, related_name='clicks')
+    # Denormalized from email_log so per-campaign aggregates stay on one index
+    campaign = models.ForeignKey(Campaign, on_delete=models.SET_NULL, null=True, blank=True, related_name='clicks')
+    link = models.ForeignKey(EmailLink, on_delete=models.CASCADE, related_name='clicks')
+    clicked_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-clicked_at']
+        indexes = [
+            models.Index(fields=['campaign', 'link']),
+            models.Index(fields=['link', 'clicked_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.email_log_id} - {self.link_id}"
@@ -0,0 +1,16 @@
+import os
+
+import redis
+from django.conf import settings
+
+_client = None
+_client_pid = None
+
+
+def get_redis():
+    """Redis client for this process (recreated after a fork)"""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+        _client_pid = os.getpid()
+    return _client
@@ -0,0 +1,168 @@
+"""
+Compiled merge-tag rendering for EmailTemplate.
+
+A template is parsed once into a list of literal chunks with slots for merge
+tags, the tracking pixel and rewritten click-tracking links. Rendering for a
+recipient only fills the slots and joins the list. Compiled templates are
+cached per process by template id and invalidated when updated_at changes;
+the cache keeps the CACHE_SIZE most recently used templates.
+"""
+import html as html_lib
+import json
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+MERGE_TAG_KEYS = ['first_name', 'last_name', 'full_name', 'email', 'phone', 'company_name']
+EMAIL_LOG_ID = 'email_log_id'
+
+TOKEN_RE = re.compile(
+    r'(?P<tag>\{\{(?P<key>\w+)\}\})'
+    r'|(?P<href>href=(?P<quote>["\'])(?P<url>https?://[^"\']*)(?P=quote))'
+    r'|(?P<body></body>)'
+)
+
+CACHE_SIZE = 256
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class CompiledText:
+    """Literal chunks interleaved with slots, filled by render()"""
+    __slots__ = ('parts', 'slots')
+
+    def __init__(self):
+        self.parts = []
+        self.slots = []
+
+    def literal(self, text):
+        if not text:
+            return
+        if self.parts and not self._is_slot(len(self.parts) - 1):
+            self.parts[-1] += text
+        else:
+            self.parts.append(text)
+
+    def slot(self, key):
+        self.slots.append((len(self.parts), key))
+        self.parts.append('')
+
+    def _is_slot(self, index):
+        return bool(self.slots) and self.slots[-1][0] == index
+
+    def render(self, values):
+        parts = self.parts.copy()
+        for index, key in self.slots:
+            parts[index] = values[key]
+        return ''.join(parts)
+
+    @property
+    def keys(self):
+        """Merge tag keys this text uses"""
+        return {key for _, key in self.slots if key != EMAIL_LOG_ID}
+
+    def dumps(self):
+        """Serialize to compact JSON; loads() restores it"""
+        return json.dumps([self.parts, self.slots], separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, data):
+        compiled = cls()
+        parts, slots = json.loads(data)
+        compiled.parts = parts
+        compiled.slots = [tuple(slot) for slot in slots]
+        return compiled
+
+
+def _compile(source, html):
+    compiled = CompiledText()
+    position = 0
+
+    for match in TOKEN_RE.finditer(source):
+        compiled.literal(source[position:match.start()])
+        position = match.end()
+
+        if match.group('tag'):
+            key = match.group('key')
+            if key in MERGE_TAG_KEYS:
+                compiled.slot(key)
+            else:
+                # Unknown tags are left in place, as the old str.replace did
+                compiled.literal(match.group(0))
+        elif not html:
+            compiled.literal(match.group(0))
+        elif match.group('body'):
+            compiled.literal('<img src="/track/open/')
+            compiled.slot(EMAIL_LOG_ID)
+            compiled.literal('/" width="1" height="1" style="display:none;"></body>')
+        else:
+            url = match.group('url')
+            q = match.group('quote')
+            if '{{' in url:
+                # Personalised links are not rewritten; only their tags are filled
+                compiled.literal(f'href={q}')
+                inner = _compile(url, html=False)
+                inner_slots = dict(inner.slots)
+                for index, part in enumerate(inner.parts):
+                    if index in inner_slots:
+                        compiled.slot(inner_slots[index])
+                    else:
+                        compiled.literal(part)
+                compiled.literal(q)
+            else:
+                compiled.literal(f'href={q}/track/click/')
+                compiled.slot(EMAIL_LOG_ID)
+                # The attribute value is HTML-encoded (&amp;); the redirect target is not
+                compiled.literal(f'/?url={quote(html_lib.unescape(url), safe="")}{q}')
+
+    compiled.literal(source[position:])
+    return compiled
+
+
+class CompiledTemplate:
+    """Compiled subject and HTML body of an EmailTemplate"""
+
+    def __init__(self, template):
+        self.updated_at = template.updated_at
+        self.subject = _compile(template.subject, html=False)
+        self.html = _compile(template.html_body, html=True)
+        self.html_keys = sorted(self.html.keys)
+        self.body_id = None  # EmailBody holding self.html, set on first store
+
+    def render(self, merge_tags, email_log_id):
+        """Return (subject, html) for one recipient"""
+        values = {key: str(value) for key, value in merge_tags.items()}
+        values[EMAIL_LOG_ID] = str(email_log_id)
+        return self.subject.render(values), self.html.render(values)
+
+    def html_values(self, merge_tags):
+        """Compact JSON of just the merge tag values the HTML body uses"""
+        return json.dumps(
+            {key: str(merge_tags[key]) for key in self.html_keys},
+            separators=(',', ':')
+        )
+
+
+def compile_template(template):
+    """
+    Return the CompiledTemplate for template, compiling it on first use or
+    when the template has been edited since it was cached
+    """
+    if template.pk is None:
+        return CompiledTemplate(template)
+
+    with _cache_lock:
+        compiled = _cache.get(template.pk)
+        if compiled is not None and compiled.updated_at == template.updated_at:
+            _cache.move_to_end(template.pk)
+            return compiled
+
+    compiled = CompiledTemplate(template)
+    with _cache_lock:
+        _cache[template.pk] = compiled
+        _cache.move_to_end(template.pk)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
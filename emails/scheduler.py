@@ -0,0 +1,242 @@
+"""
+Rate-controlled dispatch of campaign sends.
+
+process_campaign only prepares pending EmailLog rows. dispatch_campaign_sends()
+runs every few seconds and moves pending logs of 'sending' campaigns onto the
+broker, limited by:
+
+- a global token bucket (EMAIL_SEND_RATE messages/sec)
+- one token bucket per recipient domain (EMAIL_DOMAIN_SEND_RATES, falling
+  back to EMAIL_DEFAULT_DOMAIN_SEND_RATE)
+- broker backpressure: nothing is dispatched while the send queue holds more
+  than EMAIL_DISPATCH_MAX_QUEUE_DEPTH tasks
+
+Logs handed to the broker are marked 'queued' with a lease of
+EMAIL_SEND_LEASE seconds. A batch that never finishes (its worker died or
+the message was lost) leaves its logs queued; once the lease expires the
+dispatcher puts them on the broker again under a new lease.
+
+Buckets and a run lock live in Redis, so dispatcher runs from any host share
+one budget and never overlap. The lock is token-checked and its timeout is
+reset after each campaign, so a long run keeps it; a run that finds it lost
+stops. If Redis is unreachable (development with eager tasks) the
+dispatcher still runs: without the broker-depth check or the lock, and
+with per-process buckets. Paused and cancelled campaigns are simply not
+dispatched; batches already on the broker hand their logs back to 'pending'
+(see send_email_batch_task), so nothing has to be drained to pause.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Campaign, EmailLog
+from .redis_client import get_redis
+
+BUCKET_KEY = 'email-send:bucket:{}'
+DISPATCH_LOCK_KEY = 'email-send:dispatch-lock'
+
+# Atomically refill a bucket for the time elapsed and take up to ARGV[4] tokens
+TAKE_TOKENS_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(requested, math.floor(tokens))
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - granted), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return granted
+"""
+
+
+# Per-process buckets used while Redis is unreachable: key -> (tokens, ts)
+_local_buckets = {}
+_local_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Redis-backed token bucket refilled at rate tokens/sec up to burst,
+    kept in this process instead while Redis is unreachable
+    """
+
+    def __init__(self, name, rate, burst):
+        self.key = BUCKET_KEY.format(name)
+        self.rate = rate
+        self.burst = max(burst, 1)
+
+    def take(self, requested):
+        """Take up to requested tokens; returns how many were granted"""
+        if requested <= 0:
+            return 0
+        now = time.time()
+        try:
+            return int(get_redis().eval(
+                TAKE_TOKENS_SCRIPT, 1, self.key, self.rate, self.burst, now, requested
+            ))
+        except redis.RedisError:
+            return self._take_local(now, requested)
+
+    def give_back(self, tokens):
+        """Return unused tokens (may briefly exceed burst until the next take)"""
+        if tokens <= 0:
+            return
+        try:
+            get_redis().hincrbyfloat(self.key, 'tokens', tokens)
+        except redis.RedisError:
+            with _local_lock:
+                if self.key in _local_buckets:
+                    available, ts = _local_buckets[self.key]
+                    _local_buckets[self.key] = (available + tokens, ts)
+
+    def _take_local(self, now, requested):
+        # Same refill rule as TAKE_TOKENS_SCRIPT
+        with _local_lock:
+            tokens, ts = _local_buckets.get(self.key, (self.burst, now))
+            tokens = min(self.burst, tokens + max(0, now - ts) * self.rate)
+            granted = min(requested, int(tokens))
+            _local_buckets[self.key] = (tokens - granted, now)
+        return granted
+
+
+def _bucket(name, rate):
+    return TokenBucket(name, rate, rate * settings.EMAIL_DISPATCH_INTERVAL)
+
+
+def domain_bucket(domain):
+    rate = settings.EMAIL_DOMAIN_SEND_RATES.get(domain, settings.EMAIL_DEFAULT_DOMAIN_SEND_RATE)
+    return _bucket(f'domain:{domain}', rate)
+
+
+def broker_queue_depth():
+    """
+    Number of tasks waiting in the send queue on the Redis broker; 0 when
+    Redis is unreachable
+    """
+    try:
+        return get_redis().llen(settings.EMAIL_DISPATCH_QUEUE)
+    except redis.RedisError:
+        return 0
+
+
+def lease_expiry(now=None):
+    """When a log queued now is put on the broker again if its batch has not finished"""
+    return (now or timezone.now()) + timedelta(seconds=settings.EMAIL_SEND_LEASE)
+
+
+def requeue_expired(enqueue):
+    """
+    Put queued logs whose lease has expired back on the broker under a new
+    lease, in chunks. Returns the number requeued.
+    """
+    now = timezone.now()
+    chunk_size = settings.CAMPAIGN_FANOUT_CHUNK_SIZE
+    expired = EmailLog.objects.filter(
+        status='queued',
+        lease_expires_at__lte=now
+    ).order_by('id').values_list('id', flat=True)
+    requeued = 0
+    while True:
+        chunk = list(expired[:chunk_size])
+        if not chunk:
+            return requeued
+        EmailLog.objects.filter(id__in=chunk, status='queued').update(lease_expires_at=lease_expiry(now))
+        enqueue(chunk)
+        requeued += len(chunk)
+
+
+def dispatch_campaign_sends(enqueue):
+    """
+    Dispatch as many pending campaign emails as the rate limits allow.
+    enqueue(email_log_ids) puts one batch on the broker. Returns the number
+    of emails dispatched.
+    """
+    if broker_queue_depth() > settings.EMAIL_DISPATCH_MAX_QUEUE_DEPTH:
+        return 0
+
+    # One dispatcher at a time; an overlapping run just skips its turn
+    lock = get_redis().lock(DISPATCH_LOCK_KEY, timeout=settings.EMAIL_DISPATCH_INTERVAL * 10)
+    try:
+        if not lock.acquire(blocking=False):
+            return 0
+    except redis.RedisError:
+        lock = None
+
+    try:
+        requeue_expired(enqueue)
+        return _dispatch(enqueue, lambda: _keep_lock(lock))
+    finally:
+        if lock is not None:
+            try:
+                lock.release()
+            except redis.RedisError:
+                # Expired (and maybe taken by another run) or Redis went away
+                pass
+
+
+def _keep_lock(lock):
+    """
+    Reset the run lock's timeout. False if it expired and another run may
+    hold it now; True without a lock or when Redis has gone away.
+    """
+    if lock is None:
+        return True
+    try:
+        lock.reacquire()
+    except redis.exceptions.LockNotOwnedError:
+        return False
+    except redis.RedisError:
+        pass
+    return True
+
+
+def _dispatch(enqueue, keep_lock):
+    global_bucket = _bucket('global', settings.EMAIL_SEND_RATE)
+    budget = global_bucket.take(int(settings.EMAIL_SEND_RATE * settings.EMAIL_DISPATCH_INTERVAL))
+    dispatched = 0
+
+    campaign_ids = Campaign.objects.filter(status='sending').order_by('started_at').values_list('id', flat=True)
+    for campaign_id in campaign_ids:
+        if dispatched >= budget or not keep_lock():
+            break
+
+        # Look past the budget so one throttled domain cannot starve the rest
+        window = (budget - dispatched) * settings.EMAIL_DISPATCH_LOOKAHEAD
+        candidates = EmailLog.objects.filter(
+            campaign_id=campaign_id,
+            status='pending'
+        ).order_by('id').values_list('id', 'contact__email')[:window]
+
+        by_domain = {}
+        for log_id, email in candidates:
+            domain = email.rsplit('@', 1)[-1].lower()
+            by_domain.setdefault(domain, []).append(log_id)
+
+        selected = []
+        for domain, log_ids in by_domain.items():
+            wanted = min(len(log_ids), budget - dispatched - len(selected))
+            if wanted <= 0:
+                break
+            granted = domain_bucket(domain).take(wanted)
+            selected.extend(log_ids[:granted])
+
+        # Mark as queued so the next run does not pick them up again
+        chunk_size = settings.CAMPAIGN_FANOUT_CHUNK_SIZE
+        for i in range(0, len(selected), chunk_size):
+            chunk = selected[i:i + chunk_size]
+            EmailLog.objects.filter(id__in=chunk, status='pending').update(
+                status='queued',
+                lease_expires_at=lease_expiry()
+            )
+            enqueue(chunk)
+            dispatched += len(chunk)
+
+    global_bucket.give_back(budget - dispatched)
+    return dispatched
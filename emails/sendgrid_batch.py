@@ -0,0 +1,199 @@
+"""
+Batched delivery through the SendGrid v3 mail/send API.
+
+One request carries up to SENDGRID_BATCH_SIZE recipients as personalizations.
+The template content is sent once with {{merge_tag}} placeholders and each
+personalization supplies its own substitutions, so the payload grows with the
+number of recipients rather than with recipients x body size.
+"""
+import json
+import os
+import re
+import threading
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from .rendering import EMAIL_LOG_ID, MERGE_TAG_KEYS, compile_template
+
+PERSONALIZATION_ERROR_RE = re.compile(r'^personalizations\.(\d+)\b')
+
+_local = threading.local()
+
+
+class SendGridBatchClient:
+    """Keep-alive HTTP client for the SendGrid mail/send endpoint"""
+
+    def __init__(self, api_key, host):
+        self.url = f"{host.rstrip('/')}/v3/mail/send"
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json',
+        })
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def send(self, payload):
+        return self.session.post(self.url, json=payload, timeout=settings.SENDGRID_TIMEOUT)
+
+    def close(self):
+        self.session.close()
+
+
+def get_client():
+    """
+    Return the SendGrid client for this worker process, creating it on
+    first use. Keyed on the pid so a client is never shared across a fork.
+    """
+    client = getattr(_local, 'client', None)
+    if client is None or _local.pid != os.getpid():
+        client = SendGridBatchClient(settings.SENDGRID_API_KEY, settings.SENDGRID_API_HOST)
+        _local.client = client
+        _local.pid = os.getpid()
+    return client
+
+
+def build_payload(template, email_logs, merge_tags):
+    """
+    Build one mail/send payload for email_logs, which must all share template.
+    merge_tags maps each log id to its {key: value} merge tag dict.
+    """
+    personalizations = []
+    for email_log in email_logs:
+        substitutions = {
+            f'{{{{{key}}}}}': str(value) for key, value in merge_tags[email_log.id].items()
+        }
+        substitutions[f'{{{{{EMAIL_LOG_ID}}}}}'] = str(email_log.id)
+        personalizations.append({
+            'to': [{'email': email_log.contact.email}],
+            'substitutions': substitutions,
+            'custom_args': {'email_log_id': str(email_log.id)},
+        })
+
+    from_email = {'email': template.from_email or settings.DEFAULT_FROM_EMAIL}
+    if template.from_name:
+        from_email['name'] = template.from_name
+
+    # Render the compiled template with the substitution keys themselves, so
+    # tracking pixel and click links carry a per-recipient placeholder
+    placeholders = {key: f'{{{{{key}}}}}' for key in MERGE_TAG_KEYS}
+    subject, html = compile_template(template).render(placeholders, f'{{{{{EMAIL_LOG_ID}}}}}')
+
+    content = []
+    if template.plain_body:
+        content.append({'type': 'text/plain', 'value': template.plain_body})
+    content.append({
+        'type': 'text/html',
+        'value': html,
+    })
+
+    return {
+        'personalizations': personalizations,
+        'from': from_email,
+        'subject': subject,
+        'content': content,
+    }
+
+
+def _rejected_personalizations(body):
+    """Map personalization index -> error message from a 400 response body"""
+    rejected = {}
+    try:
+        errors = json.loads(body or b'{}').get('errors', [])
+    except (ValueError, AttributeError):
+        return rejected
+    for error in errors:
+        match = PERSONALIZATION_ERROR_RE.match(error.get('field') or '')
+        if match:
+            rejected[int(match.group(1))] = error.get('message', 'Rejected by SendGrid')
+    return rejected
+
+
+def _retry_after(headers, now):
+    """
+    When SendGrid asks to be retried, from the Retry-After header (seconds
+    or an HTTP date), else SENDGRID_RETRY_AFTER seconds from now
+    """
+    value = (headers.get('Retry-After') or '').strip()
+    if value.isdigit():
+        return now + timedelta(seconds=int(value))
+    try:
+        return max(parsedate_to_datetime(value), now)
+    except (TypeError, ValueError, IndexError):
+        return now + timedelta(seconds=settings.SENDGRID_RETRY_AFTER)
+
+
+def record_request_failure(email_logs, error):
+    """Fail email_logs whose request never got a response"""
+    for email_log in email_logs:
+        email_log.status = 'failed'
+        email_log.error_message = f'SendGrid request failed: {error}'
+
+
+def record_response(email_logs, status_code, headers, body, retry):
+    """
+    Record a mail/send response on the logs it was sent for. If SendGrid
+    rejected specific personalizations and retry is set, those logs are
+    failed and the remaining ones are returned to be sent again.
+
+    A 429 or 5xx fails nothing: the logs stay queued under a lease that
+    runs out at Retry-After, and the dispatcher requeues them then.
+    """
+    if status_code in [200, 201, 202]:
+        sent_at = timezone.now()
+        message_id = headers.get('X-Message-Id', '')
+        for email_log in email_logs:
+            email_log.status = 'sent'
+            email_log.sent_at = sent_at
+            email_log.email_id = message_id
+            email_log.error_message = ''
+        return []
+
+    if status_code == 429 or status_code >= 500:
+        retry_at = _retry_after(headers, timezone.now())
+        for email_log in email_logs:
+            email_log.status = 'queued'
+            email_log.lease_expires_at = retry_at
+            email_log.error_message = f'SendGrid error: {status_code}, retrying'
+        return []
+
+    rejected = _rejected_personalizations(body) if status_code == 400 else {}
+    if not rejected or not retry:
+        for email_log in email_logs:
+            email_log.status = 'failed'
+            email_log.error_message = f'SendGrid error: {status_code}'
+        return []
+
+    for index, message in rejected.items():
+        if index < len(email_logs):
+            email_logs[index].status = 'failed'
+            email_logs[index].error_message = f'SendGrid error: {message}'
+    return [log for i, log in enumerate(email_logs) if i not in rejected]
+
+
+def send_batch(template, email_logs, merge_tags):
+    """
+    Send email_logs in one API call and record the outcome on each log in
+    place (status, sent_at, email_id, error_message). Nothing is saved here.
+
+    If SendGrid rejects specific personalizations, those logs are failed and
+    the remaining recipients are retried once without them. Rate limited or
+    5xx requests are left queued for the dispatcher to retry later.
+    """
+    client = get_client()
+    pending = list(email_logs)
+
+    for attempt in range(2):
+        if not pending:
+            return
+        try:
+            response = client.send(build_payload(template, pending, merge_tags))
+        except requests.RequestException as e:
+            record_request_failure(pending, e)
+            return
+        pending = record_response(pending, response.status_code, response.headers, response.content, retry=not attempt)
@@ -0,0 +1,101 @@
+"""
+Pooled connections for the Django email backend path.
+
+send_mail() opens a connection (STARTTLS, AUTH) and closes it again for
+every message. Instead each worker process keeps one open backend
+connection and sends through its send_messages(). A connection idle longer
+than EMAIL_SMTP_MAX_IDLE seconds or that has carried EMAIL_SMTP_MAX_MESSAGES
+messages is recycled, and a send that fails because the server dropped the
+connection is retried once on a fresh one.
+"""
+import os
+import smtplib
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core import mail
+
+# Failures that mean the connection is gone rather than the message refused
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, socket.timeout)
+
+_local = threading.local()
+
+
+class PooledConnection:
+    """Long-lived email backend connection that reconnects when needed"""
+
+    def __init__(self):
+        self.backend = mail.get_connection(fail_silently=False)
+        self.is_open = False
+        self.sent = 0
+        self.last_used = 0
+
+    def _ensure_open(self):
+        if self.is_open and (
+            time.monotonic() - self.last_used > settings.EMAIL_SMTP_MAX_IDLE
+            or self.sent >= settings.EMAIL_SMTP_MAX_MESSAGES
+        ):
+            self.close()
+        if not self.is_open:
+            self.backend.open()
+            self.is_open = True
+            self.sent = 0
+
+    def close(self):
+        try:
+            self.backend.close()
+        except OSError:
+            # Already dropped by the server; nothing left to close
+            pass
+        self.is_open = False
+
+    def send(self, message):
+        """Send one EmailMessage, reconnecting once if the connection dropped"""
+        for attempt in range(2):
+            self._ensure_open()
+            try:
+                self.backend.send_messages([message])
+            except CONNECTION_ERRORS:
+                self.close()
+                if attempt:
+                    raise
+                continue
+            self.sent += 1
+            self.last_used = time.monotonic()
+            return
+
+
+def get_pooled_connection():
+    """
+    Return this worker's pooled connection, creating it on first use.
+    Keyed on the pid so a connection is never shared across a fork.
+    """
+    connection = getattr(_local, 'connection', None)
+    if connection is None or _local.pid != os.getpid():
+        connection = PooledConnection()
+        _local.connection = connection
+        _local.pid = os.getpid()
+    return connection
+
+
+def send_message(message):
+    """Send one EmailMessage on the pooled connection; raises on failure"""
+    get_pooled_connection().send(message)
+
+
+def send_messages(messages):
+    """
+    Send EmailMessages on the pooled connection. Returns one entry per
+    message: None if it was sent, otherwise the exception that failed it.
+    """
+    connection = get_pooled_connection()
+    errors = []
+    for message in messages:
+        try:
+            connection.send(message)
+            errors.append(None)
+        except Exception as e:
+            errors.append(e)
+    return errors
@@ -1,105 +1,95 @@
-import json
 from datetime import datetime, timedelta
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives
 from django.utils import timezone
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
 from django.conf import settings
 
-from .models import Campaign, EmailLog, EmailTemplate
-from contacts.models import Contact
+from .async_sender import send_batches
+from .campaign_stats import complete_campaign_if_done, increment_campaign_counters
+from .models import Campaign, EmailBody, EmailLog, EmailTemplate
+from .rendering import compile_template
+from .scheduler import dispatch_campaign_sends
+from .sendgrid_batch import send_batch
+from .smtp_pool import send_message, send_messages
+from .tracking_buffer import flush_click_buffer, flush_open_buffer
+from contacts.segments import compile_segment, segment_contacts
 
 
-@shared_task
-def send_email_task(email_log_id):
+def get_merge_tags(contact):
+    """Merge tag values for a contact"""
+    return {
+        'first_name': contact.first_name,
+        'last_name': contact.last_name,
+        'full_name': contact.full_name,
+        'email': contact.email,
+        'phone': contact.phone or '',
+        'company_name': contact.company.name if contact.company else '',
+    }
+
+
+def get_body_id(compiled):
+    """Id of the shared EmailBody for a compiled template's HTML"""
+    if compiled.body_id is None:
+        compiled.body_id = EmailBody.store(compiled.html).id
+    return compiled.body_id
+
+
+def render_email(email_log, merge_tags):
     """
-    Send a single email using SendGrid API
+    Render subject and HTML for an EmailLog and return the HTML. The log
+    keeps the subject plus a reference to the shared HTML skeleton and the
+    recipient's merge tag values, not a full copy of the HTML.
+    """
+    # Compiled once per template version; tracking pixel and click links
+    # are already placed, so this is a single join per recipient
+    compiled = compile_template(email_log.template)
+    email_log.rendered_subject, rendered_html = compiled.render(merge_tags, email_log.id)
+    email_log.body_id = get_body_id(compiled)
+    email_log.body_values = compiled.html_values(merge_tags)
+    return rendered_html
+
+
+def build_message(email_log, rendered_html):
+    """EmailMessage for a rendered EmailLog, as send_mail would build it"""
+    message = EmailMultiAlternatives(
+        email_log.rendered_subject,
+        email_log.template.plain_body or '',
+        settings.DEFAULT_FROM_EMAIL,
+        [email_log.contact.email],
+    )
+    message.attach_alternative(rendered_html, 'text/html')
+    return message
+
+
+def deliver_email(email_log):
+    """
+    Render and send a single EmailLog, updating its status in place
     """
+    contact = email_log.contact
+    template = email_log.template
+    
+    if not template:
+        email_log.status = 'failed'
+        email_log.error_message = 'No template found'
+        email_log.save()
+        return
+    
     try:
-        email_log = EmailLog.objects.get(id=email_log_id)
-        contact = email_log.contact
-        template = email_log.template
-        
-        if not template:
-            email_log.status = 'failed'
-            email_log.error_message = 'No template found'
-            email_log.save()
-            return
-        
-        # Render template with merge tags
-        merge_tags = {
-            'first_name': contact.first_name,
-            'last_name': contact.last_name,
-            'full_name': contact.full_name,
-            'email': contact.email,
-            'phone': contact.phone or '',
-            'company_name': contact.company.name if contact.company else '',
-        }
-        
-        # Simple template rendering (replace {{key}} with values)
-        rendered_subject = template.subject
-        rendered_html = template.html_body
-        
-        for key, value in merge_tags.items():
-            rendered_subject = rendered_subject.replace(f'{{{{{key}}}}}', str(value))
-            rendered_html = rendered_html.replace(f'{{{{{key}}}}}', str(value))
-        
-        # Add tracking pixel to HTML
-        tracking_pixel = f'<img src="/track/open/{email_log.id}/" width="1" height="1" style="display:none;">'
-        rendered_html = rendered_html.replace('</body>', f'{tracking_pixel}</body>')
-        
-        # Store rendered content
-        email_log.rendered_subject = rendered_subject
-        email_log.rendered_html = rendered_html
+        merge_tags = get_merge_tags(contact)
+        rendered_html = render_email(email_log, merge_tags)
         
         if settings.SENDGRID_API_KEY:
-            # Send via SendGrid
-            message = Mail(
-                from_email=(template.from_email or settings.DEFAULT_FROM_EMAIL),
-                to_emails=contact.email,
-                subject=rendered_subject,
-                html_content=rendered_html,
-                plain_text_content=template.plain_body or ''
-            )
-            
-            sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
-            response = sg.send(message)
-            
-            if response.status_code in [200, 201, 202]:
-                email_log.status = 'sent'
-                email_log.sent_at = timezone.now()
-                email_log.email_id = response.headers.get('X-Message-Id', '')
-            else:
-                email_log.status = 'failed'
-                email_log.error_message = f'SendGrid error: {response.status_code}'
+            # Send via SendGrid (one-recipient batch on the shared client)
+            send_batch(template, [email_log], {email_log.id: merge_tags})
         else:
-            # Use Django email backend (console or SMTP)
-            send_mail(
-                rendered_subject,
-                template.plain_body or '',
-                settings.DEFAULT_FROM_EMAIL,
-                [contact.email],
-                html_message=rendered_html,
-                fail_silently=False,
-            )
+            # Use Django email backend (console or SMTP) on the pooled connection
+            send_message(build_message(email_log, rendered_html))
             
             email_log.status = 'sent'
             email_log.sent_at = timezone.now()
         
         email_log.save()
         
-        # Update campaign stats
-        if email_log.campaign:
-            campaign = email_log.campaign
-            campaign.sent_count = EmailLog.objects.filter(
-                campaign=campaign,
-                status__in=['sent', 'delivered']
-            ).count()
-            campaign.save()
-        
-        return f"Email sent to {contact.email}"
-        
     except Exception as e:
         email_log.status = 'failed'
         email_log.error_message = str(e)
@@ -107,71 +97,305 @@ def send_email_task(email_log_id):
         raise
 
 
+def prepare_sendgrid_batches(email_logs, batch_size):
+    """
+    Render EmailLogs and group them into [(template, logs, merge_tags)]
+    batches of up to batch_size recipients sharing a template
+    """
+    by_template = {}
+    for email_log in email_logs:
+        if not email_log.template:
+            email_log.status = 'failed'
+            email_log.error_message = 'No template found'
+        else:
+            by_template.setdefault(email_log.template_id, []).append(email_log)
+    
+    batches = []
+    for template_logs in by_template.values():
+        template = template_logs[0].template
+        for i in range(0, len(template_logs), batch_size):
+            batch = template_logs[i:i + batch_size]
+            merge_tags = {}
+            for email_log in batch:
+                merge_tags[email_log.id] = get_merge_tags(email_log.contact)
+                render_email(email_log, merge_tags[email_log.id])
+            batches.append((template, batch, merge_tags))
+    return batches
+
+
+def save_delivery_results(email_logs):
+    """
+    Write per-recipient delivery results back in bulk
+    """
+    now = timezone.now()
+    for email_log in email_logs:
+        email_log.updated_at = now
+    EmailLog.objects.bulk_update(email_logs, [
+        'status', 'sent_at', 'email_id', 'error_message', 'lease_expires_at',
+        'rendered_subject', 'body', 'body_values', 'updated_at',
+    ])
+
+
+def deliver_sendgrid_batch(email_logs):
+    """
+    Send EmailLogs through SendGrid, up to SENDGRID_BATCH_SIZE recipients
+    per API call, and write the per-recipient results back in bulk
+    """
+    for template, batch, merge_tags in prepare_sendgrid_batches(email_logs, settings.SENDGRID_BATCH_SIZE):
+        send_batch(template, batch, merge_tags)
+    save_delivery_results(email_logs)
+
+
+def deliver_sendgrid_async(email_logs):
+    """
+    Send EmailLogs through SendGrid with many requests in flight at once
+    (EMAIL_ASYNC_CONCURRENCY) and write the results back in bulk
+    """
+    send_batches(prepare_sendgrid_batches(email_logs, settings.EMAIL_ASYNC_REQUEST_SIZE))
+    save_delivery_results(email_logs)
+
+
+def deliver_smtp_batch(email_logs):
+    """
+    Send EmailLogs through the Django email backend over one pooled
+    connection and write the per-recipient results back in bulk
+    """
+    sendable = []
+    messages = []
+    for email_log in email_logs:
+        if not email_log.template:
+            email_log.status = 'failed'
+            email_log.error_message = 'No template found'
+            continue
+        try:
+            rendered_html = render_email(email_log, get_merge_tags(email_log.contact))
+        except Exception as e:
+            email_log.status = 'failed'
+            email_log.error_message = str(e)
+            continue
+        sendable.append(email_log)
+        messages.append(build_message(email_log, rendered_html))
+    
+    errors = send_messages(messages)
+    sent_at = timezone.now()
+    for email_log, error in zip(sendable, errors):
+        if error is None:
+            email_log.status = 'sent'
+            email_log.sent_at = sent_at
+        else:
+            email_log.status = 'failed'
+            email_log.error_message = str(error)
+    
+    save_delivery_results(email_logs)
+
+
+@shared_task
+def send_email_task(email_log_id):
+    """
+    Send a single email using SendGrid API
+    """
+    email_log = EmailLog.objects.select_related(
+        'contact__company', 'template'
+    ).get(id=email_log_id)
+    
+    deliver_email(email_log)
+    
+    # Update campaign stats
+    if email_log.campaign_id:
+        increment_campaign_counters(
+            email_log.campaign_id,
+            sent=int(email_log.status == 'sent'),
+            failed=int(email_log.status == 'failed'),
+        )
+    
+    return f"Email sent to {email_log.contact.email}"
+
+
 @shared_task
+def send_email_batch_task(email_log_ids):
+    """
+    Send a chunk of campaign emails queued by the send dispatcher.
+    Logs that are no longer queued (already sent by an earlier,
+    interrupted run) are skipped. Logs of campaigns paused or cancelled
+    since dispatch are handed back as pending.
+    """
+    email_logs = list(EmailLog.objects.select_related(
+        'contact__company', 'template', 'campaign'
+    ).filter(id__in=email_log_ids, status='queued').order_by('id'))
+    
+    held = [
+        email_log.id for email_log in email_logs
+        if email_log.campaign and email_log.campaign.status in ['paused', 'cancelled']
+    ]
+    if held:
+        EmailLog.objects.filter(id__in=held, status='queued').update(status='pending')
+        email_logs = [email_log for email_log in email_logs if email_log.id not in held]
+    
+    if settings.SENDGRID_API_KEY and settings.EMAIL_SENDER_MODE == 'async':
+        deliver_sendgrid_async(email_logs)
+    elif settings.SENDGRID_API_KEY:
+        deliver_sendgrid_batch(email_logs)
+    else:
+        deliver_smtp_batch(email_logs)
+    
+    # Aggregate outcomes per campaign and flush them in one UPDATE each
+    results = {}
+    for email_log in email_logs:
+        if email_log.campaign_id:
+            counts = results.setdefault(email_log.campaign_id, {'sent': 0, 'failed': 0})
+            if email_log.status in counts:
+                counts[email_log.status] += 1
+    
+    for campaign_id, counts in results.items():
+        increment_campaign_counters(campaign_id, **counts)
+    
+    sent = sum(1 for email_log in email_logs if email_log.status == 'sent')
+    return f"Sent {sent} of {len(email_log_ids)} emails"
+
+
+def get_campaign_contacts(campaign):
+    """
+    Contacts in the campaign's audience: its segment (read from the
+    membership table when materialized), else its inline segment filter
+    """
+    if campaign.segment_id:
+        return segment_contacts(campaign.segment)
+    return compile_segment(campaign.segment_filter)
+
+
+@shared_task(acks_late=True)
 def process_campaign(campaign_id):
     """
-    Process a campaign: create EmailLog entries for each contact
-    and queue send tasks
+    Process a campaign: stream matching contact ids in keyset-ordered
+    chunks and bulk insert pending EmailLog entries for each chunk. The
+    send dispatcher then puts them on the broker at a controlled rate.
+    
+    Campaign.fanout_cursor records the last contact id prepared, so a run
+    interrupted halfway resumes from there instead of starting over: the
+    task is acked late, and process_scheduled_campaigns restarts fan-outs
+    that stopped making progress (a worker child killed mid-run is acked,
+    not redelivered). If the fan-out raises, the campaign goes back to
+    draft with the error recorded.
     """
-    try:
-        campaign = Campaign.objects.get(id=campaign_id)
-        
-        if campaign.status not in ['draft', 'scheduled']:
-            return f"Campaign {campaign_id} is not in draft or scheduled state"
-        
+    campaign = Campaign.objects.select_related('template').get(id=campaign_id)
+    
+    fanout_unfinished = campaign.status in ['sending', 'paused'] and campaign.recipient_count is None
+    if campaign.status not in ['draft', 'scheduled'] and not fanout_unfinished:
+        return f"Campaign {campaign_id} is not in draft or scheduled state"
+    
+    if campaign.status in ['draft', 'scheduled']:
         campaign.status = 'sending'
         campaign.started_at = timezone.now()
-        campaign.save()
-        
-        # Get contacts based on segment filter
-        contacts = Contact.objects.all()
-        
-        if campaign.segment_filter:
-            try:
-                filters = json.loads(campaign.segment_filter)
-                if 'status' in filters:
-                    contacts = contacts.filter(status=filters['status'])
-                if 'tags' in filters:
-                    contacts = contacts.filter(tags__icontains=filters['tags'])
-            except json.JSONDecodeError:
-                pass
-        
-        # Create EmailLog entries and queue sends
-        for contact in contacts:
-            email_log, created = EmailLog.objects.get_or_create(
-                contact=contact,
-                campaign=campaign,
-                template=campaign.template,
-                defaults={'status': 'pending'}
-            )
-            
-            if created or email_log.status == 'pending':
-                # Queue the send task
-                send_email_task.delay(email_log.id)
-        
-        return f"Campaign {campaign_id} queued for sending"
-        
+        campaign.fanout_cursor = 0
+        campaign.recipient_count = None
+        campaign.error_message = ''
+        campaign.save(update_fields=[
+            'status', 'started_at', 'fanout_cursor', 'recipient_count', 'error_message', 'updated_at'
+        ])
+    
+    try:
+        recipient_count = fan_out_campaign(campaign)
     except Exception as e:
-        campaign = Campaign.objects.get(id=campaign_id)
-        campaign.status = 'draft'
-        campaign.save()
+        Campaign.objects.filter(
+            id=campaign.id,
+            status__in=['sending', 'paused'],
+            recipient_count__isnull=True
+        ).update(status='draft', error_message=f'Preparing recipients failed: {e}', updated_at=timezone.now())
         raise
+    
+    complete_campaign_if_done(campaign.id)
+    
+    # Start sending right away rather than at the next dispatcher tick
+    dispatch_campaign_sends_task.delay()
+    
+    return f"Campaign {campaign_id} prepared {recipient_count} emails for sending"
+
+
+def fan_out_campaign(campaign):
+    """
+    Insert pending EmailLogs for the campaign's audience from its
+    fanout_cursor on, then record and return recipient_count
+    """
+    contact_ids = get_campaign_contacts(campaign).order_by('id').values_list('id', flat=True)
+    chunk_size = settings.CAMPAIGN_FANOUT_CHUNK_SIZE
+    cursor = campaign.fanout_cursor
+    
+    while True:
+        chunk = list(contact_ids.filter(id__gt=cursor)[:chunk_size])
+        if not chunk:
+            break
+        
+        # The (contact, campaign, template) unique constraint makes this
+        # idempotent when a chunk is replayed after an interruption
+        EmailLog.objects.bulk_create(
+            [
+                EmailLog(
+                    contact_id=contact_id,
+                    campaign=campaign,
+                    template=campaign.template,
+                    status='pending'
+                )
+                for contact_id in chunk
+            ],
+            ignore_conflicts=True
+        )
+        
+        # updated_at doubles as the progress heartbeat for the stale sweep
+        cursor = chunk[-1]
+        Campaign.objects.filter(id=campaign.id).update(fanout_cursor=cursor, updated_at=timezone.now())
+    
+    # Fan-out is done: record the audience size once so batch tasks can
+    # detect completion from the counters alone
+    recipient_count = EmailLog.objects.filter(campaign=campaign).count()
+    Campaign.objects.filter(id=campaign.id).update(recipient_count=recipient_count)
+    return recipient_count
 
 
 @shared_task
 def process_scheduled_campaigns():
     """
-    Process campaigns that are scheduled to send now
+    Process campaigns that are scheduled to send now, and restart
+    fan-outs that have made no progress for CAMPAIGN_FANOUT_STALE_AFTER
+    seconds (their worker died)
     Runs every minute via Celery Beat
     """
     now = timezone.now()
     
-    scheduled_campaigns = Campaign.objects.filter(
+    scheduled_campaigns = list(Campaign.objects.filter(
         status='scheduled',
         scheduled_at__lte=now
-    )
+    ).values_list('id', flat=True))
     
-    for campaign in scheduled_campaigns:
-        process_campaign.delay(campaign.id)
+    stalled_campaigns = list(Campaign.objects.filter(
+        status__in=['sending', 'paused'],
+        recipient_count__isnull=True,
+        updated_at__lte=now - timedelta(seconds=settings.CAMPAIGN_FANOUT_STALE_AFTER)
+    ).values_list('id', flat=True))
     
-    return f"Processed {scheduled_campaigns.count()} scheduled campaigns"
+    for campaign_id in scheduled_campaigns + stalled_campaigns:
+        process_campaign.delay(campaign_id)
+    
+    return f"Processed {len(scheduled_campaigns)} scheduled campaigns, restarted {len(stalled_campaigns)} stalled"
+
+
+@shared_task
+def dispatch_campaign_sends_task():
+    """
+    Move pending campaign emails onto the broker within the global and
+    per-domain send rates
+    Runs every EMAIL_DISPATCH_INTERVAL seconds via Celery Beat
+    """
+    dispatched = dispatch_campaign_sends(send_email_batch_task.delay)
+    return f"Dispatched {dispatched} emails"
+
+
+@shared_task
+def flush_tracking_buffers():
+    """
+    Apply buffered open and click events to EmailLog, EmailClick and
+    campaign counters
+    Runs every 15 seconds via Celery Beat
+    """
+    opens = flush_open_buffer()
+    clicks = flush_click_buffer()
+    return f"Flushed opens for {opens} emails and {clicks} clicks"
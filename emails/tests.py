@@ -1,3 +1,172 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import redis
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from contacts.models import Contact
+from contacts.segment_filter import SegmentError
+
+from . import rendering, scheduler
+from .fake_sendgrid import FakeSendGridServer
+from .models import Campaign, EmailLog, EmailTemplate
+from .rendering import compile_template
+from .scheduler import dispatch_campaign_sends
+from .sendgrid_batch import SendGridBatchClient, send_batch
+from .tasks import process_campaign, process_scheduled_campaigns
+
+
+class ClickLinkRewriteTests(SimpleTestCase):
+
+    def tracked_url(self, html_body):
+        compiled = compile_template(EmailTemplate(subject='Hi', html_body=html_body))
+        _, html = compiled.render({}, 42)
+        href = html.split('href="', 1)[1].split('"', 1)[0]
+        self.assertTrue(href.startswith('/track/click/42/'))
+        return parse_qs(urlparse(href).query)['url'][0]
+
+    def test_plain_url(self):
+        self.assertEqual(self.tracked_url('<a href="https://example.com/page">x</a>'), 'https://example.com/page')
+
+    def test_html_encoded_query_string_is_decoded(self):
+        url = self.tracked_url('<a href="https://example.com/?a=1&amp;b=2">x</a>')
+        self.assertEqual(url, 'https://example.com/?a=1&b=2')
+
+
+class CompiledTemplateCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        patches = [mock.patch.object(rendering, 'CACHE_SIZE', 2), mock.patch.dict(rendering._cache, clear=True)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.now = timezone.now()
+
+    def template(self, pk, **kwargs):
+        return EmailTemplate(pk=pk, **{'subject': 'Hi', 'html_body': '<p>Hello</p>', 'updated_at': self.now, **kwargs})
+
+    def test_compiled_once_per_version(self):
+        compiled = compile_template(self.template(1))
+        self.assertIs(compile_template(self.template(1)), compiled)
+
+        edited = compile_template(self.template(1, subject='Hello', updated_at=self.now + timedelta(seconds=1)))
+        self.assertIsNot(edited, compiled)
+        self.assertEqual(edited.render({}, 1)[0], 'Hello')
+        self.assertEqual(list(rendering._cache), [1])
+
+    def test_least_recently_used_templates_are_dropped(self):
+        first = compile_template(self.template(1))
+        compile_template(self.template(2))
+        compile_template(self.template(1))
+        compile_template(self.template(3))
+
+        self.assertEqual(list(rendering._cache), [1, 3])
+        self.assertIs(compile_template(self.template(1)), first)
+
+
+class SendBatchTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = FakeSendGridServer()
+        self.server.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        client = SendGridBatchClient('test-key', self.server.url)
+        self.addCleanup(client.close)
+        patcher = mock.patch('emails.sendgrid_batch.get_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.template = EmailTemplate(subject='Hi {{first_name}}', html_body='<p>Hello</p>')
+        self.email_logs = [
+            EmailLog(id=1, status='queued', contact=Contact(email='ann@example.com')),
+            EmailLog(id=2, status='queued', contact=Contact(email='not-an-address')),
+            EmailLog(id=3, status='queued', contact=Contact(email='bob@example.com')),
+        ]
+        self.merge_tags = {email_log.id: {'first_name': 'Friend'} for email_log in self.email_logs}
+
+    def send(self, email_logs):
+        send_batch(self.template, email_logs, self.merge_tags)
+        return [email_log.status for email_log in email_logs]
+
+    def test_accepted(self):
+        email_logs = [self.email_logs[0], self.email_logs[2]]
+        self.assertEqual(self.send(email_logs), ['sent', 'sent'])
+        self.assertTrue(email_logs[0].email_id)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_rejected_personalization_fails_only_that_log(self):
+        self.assertEqual(self.send(self.email_logs), ['sent', 'failed', 'sent'])
+        self.assertEqual(self.email_logs[1].error_message, 'SendGrid error: Invalid email address')
+        self.assertEqual(self.server.recipients, 2)
+
+    def test_rate_limited_logs_stay_queued_until_retry_after(self):
+        self.server.error = (429, {'Retry-After': '120'})
+        before = timezone.now()
+        self.assertEqual(self.send(self.email_logs), ['queued', 'queued', 'queued'])
+        for email_log in self.email_logs:
+            self.assertGreaterEqual(email_log.lease_expires_at, before + timedelta(seconds=120))
+            self.assertEqual(email_log.error_message, 'SendGrid error: 429, retrying')
+
+
+class ProcessCampaignTests(TestCase):
+
+    def setUp(self):
+        self.template = EmailTemplate.objects.create(name='Welcome', subject='Hi', html_body='<p>Hello</p>')
+        for i in range(3):
+            Contact.objects.create(first_name='Ann', last_name=f'Lee{i}', email=f'ann{i}@example.com')
+        patcher = mock.patch('emails.tasks.dispatch_campaign_sends_task.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_invalid_filter_returns_campaign_to_draft(self):
+        campaign = Campaign.objects.create(name='Bad', template=self.template, segment_filter='{"bogus": 1}')
+        with self.assertRaises(SegmentError):
+            process_campaign(campaign.id)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'draft')
+        self.assertIn('Unknown condition', campaign.error_message)
+
+    def test_stalled_fanout_is_restarted(self):
+        stalled = Campaign.objects.create(name='Stalled', template=self.template, status='sending')
+        Campaign.objects.create(name='Running', template=self.template, status='sending')
+        Campaign.objects.filter(id=stalled.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        with mock.patch('emails.tasks.process_campaign.delay') as delay:
+            process_scheduled_campaigns()
+        delay.assert_called_once_with(stalled.id)
+
+
+@override_settings(EMAIL_SEND_RATE=1, EMAIL_DEFAULT_DOMAIN_SEND_RATE=100)
+class DispatchWithoutRedisTests(TestCase):
+
+    def setUp(self):
+        # Nothing listens on port 1: every Redis call fails to connect
+        patcher = mock.patch('emails.scheduler.get_redis', return_value=redis.Redis(port=1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        scheduler._local_buckets.clear()
+
+        template = EmailTemplate.objects.create(name='Welcome', subject='Hi', html_body='<p>Hello</p>')
+        campaign = Campaign.objects.create(name='Launch', template=template, status='sending', started_at=timezone.now())
+        for i in range(20):
+            contact = Contact.objects.create(first_name='Ann', last_name=f'Lee{i}', email=f'ann{i}@example.com')
+            EmailLog.objects.create(contact=contact, campaign=campaign, template=template, status='pending')
+
+    def test_dispatches_within_a_local_bucket(self):
+        batches = []
+        dispatched = dispatch_campaign_sends(batches.append)
+        # EMAIL_SEND_RATE x EMAIL_DISPATCH_INTERVAL tokens
+        self.assertEqual(dispatched, 5)
+        self.assertEqual(sum(len(batch) for batch in batches), 5)
+        self.assertEqual(EmailLog.objects.filter(status='queued').count(), 5)
+
+        # The bucket is spent until it refills
+        self.assertEqual(dispatch_campaign_sends(batches.append), 0)
+
+    def test_lost_lock_stops_the_run(self):
+        lock = mock.Mock()
+        lock.reacquire.side_effect = redis.exceptions.LockNotOwnedError
+        self.assertFalse(scheduler._keep_lock(lock))
+        self.assertTrue(scheduler._keep_lock(None))
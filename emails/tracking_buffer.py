@@ -0,0 +1,233 @@
+"""
+Write buffers for email open and click tracking.
+
+Tracking hits are recorded in Redis and applied to the database in batches
+by flush_open_buffer() / flush_click_buffer(), which run periodically from
+Celery Beat:
+
+- opens: a per-log open counter plus the first open timestamp (hashes)
+- clicks: a list of compact "log_id:link_id:timestamp" events, bulk inserted
+  into the append-only EmailClick table
+
+If Redis is unreachable a hit is applied to the database directly so it is
+never lost.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+import redis
+from django.db.models import Case, DateTimeField, F, Value, When
+
+from contacts.tasks import schedule_membership_update
+from .campaign_stats import increment_campaign_counters
+from .models import EmailClick, EmailLink, EmailLog
+from .redis_client import get_redis
+
+OPEN_COUNTS_KEY = 'tracking:opens:counts'
+OPEN_FIRST_KEY = 'tracking:opens:first'
+CLICK_EVENTS_KEY = 'tracking:clicks:events'
+FLUSHING_SUFFIX = ':flushing'
+FLUSH_LOCK_KEY = 'tracking:flush-lock:{}'
+UPDATE_CHUNK_SIZE = 500
+LINK_CACHE_SIZE = 10000
+
+_link_ids = {}
+
+
+def get_link_id(url):
+    """EmailLink id for url, cached per process"""
+    url_hash = EmailLink.hash_url(url)
+    link_id = _link_ids.get(url_hash)
+    if link_id is None:
+        link_id = EmailLink.objects.get_or_create(url_hash=url_hash, defaults={'url': url})[0].id
+        if len(_link_ids) >= LINK_CACHE_SIZE:
+            _link_ids.clear()
+        _link_ids[url_hash] = link_id
+    return link_id
+
+
+def _to_datetime(timestamp):
+    return datetime.fromtimestamp(float(timestamp), tz=dt_timezone.utc)
+
+
+def _chunks(items):
+    for i in range(0, len(items), UPDATE_CHUNK_SIZE):
+        yield items[i:i + UPDATE_CHUNK_SIZE]
+
+
+def _increment_by_count(counts, field):
+    """field += n for each log id, one UPDATE per distinct n and chunk"""
+    by_count = {}
+    for log_id, count in counts.items():
+        by_count.setdefault(count, []).append(log_id)
+    for count, log_ids in by_count.items():
+        for chunk in _chunks(log_ids):
+            EmailLog.objects.filter(id__in=chunk).update(**{field: F(field) + count})
+
+
+def _set_first(firsts, field):
+    """Set field from firsts {log id: time} only where it is still NULL"""
+    if firsts:
+        EmailLog.objects.filter(id__in=list(firsts), **{f'{field}__isnull': True}).update(**{field: Case(
+            *[When(id=log_id, then=Value(when)) for log_id, when in firsts.items()],
+            output_field=DateTimeField()
+        )})
+
+
+def _count_by_campaign(rows):
+    by_campaign = {}
+    for _, campaign_id, *_ in rows:
+        if campaign_id:
+            by_campaign[campaign_id] = by_campaign.get(campaign_id, 0) + 1
+    return by_campaign
+
+
+def _claim(client, keys):
+    """
+    Rename the live buffer keys to their flushing names. A buffer left behind
+    by a crashed flush is returned first, so windows are applied in order.
+    Returns the flushing key names, or None if there is nothing to flush.
+    """
+    flushing = [key + FLUSHING_SUFFIX for key in keys]
+    if client.exists(flushing[0]):
+        return flushing
+    if not client.exists(keys[0]):
+        return None
+    pipe = client.pipeline()
+    for key, flushing_key in zip(keys, flushing):
+        pipe.rename(key, flushing_key)
+    pipe.execute()
+    return flushing
+
+
+def _flush(name, keys, read, apply):
+    client = get_redis()
+    lock = client.lock(FLUSH_LOCK_KEY.format(name), timeout=300)
+    if not lock.acquire(blocking=False):
+        return 0
+
+    try:
+        flushing = _claim(client, keys)
+        if not flushing:
+            return 0
+        items = read(client, *flushing)
+        apply(items)
+        client.delete(*flushing)
+        return len(items)
+    finally:
+        lock.release()
+
+
+def record_open(email_log_id, opened_at):
+    """Buffer one open of email_log_id"""
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hincrby(OPEN_COUNTS_KEY, email_log_id, 1)
+        pipe.hsetnx(OPEN_FIRST_KEY, email_log_id, opened_at.timestamp())
+        pipe.execute()
+    except redis.RedisError:
+        apply_opens({email_log_id: (1, opened_at)})
+
+
+def apply_opens(opens):
+    """
+    Apply buffered opens to EmailLog. opens maps log id to
+    (open count, first open time) for that buffer window.
+    """
+    _increment_by_count({log_id: count for log_id, (count, _) in opens.items()}, 'open_count')
+
+    # opened_at is only set where still empty, so the earliest open wins
+    for chunk in _chunks(list(opens)):
+        first_opens = list(EmailLog.objects.filter(
+            id__in=chunk,
+            opened_at__isnull=True
+        ).values_list('id', 'campaign_id', 'contact_id'))
+        _set_first({log_id: opens[log_id][1] for log_id, _, _ in first_opens}, 'opened_at')
+        for campaign_id, opened in _count_by_campaign(first_opens).items():
+            increment_campaign_counters(campaign_id, opened=opened)
+        schedule_membership_update({contact_id for _, _, contact_id in first_opens}, engagement_only=True)
+
+
+def _read_opens(client, counts_key, first_key):
+    counts = client.hgetall(counts_key)
+    firsts = client.hgetall(first_key)
+    return {
+        int(log_id): (int(count), _to_datetime(firsts[log_id]))
+        for log_id, count in counts.items()
+        if log_id in firsts
+    }
+
+
+def flush_open_buffer():
+    """Apply buffered opens to the database. Returns the number of logs updated."""
+    return _flush('opens', [OPEN_COUNTS_KEY, OPEN_FIRST_KEY], _read_opens, apply_opens)
+
+
+def record_click(email_log_id, url, clicked_at):
+    """
+    Buffer one click of url in email_log_id. Nothing is written, not even
+    the EmailLink, for a log that does not exist; returns whether the click
+    was recorded.
+    """
+    if not EmailLog.objects.filter(id=email_log_id).exists():
+        return False
+    link_id = get_link_id(url)
+    try:
+        get_redis().rpush(CLICK_EVENTS_KEY, f'{email_log_id}:{link_id}:{clicked_at.timestamp()}')
+    except redis.RedisError:
+        apply_clicks([(email_log_id, link_id, clicked_at)])
+    return True
+
+
+def apply_clicks(events):
+    """
+    Insert click events [(log id, link id, time)] and update the logs'
+    click_count / clicked_at and their campaigns' clicked_count
+    """
+    log_ids = list({log_id for log_id, _, _ in events})
+    logs = {}
+    for chunk in _chunks(log_ids):
+        logs.update(
+            (log_id, (campaign_id, clicked_at, contact_id))
+            for log_id, campaign_id, clicked_at, contact_id in EmailLog.objects.filter(id__in=chunk)
+            .values_list('id', 'campaign_id', 'clicked_at', 'contact_id')
+        )
+
+    # Events for logs that no longer exist are dropped
+    events = [event for event in events if event[0] in logs]
+    EmailClick.objects.bulk_create([
+        EmailClick(
+            email_log_id=log_id,
+            campaign_id=logs[log_id][0],
+            link_id=link_id,
+            clicked_at=clicked_at,
+        )
+        for log_id, link_id, clicked_at in events
+    ], batch_size=UPDATE_CHUNK_SIZE)
+
+    counts = {}
+    firsts = {}
+    for log_id, _, clicked_at in events:
+        counts[log_id] = counts.get(log_id, 0) + 1
+        if logs[log_id][1] is None and (log_id not in firsts or clicked_at < firsts[log_id]):
+            firsts[log_id] = clicked_at
+    _increment_by_count(counts, 'click_count')
+
+    for chunk in _chunks(list(firsts)):
+        _set_first({log_id: firsts[log_id] for log_id in chunk}, 'clicked_at')
+    first_clicks = [(log_id, logs[log_id][0]) for log_id in firsts]
+    for campaign_id, clicked in _count_by_campaign(first_clicks).items():
+        increment_campaign_counters(campaign_id, clicked=clicked)
+    schedule_membership_update({logs[log_id][2] for log_id in firsts}, engagement_only=True)
+
+
+def _read_clicks(client, events_key):
+    events = []
+    for raw in client.lrange(events_key, 0, -1):
+        log_id, link_id, timestamp = raw.decode().split(':')
+        events.append((int(log_id), int(link_id), _to_datetime(timestamp)))
+    return events
+
+
+def flush_click_buffer():
+    """Insert buffered click events. Returns the number of events applied."""
+    return _flush('clicks', [CLICK_EVENTS_KEY], _read_clicks, apply_clicks)
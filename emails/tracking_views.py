@@ -4,9 +4,8 @@ from django.utils import timezone
 from django.shortcuts import redirect
 from PIL import Image
 from io import BytesIO
-import json
 
-from .models import EmailLog
+from .tracking_buffer import record_click, record_open
 
 
 def get_transparent_pixel():
@@ -18,68 +17,33 @@ def get_transparent_pixel():
     return img_io.getvalue()
 
 
+# Built once at import; every pixel hit serves the same bytes
+TRANSPARENT_PIXEL = get_transparent_pixel()
+
+
 @require_http_methods(["GET"])
 def track_email_open(request, log_id):
     """
-    Track email open via 1x1 pixel
+    Track email open via 1x1 pixel. The open is buffered and applied to
+    EmailLog in batches by emails.tasks.flush_tracking_buffers.
     """
-    try:
-        email_log = EmailLog.objects.get(id=log_id)
-        
-        # Only count first open or count each open
-        if email_log.opened_at is None:
-            email_log.opened_at = timezone.now()
-        
-        email_log.open_count += 1
-        email_log.save()
-        
-        # Return 1x1 transparent GIF
-        response = HttpResponse(get_transparent_pixel(), content_type='image/gif')
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response['Pragma'] = 'no-cache'
-        response['Expires'] = '0'
-        return response
-        
-    except EmailLog.DoesNotExist:
-        # Return 1x1 transparent GIF even if log doesn't exist
-        response = HttpResponse(get_transparent_pixel(), content_type='image/gif')
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        return response
+    record_open(log_id, timezone.now())
+    
+    # Return 1x1 transparent GIF
+    response = HttpResponse(TRANSPARENT_PIXEL, content_type='image/gif')
+    response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    response['Pragma'] = 'no-cache'
+    response['Expires'] = '0'
+    return response
 
 
 @require_http_methods(["GET"])
 def track_email_click(request, log_id):
     """
-    Track email link click and redirect to original URL
+    Track email link click and redirect to original URL. The click is
+    buffered and inserted into EmailClick by emails.tasks.flush_tracking_buffers;
+    for an unknown log id nothing is recorded and the visitor is just redirected.
     """
-    try:
-        email_log = EmailLog.objects.get(id=log_id)
-        
-        original_url = request.GET.get('url', '/')
-        
-        # Track click
-        if email_log.clicked_at is None:
-            email_log.clicked_at = timezone.now()
-        
-        email_log.click_count += 1
-        
-        # Store clicked links
-        clicked_links = []
-        if email_log.clicked_links:
-            try:
-                clicked_links = json.loads(email_log.clicked_links)
-            except json.JSONDecodeError:
-                clicked_links = []
-        
-        clicked_links.append({
-            'url': original_url,
-            'clicked_at': timezone.now().isoformat()
-        })
-        
-        email_log.clicked_links = json.dumps(clicked_links)
-        email_log.save()
-        
-        return redirect(original_url)
-        
-    except EmailLog.DoesNotExist:
-        return redirect(request.GET.get('url', '/'))
+    original_url = request.GET.get('url', '/')
+    record_click(log_id, original_url, timezone.now())
+    return redirect(original_url)
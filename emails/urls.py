@@ -18,7 +18,11 @@ urlpatterns = [
     path('campaigns/<int:pk>/edit/', views.CampaignUpdateView.as_view(), name='campaign_update'),
     path('campaigns/<int:pk>/delete/', views.CampaignDeleteView.as_view(), name='campaign_delete'),
     path('campaigns/<int:pk>/send/', views.CampaignSendView.as_view(), name='campaign_send'),
+    path('campaigns/<int:pk>/pause/', views.CampaignPauseView.as_view(), name='campaign_pause'),
+    path('campaigns/<int:pk>/resume/', views.CampaignResumeView.as_view(), name='campaign_resume'),
     
     # Email Logs
     path('logs/', views.EmailLogListView.as_view(), name='log_list'),
+    path('logs/export/', views.EmailLogExportView.as_view(), name='log_export'),
+    path('logs/<int:pk>/html/', views.EmailLogHtmlView.as_view(), name='log_html'),
 ]
@@ -2,12 +2,17 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
-from django.http import JsonResponse
-from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
 
 from .models import EmailTemplate, Campaign, EmailLog
-from .tasks import process_campaign, send_email_task
-from contacts.models import Contact
+from .campaign_stats import complete_campaign_if_done
+from .tasks import dispatch_campaign_sends_task, process_campaign, send_email_task
+from contacts.models import Contact, Segment
+from search.index import matching_ids
+from crm_project.exports import ExportMixin
 
 
 class EmailTemplateListView(LoginRequiredMixin, ListView):
@@ -22,10 +27,7 @@ class EmailTemplateListView(LoginRequiredMixin, ListView):
         queryset = EmailTemplate.objects.select_related('created_by')
         
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(subject__icontains=search)
-            )
+            queryset = queryset.filter(id__in=matching_ids('template', search))
         
         return queryset.order_by('-created_at')
 
@@ -94,10 +96,7 @@ class CampaignListView(LoginRequiredMixin, ListView):
         queryset = Campaign.objects.select_related('template', 'created_by')
         
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(description__icontains=search)
-            )
+            queryset = queryset.filter(id__in=matching_ids('campaign', search))
         
         if status:
             queryset = queryset.filter(status=status)
@@ -123,6 +122,11 @@ class CampaignDetailView(LoginRequiredMixin, DetailView):
         context['sent_logs'] = campaign.logs.filter(status__in=['sent', 'delivered'])
         context['opened_logs'] = campaign.logs.filter(opened_at__isnull=False)
         context['clicked_logs'] = campaign.logs.filter(clicked_at__isnull=False)
+        # Per-link clicks straight off the (campaign, link) index
+        context['link_stats'] = campaign.clicks.values('link__url').annotate(
+            clicks=Count('id'),
+            unique_clicks=Count('email_log', distinct=True)
+        ).order_by('-clicks')[:20]
         return context
 
 
@@ -130,7 +134,7 @@ class CampaignCreateView(LoginRequiredMixin, CreateView):
     """Create a new campaign"""
     model = Campaign
     template_name = 'emails/campaign_form.html'
-    fields = ['name', 'description', 'template', 'segment_filter', 'status', 'scheduled_at']
+    fields = ['name', 'description', 'template', 'segment', 'segment_filter', 'status', 'scheduled_at']
     success_url = reverse_lazy('emails:campaign_list')
 
     def form_valid(self, form):
@@ -140,6 +144,7 @@ class CampaignCreateView(LoginRequiredMixin, CreateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['templates'] = EmailTemplate.objects.all()
+        context['segments'] = Segment.objects.all()
         context['statuses'] = Campaign.STATUS_CHOICES
         return context
 
@@ -148,12 +153,13 @@ class CampaignUpdateView(LoginRequiredMixin, UpdateView):
     """Update campaign"""
     model = Campaign
     template_name = 'emails/campaign_form.html'
-    fields = ['name', 'description', 'template', 'segment_filter', 'status', 'scheduled_at']
+    fields = ['name', 'description', 'template', 'segment', 'segment_filter', 'status', 'scheduled_at']
     success_url = reverse_lazy('emails:campaign_list')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['templates'] = EmailTemplate.objects.all()
+        context['segments'] = Segment.objects.all()
         context['statuses'] = Campaign.STATUS_CHOICES
         return context
 
@@ -179,11 +185,21 @@ class CampaignSendView(LoginRequiredMixin, UpdateView):
                 'message': 'Campaign cannot be sent from current status'
             })
         
-        # Queue the campaign for sending
-        process_campaign.delay(campaign.id)
+        # Mark it scheduled before the worker can move it to 'sending', and
+        # only if nothing else has moved it on since it was loaded
+        with transaction.atomic():
+            queued = Campaign.objects.filter(
+                id=campaign.id,
+                status__in=['draft', 'scheduled']
+            ).update(status='scheduled', updated_at=timezone.now())
+            if queued:
+                transaction.on_commit(lambda: process_campaign.delay(campaign.id))
         
-        campaign.status = 'scheduled'
-        campaign.save()
+        if not queued:
+            return JsonResponse({
+                'success': False,
+                'message': 'Campaign cannot be sent from current status'
+            })
         
         return JsonResponse({
             'success': True,
@@ -191,6 +207,69 @@ class CampaignSendView(LoginRequiredMixin, UpdateView):
         })
 
 
+class CampaignPauseView(LoginRequiredMixin, UpdateView):
+    """Pause a sending campaign"""
+    model = Campaign
+    fields = ['status']
+
+    def post(self, request, *args, **kwargs):
+        campaign = self.get_object()
+        
+        # Conditional update so a concurrent completion is not overwritten
+        paused = Campaign.objects.filter(id=campaign.id, status='sending').update(status='paused')
+        if not paused:
+            return JsonResponse({
+                'success': False,
+                'message': 'Only a sending campaign can be paused'
+            })
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Campaign paused'
+        })
+
+
+class CampaignResumeView(LoginRequiredMixin, UpdateView):
+    """Resume a paused campaign"""
+    model = Campaign
+    fields = ['status']
+
+    def post(self, request, *args, **kwargs):
+        campaign = self.get_object()
+        
+        resumed = Campaign.objects.filter(id=campaign.id, status='paused').update(status='sending')
+        if not resumed:
+            return JsonResponse({
+                'success': False,
+                'message': 'Only a paused campaign can be resumed'
+            })
+        
+        # Everything may have been sent before the pause took effect
+        if not complete_campaign_if_done(campaign.id):
+            dispatch_campaign_sends_task.delay()
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Campaign resumed'
+        })
+
+
+class EmailLogHtmlView(LoginRequiredMixin, DetailView):
+    """Show the HTML of a sent email, rebuilt from its shared body"""
+    model = EmailLog
+
+    def get_queryset(self):
+        return EmailLog.objects.select_related('body')
+
+    def render_to_response(self, context, **response_kwargs):
+        response = HttpResponse(self.object.get_rendered_html())
+        # Merge values are not escaped; the sandbox gives the page an opaque
+        # origin with scripts, forms and plugins disabled
+        response['Content-Security-Policy'] = 'sandbox'
+        response['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+
 class EmailLogListView(LoginRequiredMixin, ListView):
     """List email logs"""
     model = EmailLog
@@ -205,11 +284,7 @@ class EmailLogListView(LoginRequiredMixin, ListView):
         queryset = EmailLog.objects.select_related('contact', 'campaign', 'template')
         
         if search:
-            queryset = queryset.filter(
-                Q(contact__email__icontains=search) |
-                Q(contact__first_name__icontains=search) |
-                Q(contact__last_name__icontains=search)
-            )
+            queryset = queryset.filter(contact_id__in=matching_ids('contact', search))
         
         if status:
             queryset = queryset.filter(status=status)
@@ -220,3 +295,23 @@ class EmailLogListView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         context['statuses'] = EmailLog.STATUS_CHOICES
         return context
+
+
+class EmailLogExportView(ExportMixin, EmailLogListView):
+    """Stream the filtered email log list as CSV or JSON Lines"""
+    export_name = 'email_logs'
+    export_columns = [
+        ('id', 'id'),
+        ('contact_email', 'contact__email'),
+        ('campaign', 'campaign__name'),
+        ('template', 'template__name'),
+        ('status', 'status'),
+        ('subject', 'rendered_subject'),
+        ('sent_at', 'sent_at'),
+        ('opened_at', 'opened_at'),
+        ('open_count', 'open_count'),
+        ('clicked_at', 'clicked_at'),
+        ('click_count', 'click_count'),
+        ('error_message', 'error_message'),
+        ('created_at', 'created_at'),
+    ]
@@ -0,0 +1,55 @@
+"""
+What the global search index holds for each entity type.
+
+A SearchType names the model, the label shown on results, the detail view
+and a document function returning (title, subtitle, content) for one
+instance. Titles are weighted above content when ranking.
+"""
+from collections import namedtuple
+
+from automations.models import Workflow
+from contacts.models import Company, Contact
+from deals.models import Deal
+from emails.models import Campaign, EmailTemplate
+
+SearchType = namedtuple('SearchType', ['model', 'label', 'url_name', 'document', 'related'])
+
+
+def _join(*values):
+    return ' '.join(str(value) for value in values if value)
+
+
+def contact_document(contact):
+    domain = contact.email.rsplit('@', 1)[-1]
+    return contact.full_name, contact.email, _join(contact.email, domain, contact.phone, contact.notes)
+
+
+def company_document(company):
+    return company.name, company.domain or '', _join(company.domain, company.industry)
+
+
+def deal_document(deal):
+    # The contact's name is included so deals are found by who they are with
+    return deal.title, f'{deal.value} {deal.currency}', _join(deal.contact.full_name, deal.description)
+
+
+def template_document(template):
+    return template.name, template.subject, _join(template.subject, template.from_name)
+
+
+def campaign_document(campaign):
+    return campaign.name, '', campaign.description
+
+
+def workflow_document(workflow):
+    return workflow.name, workflow.get_trigger_event_display(), workflow.description
+
+
+SEARCH_TYPES = {
+    'contact': SearchType(Contact, 'Contact', 'contacts:contact_detail', contact_document, []),
+    'company': SearchType(Company, 'Company', 'contacts:company_detail', company_document, []),
+    'deal': SearchType(Deal, 'Deal', 'deals:deal_detail', deal_document, ['contact']),
+    'template': SearchType(EmailTemplate, 'Email Template', 'emails:template_detail', template_document, []),
+    'campaign': SearchType(Campaign, 'Campaign', 'emails:campaign_detail', campaign_document, []),
+    'workflow': SearchType(Workflow, 'Workflow', 'automations:workflow_detail', workflow_document, []),
+}
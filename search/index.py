@@ -0,0 +1,167 @@
+"""
+Global full-text search over SearchEntry.
+
+Every word of a query is matched as a prefix, so "jan smi" finds Jane
+Smith, and results are ranked by the database:
+
+  PostgreSQL  ts_rank_cd over the weighted, GIN-indexed tsvector, plus
+              trigram similarity on the title so near misses on names
+              still match
+  SQLite      FTS5 bm25 with the title weighted over the content
+
+Entries are written as objects are saved and deleted (search.signals),
+filled after migrate for entity types that have none, and rebuilt in bulk
+by the rebuild_search_index command.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+
+from .documents import SEARCH_TYPES
+from .models import SearchEntry
+
+WORD_RE = re.compile(r'\w+')
+MAX_WORDS = 8
+
+
+def query_words(query):
+    return WORD_RE.findall(query.lower())[:MAX_WORDS]
+
+
+def _tsquery(words):
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def _fts5_match(words):
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def index_objects(entity_type, instances):
+    """Add or update the search entries for instances of one entity type"""
+    search_type = SEARCH_TYPES[entity_type]
+    entries = []
+    for instance in instances:
+        title, subtitle, content = search_type.document(instance)
+        entries.append(SearchEntry(
+            entity_type=entity_type,
+            object_id=instance.pk,
+            title=title[:255],
+            subtitle=subtitle[:255],
+            content=content,
+        ))
+    SearchEntry.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=['entity_type', 'object_id'],
+        update_fields=['title', 'subtitle', 'content', 'updated_at'],
+    )
+
+
+def remove_objects(entity_type, object_ids):
+    SearchEntry.objects.filter(entity_type=entity_type, object_id__in=object_ids).delete()
+
+
+def reindex(entity_type, queryset=None):
+    """Re-index a queryset (default: every object) of one entity type in id-ordered chunks"""
+    search_type = SEARCH_TYPES[entity_type]
+    if queryset is None:
+        queryset = search_type.model.objects.all()
+    queryset = queryset.select_related(*search_type.related).order_by('pk')
+    chunk_size = settings.SEARCH_CHUNK_SIZE
+
+    indexed = 0
+    cursor = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=cursor)[:chunk_size])
+        if not chunk:
+            break
+        index_objects(entity_type, chunk)
+        indexed += len(chunk)
+        cursor = chunk[-1].pk
+    return indexed
+
+
+def matching_ids(entity_type, query):
+    """
+    Subquery of the ids of entity_type objects matching query, for
+    narrowing a list view: queryset.filter(id__in=matching_ids(...)).
+    Unlike the icontains filters list views used before, words match at
+    their start only: "smi" finds Smith but "mith" does not.
+    """
+    words = query_words(query)
+    entries = SearchEntry.objects.filter(entity_type=entity_type)
+    if not words:
+        return entries.none().values('object_id')
+
+    # Columns are left unqualified: this runs as an aliased subquery
+    if connection.vendor == 'postgresql':
+        condition = RawSQL("document @@ to_tsquery('simple', %s)", [_tsquery(words)], output_field=BooleanField())
+    else:
+        condition = RawSQL(
+            'id IN (SELECT rowid FROM search_searchentry_fts WHERE search_searchentry_fts MATCH %s)',
+            [_fts5_match(words)],
+            output_field=BooleanField()
+        )
+    return entries.filter(condition).values('object_id')
+
+
+def _search_postgres(words, types, limit):
+    text = ' '.join(words)
+    placeholders = ', '.join(['%s'] * len(types))
+    sql = f"""
+        SELECT entity_type, object_id, title, subtitle,
+               ts_rank_cd(document, query) + similarity(title, %s) AS score
+        FROM search_searchentry, to_tsquery('simple', %s) query
+        WHERE (document @@ query OR title %% %s) AND entity_type IN ({placeholders})
+        ORDER BY score DESC
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [text, _tsquery(words), text, *types, limit])
+        return cursor.fetchall()
+
+
+def _search_sqlite(words, types, limit):
+    placeholders = ', '.join(['%s'] * len(types))
+    sql = f"""
+        SELECT entry.entity_type, entry.object_id, entry.title, entry.subtitle,
+               -bm25(search_searchentry_fts, 10.0, 1.0) AS score
+        FROM search_searchentry_fts
+        JOIN search_searchentry entry ON entry.id = search_searchentry_fts.rowid
+        WHERE search_searchentry_fts MATCH %s AND entry.entity_type IN ({placeholders})
+        ORDER BY score DESC
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_fts5_match(words), *types, limit])
+        return cursor.fetchall()
+
+
+def search(query, types=None, limit=20):
+    """Best matches for query across entity types, highest ranked first"""
+    words = query_words(query)
+    types = [entity_type for entity_type in (types or SEARCH_TYPES) if entity_type in SEARCH_TYPES]
+    if not words or not types:
+        return []
+
+    if connection.vendor == 'postgresql':
+        rows = _search_postgres(words, types, limit)
+    else:
+        rows = _search_sqlite(words, types, limit)
+
+    return [
+        {
+            'type': entity_type,
+            'label': SEARCH_TYPES[entity_type].label,
+            'id': object_id,
+            'title': title,
+            'subtitle': subtitle,
+            'url': reverse(SEARCH_TYPES[entity_type].url_name, kwargs={'pk': object_id}),
+            'score': round(score, 4),
+        }
+        for entity_type, object_id, title, subtitle, score in rows
+    ]
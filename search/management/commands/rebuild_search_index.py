@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from search.documents import SEARCH_TYPES
+from search.index import reindex
+from search.models import SearchEntry
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the global search index from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', action='append', dest='types', choices=list(SEARCH_TYPES),
+                            help='Entity type to rebuild (repeatable; default all)')
+
+    def handle(self, *args, **options):
+        types = options['types'] or list(SEARCH_TYPES)
+        for entity_type in types:
+            start = time.perf_counter()
+            model = SEARCH_TYPES[entity_type].model
+            # Drop entries whose objects no longer exist, then upsert the rest
+            stale = SearchEntry.objects.filter(entity_type=entity_type).exclude(
+                object_id__in=model.objects.values('pk')
+            ).delete()[0]
+            indexed = reindex(entity_type)
+            self.stdout.write(self.style.SUCCESS(
+                f'{entity_type}: indexed {indexed}, removed {stale} stale in {time.perf_counter() - start:.1f}s'
+            ))
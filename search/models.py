@@ -0,0 +1,24 @@
+from django.db import models
+
+
+class SearchEntry(models.Model):
+    """
+    One searchable object (contact, company, deal, ...) in the global search
+    index. title and content are indexed by the database's full-text engine,
+    set up in the initial migration: a generated, GIN-indexed tsvector plus
+    a trigram index on title on PostgreSQL, an FTS5 table kept in step by
+    triggers on SQLite. See search/index.py.
+    """
+    entity_type = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    title = models.CharField(max_length=255)
+    subtitle = models.CharField(max_length=255, blank=True)
+    content = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Search entries"
+        unique_together = ('entity_type', 'object_id')
+
+    def __str__(self):
+        return f"{self.entity_type} {self.object_id}: {self.title}"
@@ -0,0 +1,53 @@
+"""
+Keep the search index current as indexed objects are saved and deleted,
+and fill it after migrate for entity types that have none yet
+"""
+import sys
+
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+
+from contacts.models import Contact
+from .documents import SEARCH_TYPES
+from .index import index_objects, reindex, remove_objects
+from .models import SearchEntry
+
+ENTITY_TYPES = {search_type.model: entity_type for entity_type, search_type in SEARCH_TYPES.items()}
+
+
+def object_saved(sender, instance, **kwargs):
+    index_objects(ENTITY_TYPES[sender], [instance])
+    if sender is Contact:
+        # Deals are indexed with their contact's name
+        reindex('deal', instance.deals.all())
+
+
+def object_deleted(sender, instance, **kwargs):
+    remove_objects(ENTITY_TYPES[sender], [instance.pk])
+
+
+def index_missing_types(sender, using, verbosity=1, plan=None, stdout=None, **kwargs):
+    """
+    post_migrate: index every entity type that has objects but no search
+    entries, so a database that predates the index (or a newly indexed
+    type) is searchable without running rebuild_search_index by hand
+    """
+    if using != 'default' or any(backwards for _, backwards in plan or []):
+        return
+    tables = connections[using].introspection.table_names()
+    if SearchEntry._meta.db_table not in tables:
+        return
+
+    for entity_type, search_type in SEARCH_TYPES.items():
+        model = search_type.model
+        if model._meta.db_table not in tables or SearchEntry.objects.filter(entity_type=entity_type).exists():
+            continue
+        if model.objects.exists():
+            indexed = reindex(entity_type)
+            if verbosity:
+                (stdout or sys.stdout).write(f'  Indexed {indexed} {entity_type} objects for search\n')
+
+
+for model in ENTITY_TYPES:
+    post_save.connect(object_saved, sender=model, dispatch_uid=f'search_index_{model.__name__}')
+    post_delete.connect(object_deleted, sender=model, dispatch_uid=f'search_remove_{model.__name__}')
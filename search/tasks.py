@@ -0,0 +1,25 @@
+from celery import shared_task
+from django.db import transaction
+
+from .documents import SEARCH_TYPES
+from .index import reindex
+
+
+def schedule_indexing(entity_type, object_ids):
+    """
+    Queue indexing of objects written in bulk (bulk_create skips the
+    post_save handlers) once the current transaction commits
+    """
+    object_ids = list(object_ids)
+    if object_ids:
+        transaction.on_commit(lambda: index_objects_task.delay(entity_type, object_ids))
+
+
+@shared_task
+def index_objects_task(entity_type, object_ids):
+    """
+    Add or update search entries for objects written in bulk
+    """
+    model = SEARCH_TYPES[entity_type].model
+    indexed = reindex(entity_type, model.objects.filter(pk__in=object_ids))
+    return f"Indexed {indexed} {entity_type} objects"
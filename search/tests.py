@@ -0,0 +1,28 @@
+from django.test import TestCase
+
+from contacts.models import Company, Contact
+from .index import matching_ids
+from .models import SearchEntry
+from .signals import index_missing_types
+
+
+class SearchIndexTests(TestCase):
+
+    def setUp(self):
+        Contact.objects.create(first_name='Jane', last_name='Smith', email='jane@acme.com')
+        Company.objects.create(name='Acme', domain='acme.com')
+
+    def search(self, query):
+        return list(Contact.objects.filter(id__in=matching_ids('contact', query)).values_list('last_name', flat=True))
+
+    def test_words_match_at_their_start(self):
+        self.assertEqual(self.search('jan smi'), ['Smith'])
+        self.assertEqual(self.search('mith'), [])
+
+    def test_migrate_indexes_types_without_entries(self):
+        SearchEntry.objects.filter(entity_type='contact').delete()
+        self.assertEqual(self.search('smith'), [])
+
+        index_missing_types(sender=None, using='default', verbosity=0)
+        self.assertEqual(self.search('smith'), ['Smith'])
+        self.assertEqual(SearchEntry.objects.filter(entity_type='company').count(), 1)
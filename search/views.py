@@ -0,0 +1,34 @@
+from django.shortcuts import render
+from django.views.generic import View
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import JsonResponse
+
+from .documents import SEARCH_TYPES
+from .index import search
+
+
+class SearchView(LoginRequiredMixin, View):
+    """
+    Global search across contacts, companies, deals, templates, campaigns
+    and workflows. Returns JSON for AJAX requests or ?format=json.
+    """
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '').strip()
+        types = request.GET.getlist('type')
+        try:
+            limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+        except ValueError:
+            limit = 20
+        
+        results = search(query, types, limit)
+        
+        if request.GET.get('format') == 'json' or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'query': query, 'results': results})
+        
+        return render(request, 'search/results.html', {
+            'query': query,
+            'results': results,
+            'search_types': [(entity_type, search_type.label) for entity_type, search_type in SEARCH_TYPES.items()],
+            'selected_types': types,
+        })